@@ -0,0 +1,77 @@
+"""bank_subscriptions.extra_data в jsonb с GIN-индексом, индексы истории платежей
+
+Новые таблицы создаёт create_all при старте, а изменения существующих таблиц
+идут миграциями. На новой базе create_all уже создал всё нужное, поэтому
+каждый шаг сначала проверяет текущую схему.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table_name: str) -> dict:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table_name):
+        return {}
+    return {column["name"]: column for column in inspector.get_columns(table_name)}
+
+
+def upgrade() -> None:
+    extra_data = _columns("bank_subscriptions").get("extra_data")
+    if (
+        op.get_bind().dialect.name == "postgresql"
+        and extra_data is not None
+        and not isinstance(extra_data["type"], postgresql.JSONB)
+    ):
+        op.alter_column(
+            "bank_subscriptions",
+            "extra_data",
+            type_=postgresql.JSONB(),
+            postgresql_using="extra_data::jsonb"
+        )
+
+    op.create_index(
+        "ix_bank_subscriptions_extra_data",
+        "bank_subscriptions",
+        ["extra_data"],
+        postgresql_using="gin",
+        if_not_exists=True
+    )
+    op.create_index(
+        "ix_payments_user_created",
+        "payments",
+        ["user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        if_not_exists=True
+    )
+    op.create_index(
+        "ix_payments_to_user_created",
+        "payments",
+        ["to_user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_payments_to_user_created", table_name="payments", if_exists=True)
+    op.drop_index("ix_payments_user_created", table_name="payments", if_exists=True)
+    op.drop_index("ix_bank_subscriptions_extra_data", table_name="bank_subscriptions", if_exists=True)
+    op.alter_column(
+        "bank_subscriptions",
+        "extra_data",
+        type_=sa.Text(),
+        postgresql_using="extra_data::text"
+    )
@@ -0,0 +1,31 @@
+"""transaction_sync_state: продолжение догрузки после лимита страниц
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 13:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("transaction_sync_state")}
+    if "resume_page" not in columns:
+        op.add_column("transaction_sync_state", sa.Column("resume_page", sa.Integer(), nullable=True))
+    if "resume_watermark" not in columns:
+        op.add_column("transaction_sync_state", sa.Column("resume_watermark", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("transaction_sync_state", "resume_watermark")
+    op.drop_column("transaction_sync_state", "resume_page")
@@ -0,0 +1,42 @@
+"""cashback_data: один итог на (user_id, month)
+
+Пересчёты писали итоги чтением и вставкой без уникального ключа, поэтому
+одновременный фоновый пересчёт и запрос могли оставить дубли месяца.
+Перед созданием ограничения остаётся самая свежая строка.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    constraints = {
+        constraint["name"]
+        for constraint in sa.inspect(op.get_bind()).get_unique_constraints("cashback_data")
+    }
+    if "uq_cashback_data_user_month" in constraints:
+        return
+
+    op.execute(
+        "DELETE FROM cashback_data WHERE id NOT IN ("
+        "SELECT MAX(id) FROM cashback_data GROUP BY user_id, month"
+        ")"
+    )
+    op.create_unique_constraint("uq_cashback_data_user_month", "cashback_data", ["user_id", "month"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_cashback_data_user_month", "cashback_data", type_="unique")
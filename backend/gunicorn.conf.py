@@ -0,0 +1,47 @@
+"""
+Конфигурация продакшен-сервера: gunicorn-мастер и N воркеров uvicorn.
+Запуск: gunicorn -c gunicorn.conf.py main:app
+
+Воркеры не делят состояние в памяти: сессии, кеши, локи и лидер фоновой синхронизации
+живут в Redis, а in-process кеши (SingleFlight, категоризаторы) - лишь оптимизация.
+Приложение импортируется в каждом воркере заново (preload_app = False), поэтому пулы
+соединений БД, Redis и HTTP создаются после fork. Плавный перезапуск с новым кодом -
+kill -HUP <pid мастера>: мастер поднимает новые воркеры, старые дорабатывают
+текущие запросы за graceful_timeout, слушающий сокет остаётся открытым.
+"""
+import multiprocessing
+import os
+
+# До импорта настроек: воркеры наследуют их от мастера и таблицы не создают
+os.environ["CREATE_TABLES_ON_STARTUP"] = "False"
+
+from src.config import settings
+
+bind = settings.WEB_BIND
+workers = settings.WEB_WORKERS or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# UvicornWorker берёт keep-alive и backlog из этих настроек
+keepalive = settings.WEB_KEEPALIVE
+backlog = settings.WEB_BACKLOG
+timeout = settings.WEB_TIMEOUT
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+
+preload_app = False
+accesslog = "-"
+errorlog = "-"
+
+def on_starting(server):
+    # Таблицы создаются и миграции применяются один раз в мастере, а не гонкой в каждом воркере
+    from alembic import command
+    from alembic.config import Config
+    from src.database import create_tables, engine
+
+    create_tables()
+    engine.dispose()
+
+    # create_all создаёт только новые таблицы; изменения существующих - миграции alembic
+    alembic_cfg = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    alembic_cfg.attributes["configure_logger"] = False
+    command.upgrade(alembic_cfg, "head")
+    server.log.info(f"✅ Таблицы проверены, миграции применены, воркеров: {workers}")
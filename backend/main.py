@@ -4,8 +4,11 @@ from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 from src.config import settings
-from src.database import create_tables
-from src.redis_client import redis_client
+from src.database import async_engine, create_tables
+from src.redis_client import close_async_redis, get_async_redis, init_async_redis, redis_client
+from src.http_client import bank_http_pool
+from src.services.circuit_breaker import BankCircuitBreaker
+from src.services.sync_scheduler import SyncScheduler
 
 from src.routers import auth, accounts, groups, analytics, loyalty_cards, payments, premium, savings, family_budget, verification, referrals, cashback, subscriptions, partners, mock_bank
 
@@ -15,20 +18,33 @@ async def lifespan(app: FastAPI):
     print(f"📊 Database: {settings.DATABASE_HOST}:{settings.DATABASE_PORT}")
     print(f"💾 Redis: {settings.REDIS_HOST}:{settings.REDIS_PORT}")
 
-    create_tables()
+    if settings.CREATE_TABLES_ON_STARTUP:
+        create_tables()
 
     try:
         redis_client.ping()
+        await init_async_redis().ping()
         print("✅ Redis connection successful")
     except Exception as e:
         print(f"❌ Redis connection failed: {e}")
 
+    await bank_http_pool.startup()
+
+    sync_scheduler = SyncScheduler(redis_client, init_async_redis())
+    if settings.SYNC_SCHEDULER_ENABLED:
+        sync_scheduler.start()
+
     print("✨ Application started successfully!")
 
     yield
 
     print("👋 Shutting down Bank Aggregator API...")
 
+    await sync_scheduler.stop()
+    await bank_http_pool.shutdown()
+    await async_engine.dispose()
+    await close_async_redis()
+
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
@@ -105,8 +121,10 @@ async def health_check():
 @app.get("/health", tags=["Health"])
 async def health():
     redis_status = "healthy"
+    banks_status = {}
     try:
         redis_client.ping()
+        banks_status = await BankCircuitBreaker(get_async_redis()).get_all_states()
     except:
         redis_status = "unhealthy"
 
@@ -115,16 +133,25 @@ async def health():
         "data": {
             "api": "healthy",
             "redis": redis_status,
+            "banks": banks_status,
             "version": settings.APP_VERSION
         }
     }
 
 if __name__ == "__main__":
-    import uvicorn
+    if settings.DEBUG:
+        import uvicorn
+
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            timeout_keep_alive=settings.WEB_KEEPALIVE,
+            backlog=settings.WEB_BACKLOG
+        )
+    else:
+        # Продакшен: несколько процессов под gunicorn (см. gunicorn.conf.py)
+        import os
 
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.DEBUG
-    )
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "main:app"])
@@ -0,0 +1,28 @@
+"""
+Пересчёт месячных агрегатов аналитики и кешбека по уже загруженным транзакциям и платежам.
+Запуск: python rebuild_aggregates.py [user_id ...] (без аргументов - все пользователи)
+"""
+import asyncio
+import sys
+
+from src.database import SessionLocal
+from src.models import User
+from src.redis_client import redis_client
+from src.services.cashback_service import CashbackService
+from src.services.spending_aggregate_service import SpendingAggregateService
+
+async def main():
+    db = SessionLocal()
+    try:
+        user_ids = [int(arg) for arg in sys.argv[1:]] or [user_id for (user_id,) in db.query(User.id).all()]
+        aggregates = SpendingAggregateService(db)
+        cashback = CashbackService(db, redis_client)
+        for user_id in user_ids:
+            aggregates.rebuild_user(user_id)
+            await cashback.backfill(user_id, sync=False)
+        print(f"✅ Агрегаты пересчитаны для {len(user_ids)} пользователей")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
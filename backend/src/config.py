@@ -13,14 +13,30 @@ class Settings(BaseSettings):
     DATABASE_USER: str = "postgres"
     DATABASE_PASSWORD: str = "password"
 
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    # Кеш подготовленных выражений asyncpg на соединение (0 - выключить, нужно за pgbouncer в transaction mode)
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    # Кеш скомпилированных SQLAlchemy запросов на движок
+    DB_QUERY_CACHE_SIZE: int = 1200
+
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = ""
+    REDIS_MAX_CONNECTIONS: int = 100
 
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
     ALGORITHM: str = "HS256"
     SESSION_EXPIRE_HOURS: int = 24
+    # Локальный кеш снимков пользователей сессий в каждом процессе
+    SESSION_CACHE_TTL: float = 5.0
+    SESSION_CACHE_SIZE: int = 10000
+
+    IDEMPOTENCY_KEY_TTL: int = 86400  # сколько хранится ответ для повтора запроса
+    IDEMPOTENCY_LOCK_TTL: int = 60  # метка "выполняется" на время исходного запроса
 
     ALLOWED_ORIGINS: str = "http://localhost:3000,http://localhost:5173,http://localhost:5174"
 
@@ -28,6 +44,24 @@ class Settings(BaseSettings):
     def allowed_origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
 
+    @property
+    def bank_token_lock_lease_ms(self) -> int:
+        # Лок не должен истечь раньше самого медленного запроса токена (подключение + ответ)
+        return self.BANK_TOKEN_LOCK_LEASE_MS or int((self.BANK_HTTP_CONNECT_TIMEOUT + self.BANK_HTTP_TIMEOUT + 5) * 1000)
+
+    @property
+    def bank_token_lock_wait(self) -> float:
+        return self.BANK_TOKEN_LOCK_WAIT or self.bank_token_lock_lease_ms / 1000
+
+    @property
+    def consent_lock_lease_ms(self) -> int:
+        # Под локом согласия может понадобиться и новый токен
+        return self.CONSENT_LOCK_LEASE_MS or 2 * self.bank_token_lock_lease_ms
+
+    @property
+    def consent_lock_wait(self) -> float:
+        return self.CONSENT_LOCK_WAIT or self.consent_lock_lease_ms / 1000
+
     OTP_CODE: str = "123456"
     OTP_EXPIRE_MINUTES: int = 10
     
@@ -47,8 +81,72 @@ class Settings(BaseSettings):
     SBANK_BASE_URL: str = "https://sbank.open.bankingapi.ru"
 
     BANK_TOKEN_TTL: int = 82800
+    BANK_TOKEN_REFRESH_MARGIN: int = 3600
+    BANK_TOKEN_LOCK_LEASE_MS: int = 0  # 0 - по таймаутам HTTP к банку, см. bank_token_lock_lease_ms
+    BANK_TOKEN_LOCK_WAIT: float = 0  # 0 - столько же, сколько лиз лока
     CONSENT_REQUEST_TTL: int = 14400
+    CONSENT_RENEW_MARGIN: int = 1800
+    CONSENT_LOCK_LEASE_MS: int = 0  # 0 - запрос токена + запрос согласия, см. consent_lock_lease_ms
+    CONSENT_LOCK_WAIT: float = 0  # 0 - столько же, сколько лиз лока
     BANK_DATA_CACHE_TTL: int = 14400
+    BANK_DATA_CACHE_SOFT_TTL: int = 300
+    BANK_DATA_CACHE_REFRESH_LEASE: int = 60
+    LEDGER_BALANCE_CACHE_TTL: int = 3600
+
+    BANK_HTTP_TIMEOUT: float = 30.0
+    BANK_HTTP_CONNECT_TIMEOUT: float = 10.0
+    BANK_HTTP_MAX_CONNECTIONS: int = 100
+    BANK_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    BANK_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    BANK_HTTP2_ENABLED: bool = True
+
+    BANK_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    BANK_CIRCUIT_OPEN_SECONDS: int = 30
+    BANK_CIRCUIT_PROBE_LEASE_SECONDS: int = 10
+    BANK_CIRCUIT_LATENCY_THRESHOLD: float = 10.0
+    BANK_CIRCUIT_LATENCY_WINDOW: int = 50
+    BANK_CIRCUIT_MIN_SAMPLES: int = 10
+    BANK_TIMEOUT_MIN: float = 2.0
+    BANK_TIMEOUT_P95_MULTIPLIER: float = 3.0
+    BANK_LAST_KNOWN_TTL: int = 604800
+
+    TRANSACTION_SYNC_PAGE_SIZE: int = 100
+    TRANSACTION_SYNC_MAX_PAGES: int = 20
+    TRANSACTION_SYNC_INITIAL_DAYS: int = 365
+    TRANSACTION_SYNC_OVERLAP_HOURS: int = 24
+    TRANSACTION_SYNC_MIN_INTERVAL: int = 300
+
+    SYNC_SCHEDULER_ENABLED: bool = True
+    SYNC_SCHEDULER_INTERVAL: int = 120
+    SYNC_SCHEDULER_ACTIVE_WINDOW: int = 86400
+    SYNC_SCHEDULER_MAX_USERS: int = 200
+    SYNC_SCHEDULER_CONCURRENCY: int = 8
+    SYNC_SCHEDULER_JITTER: float = 0.3
+    SYNC_BANK_RATE_LIMIT: int = 10
+
+    GROUP_AGGREGATE_TTL: int = 300
+
+    CASHBACK_ROLLUP_MONTHS: int = 12
+    CASHBACK_ROLLUP_MAX_AGE: int = 3600
+    CASHBACK_ROLLUP_LOCK_LEASE_MS: int = 120000
+
+    CATEGORIZER_CACHE_SIZE: int = 100000
+    CATEGORIZER_USER_CACHE_SIZE: int = 10000
+    CATEGORIZER_MAX_USERS: int = 1000
+
+    # Продакшен-режим (gunicorn + uvicorn workers, см. gunicorn.conf.py)
+    WEB_BIND: str = "0.0.0.0:8000"
+    WEB_WORKERS: int = 0  # 0 - по числу CPU; пулы БД и Redis создаются в каждом воркере
+    WEB_KEEPALIVE: int = 5
+    WEB_BACKLOG: int = 2048
+    WEB_TIMEOUT: int = 60
+    WEB_GRACEFUL_TIMEOUT: int = 30
+    # Создавать таблицы и индексы при старте приложения. gunicorn.conf.py выключает:
+    # DDL выполняет мастер один раз, а не каждый воркер одновременно
+    CREATE_TABLES_ON_STARTUP: bool = True
+
+    BANK_FANOUT_PER_BANK_CONCURRENCY: int = 4
+    BANK_FANOUT_DEADLINE: float = 15.0
 
     class Config:
         env_file = ".env"
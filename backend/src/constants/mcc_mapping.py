@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, List, Tuple
 from src.constants.constants import TransactionCategory
 
 MCC_TO_CATEGORY: Dict[str, TransactionCategory] = {
@@ -83,7 +83,6 @@ MCC_TO_CATEGORY: Dict[str, TransactionCategory] = {
     "7012": TransactionCategory.TRAVEL,
     
     "5941": TransactionCategory.SPORTS,
-    "5942": TransactionCategory.SPORTS,
     "5996": TransactionCategory.SPORTS,
     "7941": TransactionCategory.SPORTS,
     "7997": TransactionCategory.SPORTS,
@@ -121,29 +120,29 @@ MCC_TO_CATEGORY: Dict[str, TransactionCategory] = {
     "8299": TransactionCategory.EDUCATION,
 }
 
+# Ключевые слова описания для транзакций без известного MCC (порядок важен: первая подходящая категория)
+DESCRIPTION_KEYWORDS: Dict[TransactionCategory, List[str]] = {
+    TransactionCategory.GROCERIES: ["магазин", "магнит", "пятёрочка", "перекрёсток", "ашан", "лента", "дикси"],
+    TransactionCategory.RESTAURANTS: ["ресторан", "кафе", "макдональдс", "kfc", "бургер", "пицца", "суши", "якитория", "starbucks"],
+    TransactionCategory.TRANSPORT: ["метро", "такси", "uber", "яндекс.такси", "бензин", "азс", "парковка", "транспорт"],
+    TransactionCategory.UTILITIES: ["жкх", "электричество", "газ", "вода", "интернет", "мобильная связь", "связь"],
+    TransactionCategory.TRANSFERS: ["перевод", "transfer", "п2п", "p2p"],
+}
+
+# Диапазоны MCC (включительно): коды из MCC_TO_CATEGORY имеют приоритет над диапазонами
+MCC_RANGES: List[Tuple[int, int, TransactionCategory]] = [
+    (3000, 3299, TransactionCategory.TRAVEL),  # Авиакомпании
+    (3351, 3441, TransactionCategory.TRAVEL),  # Аренда автомобилей
+    (3501, 3999, TransactionCategory.TRAVEL),  # Отели
+]
+
 def categorize_transaction(mcc_code: str, description: str = "") -> TransactionCategory:
     """
     Категоризация транзакции на основе MCC кода.
     Если MCC не найден, пытаемся определить по описанию.
     """
-    if mcc_code and mcc_code in MCC_TO_CATEGORY:
-        return MCC_TO_CATEGORY[mcc_code]
-    
-    description_lower = description.lower()
-    
-    keywords_map = {
-        TransactionCategory.GROCERIES: ["магазин", "магнит", "пятёрочка", "перекрёсток", "ашан", "лента", "дикси"],
-        TransactionCategory.RESTAURANTS: ["ресторан", "кафе", "макдональдс", "kfc", "бургер", "пицца", "суши", "якитория", "starbucks"],
-        TransactionCategory.TRANSPORT: ["метро", "такси", "uber", "яндекс.такси", "бензин", "азс", "парковка", "транспорт"],
-        TransactionCategory.UTILITIES: ["жкх", "электричество", "газ", "вода", "интернет", "мобильная связь", "связь"],
-        TransactionCategory.TRANSFERS: ["перевод", "transfer", "п2п", "p2p"],
-    }
-    
-    for category, keywords in keywords_map.items():
-        if any(keyword in description_lower for keyword in keywords):
-            return category
-    
-    return TransactionCategory.OTHER
+    from src.utils.categorizer import default_categorizer
+    return default_categorizer.categorize(mcc_code, description)
 
 CATEGORY_NAMES_RU = {
     TransactionCategory.GROCERIES: "Продукты и супермаркеты",
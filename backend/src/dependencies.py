@@ -1,33 +1,28 @@
 from fastapi import Cookie, HTTPException, Depends
-from sqlalchemy.orm import Session
 from typing import Optional
 
-from src.database import get_db
-from src.redis_client import get_redis
+from src.redis_client import get_async_redis
 from src.models.user import User
-import redis
+from src.services.session_service import SessionService, SessionUser
+import redis.asyncio as aioredis
 
 async def get_current_user(
     session_id: Optional[str] = Cookie(None, alias="session-id"),
-    db: Session = Depends(get_db),
-    redis_client: redis.Redis = Depends(get_redis)
-) -> User:
+    redis_client: aioredis.Redis = Depends(get_async_redis)
+) -> SessionUser:
     if not session_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    user_id = redis_client.get(f"session:{session_id}")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Session expired or invalid")
-
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    # Снимок пользователя из кеша сессий: БД читается только при его отсутствии
+    user = await SessionService.get_session_user(redis_client, session_id)
     if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+        raise HTTPException(status_code=401, detail="Session expired or invalid")
 
     return user
 
 async def get_current_verified_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: SessionUser = Depends(get_current_user)
+) -> SessionUser:
     if not current_user.is_verified:
         raise HTTPException(
             status_code=403,
@@ -35,3 +30,24 @@ async def get_current_verified_user(
         )
 
     return current_user
+
+async def _load_record(current_user: SessionUser) -> User:
+    user = await SessionService.load_user(current_user.id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_current_user_record(
+    current_user: SessionUser = Depends(get_current_user)
+) -> User:
+    """
+    Полная строка пользователя из БД (отсоединённая) - для роутов, которые его меняют:
+    они делают db.add(current_user) в своей сессии и после коммита сбрасывают снимок
+    через SessionService.invalidate_user
+    """
+    return await _load_record(current_user)
+
+async def get_current_verified_user_record(
+    current_user: SessionUser = Depends(get_current_verified_user)
+) -> User:
+    return await _load_record(current_user)
@@ -0,0 +1,52 @@
+import logging
+import httpx
+from typing import Dict
+
+from src.config import settings
+from src.constants.bank_config import BANK_URLS
+
+logger = logging.getLogger(__name__)
+
+class BankHttpPool:
+    """Долгоживущие httpx.AsyncClient (keep-alive пул) по одному на base URL банка"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self, base_url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=settings.BANK_HTTP2_ENABLED,
+            timeout=httpx.Timeout(
+                settings.BANK_HTTP_TIMEOUT,
+                connect=settings.BANK_HTTP_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.BANK_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.BANK_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.BANK_HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+
+    async def startup(self) -> None:
+        for base_url in set(BANK_URLS.values()):
+            self.get_client(base_url)
+        logger.info(f"✅ HTTP пул для банков создан ({len(self._clients)} клиентов)")
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = self._create_client(base_url)
+            self._clients[base_url] = client
+        return client
+
+    async def shutdown(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        logger.info("👋 HTTP пул для банков закрыт")
+
+bank_http_pool = BankHttpPool()
+
+def get_bank_http_pool() -> BankHttpPool:
+    return bank_http_pool
@@ -1,11 +1,17 @@
 from src.models.user import User
 from src.models.account import BankAccount
+from src.models.bank_consent import BankConsent
 from src.models.group import Group, GroupMember
 from src.models.invitation import Invitation
 from src.models.otp_code import OTPCode
 from src.models.referral import Referral, ReferralStatus
-from src.models.cashback import CashbackData, CashbackConsent
+from src.models.cashback import CashbackData, CashbackCategoryTotal, CashbackConsent
 from src.models.bank_subscription import BankSubscription, SubscriptionStatus, ServiceType
 from src.models.partner import Partner, PartnerTransaction, PartnerStatus
+from src.models.transaction import Transaction, TransactionSyncState
+from src.models.spending_aggregate import MonthlySpendingAggregate
+from src.models.category_rule import CategoryRule
+from src.models.ledger import LedgerAccount, LedgerEntry
+from src.models.idempotency import IdempotencyKey
 
-__all__ = ["User", "BankAccount", "Group", "GroupMember", "Invitation", "OTPCode", "Referral", "ReferralStatus", "CashbackData", "CashbackConsent", "BankSubscription", "SubscriptionStatus", "ServiceType", "Partner", "PartnerTransaction", "PartnerStatus"]
+__all__ = ["User", "BankAccount", "BankConsent", "Group", "GroupMember", "Invitation", "OTPCode", "Referral", "ReferralStatus", "CashbackData", "CashbackCategoryTotal", "CashbackConsent", "BankSubscription", "SubscriptionStatus", "ServiceType", "Partner", "PartnerTransaction", "PartnerStatus", "Transaction", "TransactionSyncState", "MonthlySpendingAggregate", "CategoryRule", "LedgerAccount", "LedgerEntry", "IdempotencyKey"]
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from src.database import Base
+
+class BankConsent(Base):
+    __tablename__ = "bank_consents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    bank_id = Column(Integer, nullable=False)
+    client_id = Column(String(255), nullable=False)
+    consent_id = Column(String(255), nullable=False, unique=True)
+    permissions = Column(Text, nullable=False)  # JSON список разрешений
+    status = Column(String(20), default="active", nullable=False)  # active, replaced
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    user = relationship("User", backref="bank_consents")
+
+    __table_args__ = (
+        Index("ix_bank_consents_user_bank_status", "user_id", "bank_id", "status"),
+    )
+
+    def __repr__(self):
+        return f"<BankConsent(id={self.id}, user_id={self.user_id}, bank_id={self.bank_id}, consent_id={self.consent_id})>"
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, Numeric, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Enum, Numeric, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from src.database import Base
@@ -35,13 +36,17 @@ class BankSubscription(Base):
     # Партнерская информация
     partner_id = Column(Integer, ForeignKey("partners.id"), nullable=True, index=True)  # Будет создана позже
     # Дополнительные данные
-    extra_data = Column(Text, nullable=True)  # JSON с дополнительными данными
+    extra_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)  # Дополнительные данные
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     user = relationship("User", backref="bank_subscriptions")
 
+    __table_args__ = (
+        Index("ix_bank_subscriptions_extra_data", "extra_data", postgresql_using="gin"),
+    )
+
     def __repr__(self):
         return f"<BankSubscription(id={self.id}, user_id={self.user_id}, service_type={self.service_type.value}, status={self.status.value})>"
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from src.database import Base
@@ -12,16 +12,42 @@ class CashbackData(Base):
     total_cashback = Column(Numeric(10, 2), default=0, nullable=False)
     transactions_count = Column(Integer, default=0, nullable=False)
     average_cashback_rate = Column(Numeric(5, 2), default=0, nullable=False)  # Средний процент кешбека
-    categories_breakdown = Column(Text, nullable=True)  # JSON строка с разбивкой по категориям
+    categories_breakdown = Column(Text, nullable=True)  # Устарело: разбивка хранится в cashback_category_totals
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     user = relationship("User", backref="cashback_data")
 
+    __table_args__ = (
+        # Один итог на месяц: пересчёты пишут upsert'ом по этому ключу
+        UniqueConstraint("user_id", "month", name="uq_cashback_data_user_month"),
+    )
+
     def __repr__(self):
         return f"<CashbackData(id={self.id}, user_id={self.user_id}, month={self.month}, total={self.total_cashback})>"
 
+class CashbackCategoryTotal(Base):
+    """Кешбек пользователя за месяц по одной категории (разбивка CashbackData построчно)"""
+    __tablename__ = "cashback_category_totals"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    month = Column(String(7), nullable=False)  # Формат: YYYY-MM
+    category = Column(String(50), nullable=False)
+    amount = Column(Numeric(15, 2), default=0, nullable=False)
+    cashback = Column(Numeric(10, 2), default=0, nullable=False)
+    transactions_count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "month", "category", name="uq_cashback_category_month"),
+        # Агрегации по категории за период (в том числе по всем пользователям для партнёров)
+        Index("ix_cashback_category_totals_category_month", "category", "month"),
+    )
+
+    def __repr__(self):
+        return f"<CashbackCategoryTotal(user_id={self.user_id}, month={self.month}, category={self.category})>"
+
 class CashbackConsent(Base):
     __tablename__ = "cashback_consents"
 
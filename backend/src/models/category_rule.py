@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from src.database import Base
+
+class CategoryRule(Base):
+    """Пользовательское правило категоризации: MCC или ключевое слово описания -> категория"""
+    __tablename__ = "category_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    category = Column(String(50), nullable=False)  # TransactionCategory.value
+    mcc_code = Column(String(4), nullable=True)
+    keyword = Column(String(255), nullable=True)  # подстрока описания, без учёта регистра
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    user = relationship("User", backref="category_rules")
+
+    __table_args__ = (
+        Index("ix_category_rules_user", "user_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<CategoryRule(id={self.id}, user_id={self.user_id}, category={self.category})>"
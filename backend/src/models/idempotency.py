@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, UniqueConstraint
+from sqlalchemy.sql import func
+from src.database import Base
+
+class IdempotencyKey(Base):
+    """
+    Ключ идемпотентности платёжного запроса (заголовок Idempotency-Key).
+    Основное хранилище - Redis; уникальный индекс (user_id, key) - страховка на случай,
+    если Redis потерял ключ: второй запрос с тем же ключом не создаст второй платёж.
+    response пуст, пока исходный запрос выполняется.
+    """
+    __tablename__ = "payment_idempotency_keys"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    scope = Column(String(50), nullable=False)  # эндпоинт, например "payments:to-person"
+    fingerprint = Column(String(64), nullable=False)  # sha256 тела запроса
+
+    response = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_payment_idempotency_user_key"),
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey(user_id={self.user_id}, key={self.key}, scope={self.scope})>"
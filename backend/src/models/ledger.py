@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Numeric, Index
+from sqlalchemy.sql import func
+from src.database import Base
+
+class LedgerAccount(Base):
+    """
+    Счёт внутреннего журнала. Для счетов пользователей balance - проекция журнала:
+    сумма всех внутренних движений по счёту (переводы, оплаты из приложения), которая
+    добавляется к балансу из банка. Системные счета (code, например "external")
+    обозначают мир вне приложения; их проекция не ведётся, чтобы не было горячей строки.
+    """
+    __tablename__ = "ledger_accounts"
+
+    id = Column(Integer, primary_key=True)
+    bank_account_id = Column(Integer, ForeignKey("bank_accounts.id", ondelete="CASCADE"), nullable=True, unique=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    code = Column(String(50), nullable=True, unique=True)
+
+    balance = Column(Numeric(15, 2), default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<LedgerAccount(id={self.id}, bank_account_id={self.bank_account_id}, balance={self.balance})>"
+
+class LedgerEntry(Base):
+    """Проводка: каждый платёж - две строки с суммами противоположного знака"""
+    __tablename__ = "ledger_entries"
+
+    id = Column(Integer, primary_key=True)
+    payment_id = Column(Integer, ForeignKey("payments.id", ondelete="CASCADE"), nullable=False, index=True)
+    ledger_account_id = Column(Integer, ForeignKey("ledger_accounts.id", ondelete="CASCADE"), nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)  # + зачисление, - списание
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Выписка по счёту журнала и пересчёт проекции
+        Index("ix_ledger_entries_account_id", "ledger_account_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<LedgerEntry(payment_id={self.payment_id}, ledger_account_id={self.ledger_account_id}, amount={self.amount})>"
@@ -2,7 +2,7 @@
 Модели для платежей и переводов
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum, Text, Index
 from sqlalchemy.orm import relationship
 from src.database import Base
 import enum
@@ -73,6 +73,13 @@ class Payment(Base):
     user = relationship("User", foreign_keys=[user_id], back_populates="payments")
     recipient = relationship("User", foreign_keys=[to_user_id])
 
+    __table_args__ = (
+        # История платежей: исходящие и входящие читаются по своему индексу
+        # в порядке keyset-пагинации (created_at, id)
+        Index("ix_payments_user_created", user_id, created_at.desc(), id.desc()),
+        Index("ix_payments_to_user_created", to_user_id, created_at.desc(), id.desc()),
+    )
+
     def __repr__(self):
         return f"<Payment(id={self.id}, type={self.payment_type}, amount={self.amount}, status={self.status})>"
 
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Numeric, UniqueConstraint
+from sqlalchemy.sql import func
+from src.database import Base
+
+class MonthlySpendingAggregate(Base):
+    """
+    Предпосчитанные доходы и расходы пользователя за месяц по категории и банку.
+    Обновляется при загрузке транзакций и при проведении внутренних платежей,
+    аналитика читает только эти строки.
+    """
+    __tablename__ = "monthly_spending_aggregates"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    month = Column(Date, nullable=False)  # первое число месяца (UTC)
+    category = Column(String(50), nullable=False)
+    bank_id = Column(Integer, nullable=False)  # 0 - внутренние платежи
+
+    income = Column(Numeric(15, 2), default=0, nullable=False)
+    expenses = Column(Numeric(15, 2), default=0, nullable=False)
+    income_count = Column(Integer, default=0, nullable=False)
+    expense_count = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Ключ агрегата и индекс для чтения по диапазону месяцев
+        UniqueConstraint("user_id", "month", "category", "bank_id", name="uq_monthly_spending_bucket"),
+    )
+
+    def __repr__(self):
+        return f"<MonthlySpendingAggregate(user_id={self.user_id}, month={self.month}, category={self.category})>"
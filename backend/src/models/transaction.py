@@ -0,0 +1,64 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Numeric, Index, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from src.database import Base
+
+class Transaction(Base):
+    """Транзакция, загруженная из банка (локальная копия для аналитики и ленты)"""
+    __tablename__ = "transactions"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bank_id = Column(Integer, nullable=False)
+    account_id = Column(String(255), nullable=False)  # BankAccount.account_id
+
+    transaction_id = Column(String(255), nullable=False)  # transactionId из банка
+    booking_date = Column(DateTime(timezone=True), nullable=False)
+    description = Column(String(500), nullable=True)
+    amount = Column(Numeric(15, 2), nullable=False)
+    currency = Column(String(3), default="RUB", nullable=False)
+    direction = Column(String(10), nullable=False)  # debit / credit
+    mcc_code = Column(String(4), nullable=True)
+    category = Column(String(50), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    user = relationship("User", backref="transactions")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "account_id", "transaction_id", name="uq_transactions_account_txn"),
+        Index("ix_transactions_user_account_booking", "user_id", "account_id", "booking_date", "id"),
+        Index("ix_transactions_user_booking", "user_id", "booking_date", "id"),
+        # Индексы ленты: фильтр по равенству + порядок keyset-пагинации (booking_date, id)
+        Index("ix_transactions_user_bank_booking", "user_id", "bank_id", "booking_date", "id"),
+        Index("ix_transactions_user_category_booking", "user_id", "category", "booking_date", "id"),
+        Index("ix_transactions_user_direction_booking", "user_id", "direction", "booking_date", "id"),
+    )
+
+    def __repr__(self):
+        return f"<Transaction(id={self.id}, account_id={self.account_id}, amount={self.amount})>"
+
+class TransactionSyncState(Base):
+    """Водяной знак инкрементальной синхронизации транзакций по счёту"""
+    __tablename__ = "transaction_sync_state"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bank_id = Column(Integer, nullable=False)
+    account_id = Column(String(255), nullable=False)
+
+    watermark = Column(DateTime(timezone=True), nullable=True)  # booking_date самой новой загруженной транзакции
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Незавершённая догрузка: прошлый запуск упёрся в лимит страниц.
+    # Следующий продолжает с resume_page, watermark сдвигается только после последней страницы
+    resume_page = Column(Integer, nullable=True)
+    resume_watermark = Column(DateTime(timezone=True), nullable=True)  # самая новая транзакция догрузки
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "account_id", name="uq_transaction_sync_state_account"),
+    )
+
+    def __repr__(self):
+        return f"<TransactionSyncState(account_id={self.account_id}, watermark={self.watermark})>"
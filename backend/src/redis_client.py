@@ -1,4 +1,6 @@
 import redis
+import redis.asyncio as aioredis
+import secrets
 from typing import Optional
 from src.config import settings
 
@@ -10,9 +12,42 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
+# Sorted set user_id -> время последнего запроса
+USERS_LAST_SEEN_KEY = "users_last_seen"
+
 def get_redis() -> redis.Redis:
     return redis_client
 
+# Общий асинхронный пул соединений: создаётся и закрывается в lifespan приложения
+_async_pool: Optional[aioredis.ConnectionPool] = None
+_async_client: Optional[aioredis.Redis] = None
+
+def init_async_redis() -> aioredis.Redis:
+    global _async_pool, _async_client
+    if _async_client is None:
+        _async_pool = aioredis.ConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            decode_responses=True
+        )
+        _async_client = aioredis.Redis(connection_pool=_async_pool)
+    return _async_client
+
+async def close_async_redis() -> None:
+    global _async_pool, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        await _async_pool.disconnect()
+    _async_pool = None
+    _async_client = None
+
+def get_async_redis() -> aioredis.Redis:
+    # Вне lifespan (скрипты) пул создаётся при первом обращении
+    return init_async_redis()
+
 def set_with_expiry(key: str, value: str, expiry_seconds: int) -> bool:
     return redis_client.setex(key, expiry_seconds, value)
 
@@ -21,3 +56,28 @@ def get_value(key: str) -> Optional[str]:
 
 def delete_key(key: str) -> bool:
     return redis_client.delete(key) > 0
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+def acquire_lock(client: redis.Redis, key: str, lease_ms: int) -> Optional[str]:
+    lock_token = secrets.token_hex(16)
+    if client.set(key, lock_token, nx=True, px=lease_ms):
+        return lock_token
+    return None
+
+def release_lock(client: redis.Redis, key: str, lock_token: str) -> bool:
+    return client.eval(RELEASE_LOCK_SCRIPT, 1, key, lock_token) == 1
+
+async def acquire_lock_async(client: aioredis.Redis, key: str, lease_ms: int) -> Optional[str]:
+    lock_token = secrets.token_hex(16)
+    if await client.set(key, lock_token, nx=True, px=lease_ms):
+        return lock_token
+    return None
+
+async def release_lock_async(client: aioredis.Redis, key: str, lock_token: str) -> bool:
+    return await client.eval(RELEASE_LOCK_SCRIPT, 1, key, lock_token) == 1
@@ -1,22 +1,27 @@
 import logging
 from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
+from datetime import date
 import redis
 
-from src.database import get_db
+from src.database import get_async_db, get_db
 from src.redis_client import get_redis
 from src.dependencies import get_current_verified_user
 from src.schemas.account import (
     AccountAttachRequest,
     AccountCreateRequest,
     AccountResponse,
+    BalanceBatchRequest,
     BalanceResponse,
+    TransactionFeedFilters,
     TransactionResponse
 )
 from src.schemas.profile import AccountRenameRequest
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.account_service import AccountService
+from src.services.bank_data_cache import bump_account_data_version
 from src.utils.responses import success_response, error_response
 
 logger = logging.getLogger(__name__)
@@ -26,7 +31,7 @@ router = APIRouter(prefix="/api/accounts", tags=["Accounts"])
 @router.post("/attach")
 async def attach_account(
     request: AccountAttachRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
@@ -45,13 +50,10 @@ async def attach_account(
 @router.get("")
 async def get_accounts(
     client_id: Optional[int] = Query(None, description="ID банка для фильтрации"),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    redis_client = get_redis()
-    service = AccountService(db, redis_client)
-
-    accounts = service.get_user_accounts(current_user.id, client_id)
+    accounts = await AccountService.get_user_accounts_async(db, current_user.id, client_id)
     
     logger.info(f"📊 GET /api/accounts - user_id={current_user.id}, returned {len(accounts)} accounts")
     for acc in accounts:
@@ -62,14 +64,14 @@ async def get_accounts(
 @router.post("")
 async def create_account(
     request: AccountCreateRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """Подключить существующий счет из банка через OAuth"""
     redis_client = get_redis()
     service = AccountService(db, redis_client)
 
-    account, error = service.create_account(
+    account, error = await service.create_account(
         current_user.id,
         request.client_id,
         None
@@ -91,7 +93,7 @@ async def create_account(
 @router.post("/create-direct")
 async def create_account_direct(
     request: dict,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -121,6 +123,7 @@ async def create_account_direct(
     db.add(new_account)
     db.commit()
     db.refresh(new_account)
+    bump_account_data_version(get_redis(), current_user.id)
     
     # Сохраняем начальный баланс в Redis для виртуальных счетов
     if initial_balance > 0:
@@ -144,7 +147,7 @@ async def create_account_direct(
 async def get_account(
     account_id: str,
     client_id: int = Query(..., description="ID банка"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
@@ -161,13 +164,13 @@ async def get_account(
 async def get_account_balances(
     account_id: str,
     client_id: int = Query(..., description="ID банка"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
     service = AccountService(db, redis_client)
 
-    balance = service.get_account_balance(current_user.id, account_id, client_id)
+    balance = await service.get_account_balance(current_user.id, account_id, client_id)
 
     if not balance:
         return error_response("Не удалось получить баланс", 404)
@@ -178,20 +181,20 @@ async def get_account_balances(
 async def get_account_transactions(
     account_id: str,
     client_id: int = Query(..., description="ID банка"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
     service = AccountService(db, redis_client)
 
-    transactions = service.get_account_transactions(current_user.id, account_id, client_id)
+    transactions = await service.get_account_transactions(current_user.id, account_id, client_id)
 
     return success_response(transactions)
 
 @router.get("/balances/all")
 async def get_all_balances(
     client_ids: Optional[str] = Query(None, description="ID банков через запятую (1,2,3)"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
@@ -204,23 +207,43 @@ async def get_all_balances(
         except ValueError:
             return error_response("Неверный формат client_ids. Используйте: 1,2,3", 400)
 
-    balances = service.get_all_user_balances(current_user.id, bank_ids)
+    balances = await service.get_all_user_balances(current_user.id, bank_ids)
+
+    return success_response(balances)
+
+@router.post("/balances/batch")
+async def get_balances_batch(
+    request: BalanceBatchRequest,
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db)
+):
+    redis_client = get_redis()
+    service = AccountService(db, redis_client)
+
+    balances = await service.get_balances_batch(
+        async_db,
+        current_user.id,
+        list(dict.fromkeys(request.account_ids))
+    )
 
     return success_response(balances)
 
 @router.get("/transactions/all")
 async def get_all_transactions(
     client_ids: Optional[str] = Query(None, description="ID банков через запятую (1,2,3)"),
-    offset: int = Query(0, ge=0, description="Смещение для пагинации"),
+    account_ids: Optional[str] = Query(None, description="ID счетов через запятую"),
+    categories: Optional[str] = Query(None, description="Категории через запятую (groceries,restaurants)"),
+    start_date: Optional[date] = Query(None, description="Дата начала (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Дата окончания (YYYY-MM-DD)"),
+    min_amount: Optional[float] = Query(None, description="Минимальная сумма"),
+    max_amount: Optional[float] = Query(None, description="Максимальная сумма"),
+    direction: Optional[str] = Query(None, pattern="^(debit|credit)$", description="debit - списания, credit - поступления"),
     limit: int = Query(20, ge=1, le=100, description="Количество записей (max 100)"),
-    start_date: Optional[str] = Query(None, description="Дата начала (YYYY-MM-DD)"),
-    end_date: Optional[str] = Query(None, description="Дата окончания (YYYY-MM-DD)"),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (pagination.nextCursor)"),
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    redis_client = get_redis()
-    service = AccountService(db, redis_client)
-
     bank_ids = None
     if client_ids:
         try:
@@ -228,22 +251,36 @@ async def get_all_transactions(
         except ValueError:
             return error_response("Неверный формат client_ids. Используйте: 1,2,3", 400)
 
-    transactions = service.get_all_user_transactions(
-        current_user.id,
-        bank_ids,
-        offset,
-        limit,
-        start_date,
-        end_date
+    filters = TransactionFeedFilters(
+        bank_ids=bank_ids,
+        account_ids=[x.strip() for x in account_ids.split(',') if x.strip()] if account_ids else None,
+        categories=[x.strip() for x in categories.split(',') if x.strip()] if categories else None,
+        start_date=start_date,
+        end_date=end_date,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        direction=direction
     )
 
+    try:
+        transactions = await AccountService.get_all_user_transactions(
+            db,
+            get_redis(),
+            current_user.id,
+            filters,
+            limit,
+            cursor
+        )
+    except ValueError as e:
+        return error_response(str(e), 400)
+
     return success_response(transactions)
 
 @router.put("/{account_id}/rename")
 async def rename_account(
     account_id: int,
     request: AccountRenameRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
@@ -263,13 +300,13 @@ async def rename_account(
 @router.post("/{account_id}/sync")
 async def force_sync_account(
     account_id: int,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     redis_client = get_redis()
     service = AccountService(db, redis_client)
     
-    sync_result, error = service.force_sync_account(current_user.id, account_id)
+    sync_result, error = await service.force_sync_account(current_user.id, account_id)
     
     if error:
         return error_response(error, 400)
@@ -283,7 +320,7 @@ async def force_sync_account(
 async def set_account_priority(
     account_id: int,
     priority: int = Query(..., ge=1, le=100, description="Приоритет счета (1 = высший)"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -314,7 +351,7 @@ async def set_account_priority(
 
 @router.get("/priority-order")
 async def get_accounts_by_priority(
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """Получить счета в порядке приоритета"""
@@ -341,7 +378,7 @@ async def get_accounts_by_priority(
 @router.put("/{account_id}/toggle-visibility")
 async def toggle_account_visibility(
     account_id: int,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """Скрыть/показать баланс счета"""
@@ -369,7 +406,7 @@ async def get_account_statement(
     account_id: int,
     start_date: str = Query(None, description="Дата начала (YYYY-MM-DD)"),
     end_date: str = Query(None, description="Дата окончания (YYYY-MM-DD)"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -394,7 +431,7 @@ async def get_account_statement(
     
     # Получаем баланс
     try:
-        balance = service.get_account_balance(
+        balance = await service.get_account_balance(
             current_user.id,
             account.account_id,
             account.bank_id
@@ -404,7 +441,7 @@ async def get_account_statement(
     
     # Получаем транзакции
     try:
-        transactions = service.get_account_transactions(
+        transactions = await service.get_account_transactions(
             current_user.id,
             account.account_id,
             account.bank_id
@@ -461,7 +498,7 @@ async def get_account_statement(
 async def get_all_accounts_statement(
     start_date: str = Query(None, description="Дата начала (YYYY-MM-DD)"),
     end_date: str = Query(None, description="Дата окончания (YYYY-MM-DD)"),
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     """Получить общую выписку по всем счетам"""
@@ -482,7 +519,7 @@ async def get_all_accounts_statement(
     
     for account in accounts:
         try:
-            balance = service.get_account_balance(
+            balance = await service.get_account_balance(
                 current_user.id,
                 account.account_id,
                 account.bank_id
@@ -490,7 +527,7 @@ async def get_all_accounts_statement(
             balance_amount = balance.get("amount", 0)
             total_balance += balance_amount
             
-            transactions = service.get_account_transactions(
+            transactions = await service.get_account_transactions(
                 current_user.id,
                 account.account_id,
                 account.bank_id
@@ -1,13 +1,16 @@
 import logging
 from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 
-from src.database import get_db
+from src.database import get_async_db, get_db
 from src.redis_client import get_redis
 from src.dependencies import get_current_verified_user
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.analytics_service import AnalyticsService
+from src.services.categorization_service import CategorizationService
+from src.schemas.analytics import CategoryRuleCreate
 from src.utils.responses import success_response, error_response
 
 logger = logging.getLogger(__name__)
@@ -17,11 +20,12 @@ router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
 @router.get("/overview")
 async def get_analytics_overview(
     client_ids: Optional[str] = Query(None, description="ID банков через запятую"),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db)
 ):
     redis_client = get_redis()
-    service = AnalyticsService(db, redis_client)
+    service = AnalyticsService(db, redis_client, async_db)
     
     bank_ids = None
     if client_ids:
@@ -30,7 +34,7 @@ async def get_analytics_overview(
         except ValueError:
             return error_response("Неверный формат client_ids", 400)
     
-    overview = service.get_user_overview(current_user.id, bank_ids)
+    overview = await service.get_user_overview(current_user.id, bank_ids)
     
     return success_response(overview)
 
@@ -38,13 +42,14 @@ async def get_analytics_overview(
 async def get_categories_breakdown(
     start_date: Optional[str] = Query(None, description="Дата начала (ISO format)"),
     end_date: Optional[str] = Query(None, description="Дата окончания (ISO format)"),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db)
 ):
     redis_client = get_redis()
-    service = AnalyticsService(db, redis_client)
+    service = AnalyticsService(db, redis_client, async_db)
     
-    categories = service.get_categories_breakdown(current_user.id, start_date, end_date)
+    categories = await service.get_categories_breakdown(current_user.id, start_date, end_date)
     
     return success_response(categories)
 
@@ -63,17 +68,70 @@ async def get_available_categories():
     
     return success_response(categories)
 
+def _rule_to_dict(rule) -> dict:
+    return {
+        "id": rule.id,
+        "category": rule.category,
+        "mccCode": rule.mcc_code,
+        "keyword": rule.keyword,
+        "createdAt": rule.created_at.isoformat() if rule.created_at else None
+    }
+
+@router.get("/category-rules")
+async def get_category_rules(
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db)
+):
+    rules = CategorizationService(db).list_rules(current_user.id)
+    return success_response([_rule_to_dict(rule) for rule in rules])
+
+@router.post("/category-rules")
+async def create_category_rule(
+    request: CategoryRuleCreate,
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Пользовательское правило категоризации (MCC или ключевое слово описания).
+    Уже загруженные транзакции перекатегоризируются сразу.
+    """
+    rule, error = CategorizationService(db).create_rule(
+        current_user.id,
+        request.category,
+        request.mcc_code,
+        request.keyword
+    )
+
+    if error:
+        return error_response(error, 400)
+
+    return success_response(_rule_to_dict(rule), 201)
+
+@router.delete("/category-rules/{rule_id}")
+async def delete_category_rule(
+    rule_id: int,
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db)
+):
+    error = CategorizationService(db).delete_rule(current_user.id, rule_id)
+
+    if error:
+        return error_response(error, 404)
+
+    return success_response({"message": "Правило удалено"})
+
 @router.get("/insights")
 async def get_advanced_insights(
     client_ids: Optional[str] = Query(None, description="ID банков через запятую"),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db)
 ):
     """
     Расширенная аналитика с выводами, советами и рекомендациями
     """
     redis_client = get_redis()
-    service = AnalyticsService(db, redis_client)
+    service = AnalyticsService(db, redis_client, async_db)
     
     bank_ids = None
     if client_ids:
@@ -82,7 +140,7 @@ async def get_advanced_insights(
         except ValueError:
             return error_response("Неверный формат client_ids", 400)
     
-    insights = service.get_advanced_insights(current_user.id, bank_ids)
+    insights = await service.get_advanced_insights(current_user.id, bank_ids)
     
     return success_response(insights)
 
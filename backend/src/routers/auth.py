@@ -3,8 +3,8 @@ from fastapi import APIRouter, Depends, Response, Request, HTTPException, status
 from sqlalchemy.orm import Session
 
 from src.database import get_db
-from src.redis_client import get_redis
-from src.dependencies import get_current_user, get_current_verified_user
+from src.redis_client import get_async_redis
+from src.dependencies import get_current_user, get_current_verified_user, get_current_verified_user_record
 from src.schemas.auth import (
     SignUpRequest,
     SignUpResponse,
@@ -17,12 +17,13 @@ from src.schemas.auth import (
 )
 from src.schemas.profile import ProfileUpdateRequest
 from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.auth_service import AuthService
 from src.services.session_service import SessionService
 from src.services.otp_service import OTPService
 from src.utils.responses import success_response, error_response
 from src.config import settings
-import redis
+import redis.asyncio as aioredis
 
 logger = logging.getLogger(__name__)
 
@@ -84,7 +85,7 @@ async def verify_email(
     request: VerifyEmailRequest,
     response: Response,
     db: Session = Depends(get_db),
-    redis_client: redis.Redis = Depends(get_redis)
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
     is_valid, error = OTPService.verify_otp(db, request.email, request.code)
 
@@ -95,7 +96,7 @@ async def verify_email(
     if not user:
         return error_response("Пользователь не найден", 404)
 
-    session_id = SessionService.create_session(redis_client, user.id)
+    session_id = await SessionService.create_session(redis_client, user)
 
     json_response = success_response({
         "message": "Email подтверждён! Вы автоматически вошли в систему.",
@@ -125,14 +126,14 @@ async def sign_in(
     request: SignInRequest,
     response: Response,
     db: Session = Depends(get_db),
-    redis_client: redis.Redis = Depends(get_redis)
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
     user, error = AuthService.authenticate_user(db, request.email, request.password)
 
     if error:
         return error_response(error, 401)
 
-    session_id = SessionService.create_session(redis_client, user.id)
+    session_id = await SessionService.create_session(redis_client, user)
 
     json_response = success_response({
         "message": "Вход выполнен успешно",
@@ -156,7 +157,7 @@ async def sign_in(
     return json_response
 
 @router.get("/me")
-async def get_me(current_user: User = Depends(get_current_verified_user)):
+async def get_me(current_user: SessionUser = Depends(get_current_verified_user)):
     return success_response({
         "id": current_user.id,
         "name": current_user.name,
@@ -171,12 +172,12 @@ async def get_me(current_user: User = Depends(get_current_verified_user)):
 async def logout(
     request: Request,
     response: Response,
-    redis_client: redis.Redis = Depends(get_redis)
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
     session_id = request.cookies.get("session-id")
 
     if session_id:
-        SessionService.delete_session(redis_client, session_id)
+        await SessionService.delete_session(redis_client, session_id)
 
     json_response = success_response({
         "message": "Выход выполнен успешно"
@@ -189,9 +190,12 @@ async def logout(
 @router.put("/profile")
 async def update_profile(
     request: ProfileUpdateRequest,
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_verified_user_record),
+    db: Session = Depends(get_db),
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
+    db.add(current_user)
+
     if request.name is not None:
         current_user.name = request.name
     
@@ -206,6 +210,7 @@ async def update_profile(
     
     db.commit()
     db.refresh(current_user)
+    await SessionService.invalidate_user(redis_client, current_user.id)
     
     return success_response({
         "message": "Профиль успешно обновлен",
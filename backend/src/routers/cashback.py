@@ -1,13 +1,14 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime
 
-from src.database import get_db
+from src.database import get_async_db, get_db
 from src.redis_client import get_redis
 from src.dependencies import get_current_user
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.cashback_service import CashbackService
 from src.utils.responses import success_response, error_response
 import redis
@@ -18,14 +19,15 @@ router = APIRouter(prefix="/api/cashback", tags=["Cashback"])
 
 @router.get("/aggregate")
 async def get_aggregate_cashback(
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
     """Получить агрегированные данные о кешбеке"""
     try:
-        service = CashbackService(db, redis_client)
-        aggregated = service.aggregate_cashback(current_user.id)
+        service = CashbackService(db, redis_client, async_db)
+        aggregated = await service.aggregate_cashback(current_user.id)
         return success_response(aggregated)
     except Exception as e:
         logger.error(f"Ошибка получения агрегированных данных: {e}")
@@ -34,7 +36,7 @@ async def get_aggregate_cashback(
 @router.get("/monthly")
 async def get_monthly_cashback(
     month: Optional[str] = Query(None, description="Месяц в формате YYYY-MM"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
@@ -44,20 +46,16 @@ async def get_monthly_cashback(
             month = datetime.now().strftime("%Y-%m")
 
         service = CashbackService(db, redis_client)
-        cashback_data = service.get_or_create_cashback_data(current_user.id, month)
+        cashback_data = await service.get_or_create_cashback_data(current_user.id, month)
         
         result = {
             "month": month,
             "total_cashback": float(cashback_data.total_cashback),
             "transactions_count": cashback_data.transactions_count,
             "average_cashback_rate": float(cashback_data.average_cashback_rate),
-            "categories_breakdown": {}
+            "categories_breakdown": service.get_month_breakdowns(current_user.id, [month])[month]
         }
 
-        if cashback_data.categories_breakdown:
-            import json
-            result["categories_breakdown"] = json.loads(cashback_data.categories_breakdown)
-
         return success_response(result)
     except Exception as e:
         logger.error(f"Ошибка получения месячных данных: {e}")
@@ -66,14 +64,15 @@ async def get_monthly_cashback(
 @router.get("/categories")
 async def get_categories_breakdown(
     month: Optional[str] = Query(None, description="Месяц в формате YYYY-MM (опционально)"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
     """Получить разбивку кешбека по категориям"""
     try:
-        service = CashbackService(db, redis_client)
-        breakdown = service.get_categories_breakdown(current_user.id, month)
+        service = CashbackService(db, redis_client, async_db)
+        breakdown = await service.get_categories_breakdown(current_user.id, month)
         return success_response({"categories": breakdown})
     except Exception as e:
         logger.error(f"Ошибка получения разбивки по категориям: {e}")
@@ -83,7 +82,7 @@ async def get_categories_breakdown(
 async def create_consent(
     partner_id: Optional[int] = None,
     expires_days: int = 90,
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
@@ -103,14 +102,14 @@ async def create_consent(
 @router.post("/export")
 async def export_cashback_data(
     partner_id: Optional[int] = None,
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
     """Экспорт данных о кешбеке для партнера (требует согласия)"""
     try:
         service = CashbackService(db, redis_client)
-        export_data, error = service.export_cashback_data(current_user.id, partner_id)
+        export_data, error = await service.export_cashback_data(current_user.id, partner_id)
         
         if error:
             return error_response(error, 403)
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from src.database import get_db
 from src.dependencies import get_current_user
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.savings_service import FamilyBudgetService
 from src.schemas.savings import BudgetLimitCreate, BudgetLimitResponse
 from typing import List
@@ -19,7 +19,7 @@ async def set_member_limit(
     group_id: int,
     limit_data: BudgetLimitCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """
     Установить лимит для члена группы
@@ -75,7 +75,7 @@ async def set_member_limit(
 async def get_group_limits(
     group_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """Получить все лимиты группы"""
     
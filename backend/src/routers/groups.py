@@ -1,10 +1,11 @@
 import logging
 from fastapi import APIRouter, Depends, Query, Path
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 import redis
 
-from src.database import get_db
+from src.database import get_async_db, get_db
 from src.redis_client import get_redis
 from src.dependencies import get_current_verified_user
 from src.schemas.group import (
@@ -18,11 +19,11 @@ from src.schemas.group import (
 )
 from src.schemas.profile import RoleUpdateRequest
 from src.constants.constants import GroupRole
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.models.group import GroupMember
 from src.services.group_service import GroupService
 from src.services.invitation_service import InvitationService
-from src.services.account_service import AccountService
+from src.services.group_aggregation_service import GroupAggregationService
 from src.utils.responses import success_response, error_response
 from src.constants.constants import ACCOUNT_LIMITS
 
@@ -33,7 +34,7 @@ router = APIRouter(prefix="/api/groups", tags=["Groups"])
 @router.post("")
 async def create_group(
     request: GroupCreateRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     group, error = GroupService.create_group(
@@ -55,7 +56,7 @@ async def create_group(
 
 @router.get("")
 async def get_groups(
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     groups = GroupService.get_user_groups(db, current_user.id)
@@ -89,7 +90,7 @@ async def get_group_settings():
 @router.delete("")
 async def delete_group(
     request: GroupDeleteRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     success, error = GroupService.delete_group(db, request.group_id, current_user.id)
@@ -104,7 +105,7 @@ async def delete_group(
 @router.post("/exit")
 async def exit_group(
     request: GroupExitRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     success, error = GroupService.exit_group(db, request.group_id, current_user.id)
@@ -119,13 +120,13 @@ async def exit_group(
 @router.get("/{group_id}/accounts")
 async def get_group_accounts(
     group_id: int = Path(...),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if not GroupService.is_user_member(db, group_id, current_user.id):
+    if not await db.run_sync(GroupService.is_user_member, group_id, current_user.id):
         return error_response("Вы не являетесь членом этой группы", 403)
 
-    accounts = GroupService.get_group_accounts(db, group_id)
+    accounts = await db.run_sync(GroupService.get_group_accounts, group_id)
 
     return success_response(accounts)
 
@@ -133,40 +134,14 @@ async def get_group_accounts(
 async def get_group_balances(
     group_id: int = Path(...),
     client_id: Optional[int] = Query(None),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db)
 ):
-    if not GroupService.is_user_member(db, group_id, current_user.id):
+    if not await async_db.run_sync(GroupService.is_user_member, group_id, current_user.id):
         return error_response("Вы не являетесь членом этой группы", 403)
 
-    members = GroupService.get_group_members(db, group_id)
-
-    redis_client = get_redis()
-    account_service = AccountService(db, redis_client)
-
-    balances = []
-
-    for member in members:
-        member_accounts = account_service.get_user_accounts(member.id, client_id)
-
-        for acc in member_accounts:
-            try:
-                balance = account_service.get_account_balance(
-                    member.id,
-                    acc["accountId"],
-                    acc["clientId"]
-                )
-
-                balances.append({
-                    "clientId": str(acc["clientId"]),
-                    "name": acc["clientName"],
-                    "accountName": acc["accountName"],
-                    "owner": {"name": member.name},
-                    "balance": balance
-                })
-            except Exception as e:
-                logger.error(f"Ошибка получения баланса: {e}")
-                continue
+    balances = await GroupAggregationService(db, get_redis(), async_db).get_balances(group_id, client_id)
 
     return success_response(balances)
 
@@ -174,54 +149,28 @@ async def get_group_balances(
 async def get_group_transactions(
     group_id: int = Path(...),
     client_id: Optional[int] = Query(None),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db)
 ):
-    if not GroupService.is_user_member(db, group_id, current_user.id):
+    if not await async_db.run_sync(GroupService.is_user_member, group_id, current_user.id):
         return error_response("Вы не являетесь членом этой группы", 403)
 
-    members = GroupService.get_group_members(db, group_id)
-
-    redis_client = get_redis()
-    account_service = AccountService(db, redis_client)
-
-    all_transactions = []
-
-    for member in members:
-        member_accounts = account_service.get_user_accounts(member.id, client_id)
-
-        for acc in member_accounts:
-            try:
-                transactions = account_service.get_account_transactions(
-                    member.id,
-                    acc["accountId"],
-                    acc["clientId"]
-                )
+    transactions = await GroupAggregationService(db, get_redis(), async_db).get_transactions(group_id, client_id)
 
-                for txn in transactions:
-                    txn["owner"] = {"name": member.name}
-                    txn["accountName"] = acc["accountName"]
-
-                all_transactions.extend(transactions)
-            except Exception as e:
-                logger.error(f"Ошибка получения транзакций: {e}")
-                continue
-
-    all_transactions.sort(key=lambda x: x.get("date", ""), reverse=True)
-
-    return success_response(all_transactions)
+    return success_response(transactions)
 
 @router.get("/{group_id}/accounts/{client_id}")
 async def get_group_account_details(
     group_id: int = Path(...),
     client_id: str = Path(...),
-    current_user: User = Depends(get_current_verified_user),
-    db: Session = Depends(get_db)
+    current_user: SessionUser = Depends(get_current_verified_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if not GroupService.is_user_member(db, group_id, current_user.id):
+    if not await db.run_sync(GroupService.is_user_member, group_id, current_user.id):
         return error_response("Вы не являетесь членом этой группы", 403)
 
-    accounts = GroupService.get_group_accounts(db, group_id)
+    accounts = await db.run_sync(GroupService.get_group_accounts, group_id)
 
     for account in accounts:
         if account["clientId"] == client_id:
@@ -231,7 +180,7 @@ async def get_group_account_details(
 
 @router.get("/invites")
 async def get_my_invitations(
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     invitations = InvitationService.get_user_invitations(db, current_user.email)
@@ -252,7 +201,7 @@ async def get_my_invitations(
 @router.post("/invite")
 async def invite_to_group(
     request: InviteRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     if not GroupService.is_user_member(db, request.group_id, current_user.id):
@@ -285,7 +234,7 @@ async def invite_to_group(
 @router.post("/invite/accept")
 async def accept_invitation(
     request: InviteActionRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     success, error = InvitationService.accept_invitation(
@@ -304,7 +253,7 @@ async def accept_invitation(
 @router.post("/invite/decline")
 async def decline_invitation(
     request: InviteActionRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     success, error = InvitationService.decline_invitation(
@@ -325,7 +274,7 @@ async def update_member_role(
     group_id: int,
     user_id: int,
     request: RoleUpdateRequest,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     try:
@@ -353,7 +302,7 @@ async def update_member_role(
 @router.get("/{group_id}/members")
 async def get_group_members_with_roles(
     group_id: int,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: SessionUser = Depends(get_current_verified_user),
     db: Session = Depends(get_db)
 ):
     if not GroupService.is_user_member(db, group_id, current_user.id):
@@ -5,7 +5,7 @@ from typing import Optional
 
 from src.database import get_db
 from src.dependencies import get_current_user
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.mock_bank_service import MockBankService
 from src.utils.responses import success_response
 
@@ -18,7 +18,7 @@ async def create_mock_account(
     bank_id: int = Query(..., description="ID банка"),
     account_type: str = Query("checking", description="Тип счета (checking, savings)"),
     initial_balance: float = Query(0.0, description="Начальный баланс"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Создать тестовый счет (заглушка для данных, которых нет в API)"""
@@ -39,7 +39,7 @@ async def create_mock_card(
     bank_id: int = Query(..., description="ID банка"),
     account_number: str = Query(..., description="Номер счета"),
     card_type: str = Query("debit", description="Тип карты (debit, credit)"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Выпустить тестовую карту (заглушка)"""
@@ -58,7 +58,7 @@ async def create_mock_card(
 @router.get("/products")
 async def get_mock_products(
     bank_id: int = Query(..., description="ID банка"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получить каталог тестовых продуктов (заглушка)"""
@@ -72,7 +72,7 @@ async def get_mock_products(
 @router.get("/cashback")
 async def get_mock_cashback(
     month: Optional[str] = Query(None, description="Месяц в формате YYYY-MM"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получить информацию о кешбеке (заглушка для данных, которых нет в API)"""
@@ -7,6 +7,7 @@ from pydantic import BaseModel, Field
 from src.database import get_db
 from src.dependencies import get_current_user
 from src.models.user import User
+from src.services.session_service import SessionUser
 from src.models.partner import Partner, PartnerStatus
 from src.services.partner_service import PartnerService
 from src.utils.responses import success_response, error_response
@@ -48,7 +49,7 @@ async def get_partner_from_header(
 @router.post("/register")
 async def register_partner(
     request: CreatePartnerRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Регистрация нового партнера (только для админов)"""
@@ -170,7 +171,7 @@ async def create_subscription_via_partner(
         except ValueError:
             return error_response(f"Неподдерживаемый тип услуги", 400)
 
-        subscription, error = service.create_subscription(
+        subscription, error = await service.create_subscription(
             user_id,
             subscription_data.get("bank_id"),
             service_type,
@@ -1,15 +1,23 @@
 """
 API роутер для платежей и переводов
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+import redis.asyncio as aioredis
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from src.database import get_db
+from src.database import get_async_db, get_db
 from src.dependencies import get_current_user
-from src.models.user import User
+from src.redis_client import get_async_redis
+from src.models.payment import PaymentType
+from src.services.session_service import SessionUser
+from src.services.idempotency_service import IdempotencyService
 from src.services.payment_service import PaymentService
 from src.schemas.payment import (
     TransferRequest,
     TransferByPhoneRequest,
+    PaymentTemplateCreate,
+    ExecuteTemplatesRequest,
     UtilityPaymentRequest,
     PaymentResponse,
     PaymentHistoryItem,
@@ -25,7 +33,9 @@ router = APIRouter(prefix="/api/payments", tags=["Payments"])
 async def transfer_by_phone(
     request: TransferByPhoneRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
     """
     Перевод денег зарегистрированному пользователю по номеру телефона
@@ -33,114 +43,189 @@ async def transfer_by_phone(
     Это внутренний перевод в нашей системе.
     Деньги НЕ списываются с реального счета (это sandbox).
     """
-    try:
-        payment, error = PaymentService.create_internal_transfer(
+    async def execute():
+        try:
+            payment, error = await PaymentService.create_internal_transfer(
+                db,
+                current_user.id,
+                request.from_account_id,
+                request.to_phone,
+                request.amount,
+                request.description
+            )
+        
+            if error:
+                db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=error
+                )
+        
+            # Платеж уже сохранен в PaymentService.create_internal_transfer
+            # Просто обновляем его из БД
+            db.refresh(payment)
+        
+            return {
+                "success": True,
+                "data": {
+                    "message": f"Перевод {request.amount}₽ успешно выполнен!",
+                    "payment": {
+                        "id": payment.id,
+                        "amount": payment.amount,
+                        "currency": payment.currency,
+                        "status": payment.status.value,
+                        "to_name": payment.to_name,
+                        "to_phone": payment.to_phone,
+                        "description": payment.description,
+                        "created_at": payment.created_at.isoformat(),
+                        "completed_at": payment.completed_at.isoformat() if payment.completed_at else None
+                    }
+                }
+            }
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Ошибка создания перевода: {str(e)}"
+            )
+
+    return await IdempotencyService(db, redis_client).run(
+        current_user.id, idempotency_key, "payments:to-person", request, execute
+    )
+
+
+@router.post("/transfer-card", response_model=dict)
+async def transfer_card(
+    request: TransferRequest,
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    redis_client: aioredis.Redis = Depends(get_async_redis)
+):
+    """Перевод на карту по номеру счета"""
+    async def execute():
+        if not request.to_account:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Укажите номер счета получателя"
+            )
+    
+        payment, error = await PaymentService.create_card_transfer(
             db,
             current_user.id,
             request.from_account_id,
-            request.to_phone,
+            request.to_account,
+            request.to_account,  # to_name пока = номеру счета
             request.amount,
             request.description
         )
-        
+    
         if error:
-            db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=error
             )
-        
-        # Платеж уже сохранен в PaymentService.create_internal_transfer
-        # Просто обновляем его из БД
-        db.refresh(payment)
-        
+    
         return {
             "success": True,
             "data": {
-                "message": f"Перевод {request.amount}₽ успешно выполнен!",
+                "message": "Перевод отправлен в обработку",
                 "payment": {
                     "id": payment.id,
                     "amount": payment.amount,
-                    "currency": payment.currency,
                     "status": payment.status.value,
-                    "to_name": payment.to_name,
-                    "to_phone": payment.to_phone,
-                    "description": payment.description,
-                    "created_at": payment.created_at.isoformat(),
-                    "completed_at": payment.completed_at.isoformat() if payment.completed_at else None
+                    "to_account": payment.to_account
                 }
             }
         }
-    except HTTPException:
-        db.rollback()
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Ошибка создания перевода: {str(e)}"
-        )
+
+    return await IdempotencyService(db, redis_client).run(
+        current_user.id, idempotency_key, "payments:transfer-card", request, execute
+    )
 
 
-@router.post("/transfer-card", response_model=dict)
-async def transfer_card(
-    request: TransferRequest,
+@router.post("/utility", response_model=dict)
+async def pay_utility(
+    request: UtilityPaymentRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
-    """Перевод на карту по номеру счета"""
-    if not request.to_account:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Укажите номер счета получателя"
+    """Оплата услуг (ЖКХ, связь, интернет и т.д.)"""
+    async def execute():
+        payment, error = await PaymentService.create_utility_payment(
+            db,
+            current_user.id,
+            request.from_account_id,
+            request.payment_type,
+            request.provider,
+            request.account_number,
+            request.amount
         )
     
-    payment, error = PaymentService.create_card_transfer(
-        db,
-        current_user.id,
-        request.from_account_id,
-        request.to_account,
-        request.to_account,  # to_name пока = номеру счета
-        request.amount,
-        request.description
-    )
-    
-    if error:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error
-        )
+        if error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=error
+            )
     
-    return {
-        "success": True,
-        "data": {
-            "message": "Перевод отправлен в обработку",
-            "payment": {
-                "id": payment.id,
-                "amount": payment.amount,
-                "status": payment.status.value,
-                "to_account": payment.to_account
+        return {
+            "success": True,
+            "data": {
+                "message": f"Платеж {request.amount}₽ успешно выполнен!",
+                "payment": {
+                    "id": payment.id,
+                    "amount": payment.amount,
+                    "status": payment.status.value,
+                    "provider": request.provider,
+                    "account_number": request.account_number
+                }
             }
         }
+
+    return await IdempotencyService(db, redis_client).run(
+        current_user.id, idempotency_key, "payments:utility", request, execute
+    )
+
+
+def _template_to_dict(template) -> dict:
+    return {
+        "id": template.id,
+        "paymentType": template.payment_type.value,
+        "name": template.name,
+        "toPhone": template.to_phone,
+        "toAccount": template.to_account,
+        "toName": template.to_name,
+        "amount": template.amount,
+        "description": template.description
     }
 
 
-@router.post("/utility", response_model=dict)
-async def pay_utility(
-    request: UtilityPaymentRequest,
+@router.get("/templates", response_model=dict)
+async def get_payment_templates(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
-    """Оплата услуг (ЖКХ, связь, интернет и т.д.)"""
-    payment, error = PaymentService.create_utility_payment(
-        db,
-        current_user.id,
-        request.from_account_id,
-        request.payment_type,
-        request.provider,
-        request.account_number,
-        request.amount
-    )
+    """Шаблоны платежей пользователя"""
+    templates = PaymentService.get_templates(db, current_user.id)
+    return {
+        "success": True,
+        "data": [_template_to_dict(template) for template in templates]
+    }
+
+
+@router.post("/templates", response_model=dict)
+async def create_payment_template(
+    request: PaymentTemplateCreate,
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(get_current_user)
+):
+    """Сохранить шаблон платежа (перевод по телефону, на карту или оплата услуг)"""
+    template, error = PaymentService.create_template(db, current_user.id, request)
     
     if error:
         raise HTTPException(
@@ -150,30 +235,77 @@ async def pay_utility(
     
     return {
         "success": True,
-        "data": {
-            "message": f"Платеж {request.amount}₽ успешно выполнен!",
-            "payment": {
-                "id": payment.id,
-                "amount": payment.amount,
-                "status": payment.status.value,
-                "provider": request.provider,
-                "account_number": request.account_number
+        "data": _template_to_dict(template)
+    }
+
+
+@router.post("/templates/execute", response_model=dict)
+async def execute_payment_templates(
+    request: ExecuteTemplatesRequest,
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    redis_client: aioredis.Redis = Depends(get_async_redis)
+):
+    """
+    Исполнить несколько шаблонов одним запросом (ежемесячные платежи, переводы семье)
+    
+    Позиции исполняются независимо: в ответе результат по каждой -
+    платеж или причина отказа (нет средств, получатель не найден и т.д.).
+    """
+    async def execute():
+        results, error = await PaymentService.execute_templates(db, current_user.id, request.items)
+        
+        if error:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=error
+            )
+        
+        completed = sum(1 for result in results if result["success"])
+        return {
+            "success": True,
+            "data": {
+                "completed": completed,
+                "failed": len(results) - completed,
+                "results": results
             }
         }
-    }
+
+    return await IdempotencyService(db, redis_client).run(
+        current_user.id, idempotency_key, "payments:templates", request, execute
+    )
 
 
 @router.get("/history", response_model=dict)
 async def get_payment_history(
-    limit: int = 50,
-    offset: int = 0,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=200, description="Количество записей (max 200)"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (pagination.nextCursor)"),
+    types: Optional[str] = Query(None, description="Типы платежей через запятую (to_person,mobile)"),
+    direction: Optional[str] = Query(None, pattern="^(incoming|outgoing)$", description="incoming - входящие, outgoing - исходящие"),
+    include_counts: bool = Query(False, description="Добавить количество платежей по типам"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: SessionUser = Depends(get_current_user)
 ):
-    """Получить историю платежей пользователя"""
-    payments = PaymentService.get_user_payments(db, current_user.id, limit, offset)
+    """Получить историю платежей пользователя (keyset-пагинация, новые сверху)"""
+    payment_types = None
+    if types:
+        try:
+            payment_types = [PaymentType(x.strip()) for x in types.split(",") if x.strip()]
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Неизвестный тип платежа. Допустимые: {', '.join(t.value for t in PaymentType)}"
+            )
     
-    return {
+    try:
+        payments, next_cursor = await PaymentService.get_user_payments_async(
+            db, current_user.id, limit, cursor, payment_types, direction
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    response = {
         "success": True,
         "data": [
             {
@@ -195,18 +327,21 @@ async def get_payment_history(
             for p in payments
         ],
         "pagination": {
-            "total": len(payments),
             "limit": limit,
-            "offset": offset
+            "hasMore": next_cursor is not None,
+            "nextCursor": next_cursor
         }
     }
+    if include_counts:
+        response["counts"] = await PaymentService.get_payment_type_counts_async(db, current_user.id, direction)
+    return response
 
 
 @router.get("/search-user", response_model=dict)
 async def search_user_by_phone(
     phone: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """
     Поиск пользователя по номеру телефона для перевода
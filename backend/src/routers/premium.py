@@ -2,13 +2,19 @@
 API роутер для Premium подписки
 """
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from typing import Optional
+import redis.asyncio as aioredis
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Header
 from sqlalchemy.orm import Session
 from src.database import get_db
-from src.dependencies import get_current_user
+from src.dependencies import get_current_user, get_current_user_record
+from src.redis_client import get_async_redis
 from src.models.user import User
+from src.services.session_service import SessionUser
 from src.constants.constants import AccountType
+from src.services.idempotency_service import IdempotencyService
 from src.services.payment_service import PaymentService
+from src.services.session_service import SessionService
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
@@ -29,7 +35,9 @@ class PurchasePremiumRequest(BaseModel):
 async def purchase_premium(
     request: PurchasePremiumRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_record),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    redis_client: aioredis.Redis = Depends(get_async_redis)
 ):
     """
     Покупка Premium подписки
@@ -37,112 +45,122 @@ async def purchase_premium(
     Списывает 299₽ с указанного счета и обновляет тариф на Premium.
     Создает транзакцию в истории платежей.
     """
-    logger.info(f"🚀 НАЧАЛО: Покупка Premium, пользователь {current_user.id}")
-    logger.info(f"📦 Тело запроса: fromAccountId={request.from_account_id}")
-    # Проверяем, не Premium ли уже (система проверки подписки)
-    logger.info(f"🔍 Проверка подписки для пользователя {current_user.id}, текущий тип: {current_user.account_type}")
+    async def execute():
+        logger.info(f"🚀 НАЧАЛО: Покупка Premium, пользователь {current_user.id}")
+        logger.info(f"📦 Тело запроса: fromAccountId={request.from_account_id}")
+        # Проверяем, не Premium ли уже (система проверки подписки)
+        logger.info(f"🔍 Проверка подписки для пользователя {current_user.id}, текущий тип: {current_user.account_type}")
     
-    if current_user.account_type == AccountType.PREMIUM:
-        # Дополнительная проверка: есть ли активная Premium подписка в платежах
-        from src.models.payment import Payment, PaymentType, PaymentStatus
-        from datetime import datetime, timedelta
+        if current_user.account_type == AccountType.PREMIUM:
+            # Дополнительная проверка: есть ли активная Premium подписка в платежах
+            from src.models.payment import Payment, PaymentType, PaymentStatus
+            from datetime import datetime, timedelta
         
-        # Проверяем последний Premium платеж
-        last_premium_payment = db.query(Payment).filter(
-            Payment.user_id == current_user.id,
-            Payment.payment_type == PaymentType.PREMIUM,
-            Payment.status == PaymentStatus.COMPLETED
-        ).order_by(Payment.created_at.desc()).first()
+            # Проверяем последний Premium платеж
+            last_premium_payment = db.query(Payment).filter(
+                Payment.user_id == current_user.id,
+                Payment.payment_type == PaymentType.PREMIUM,
+                Payment.status == PaymentStatus.COMPLETED
+            ).order_by(Payment.created_at.desc()).first()
         
-        if last_premium_payment:
-            # Premium подписка действует 30 дней
-            subscription_duration = timedelta(days=30)
-            subscription_expires = last_premium_payment.created_at + subscription_duration
+            if last_premium_payment:
+                # Premium подписка действует 30 дней
+                subscription_duration = timedelta(days=30)
+                subscription_expires = last_premium_payment.created_at + subscription_duration
             
-            if datetime.utcnow() < subscription_expires:
-                logger.warning(f"⚠️  У пользователя {current_user.id} уже есть активная Premium подписка до {subscription_expires}")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"У вас уже активна подписка Premium до {subscription_expires.strftime('%d.%m.%Y')}"
-                )
+                if datetime.utcnow() < subscription_expires:
+                    logger.warning(f"⚠️  У пользователя {current_user.id} уже есть активная Premium подписка до {subscription_expires}")
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"У вас уже активна подписка Premium до {subscription_expires.strftime('%d.%m.%Y')}"
+                    )
+                else:
+                    logger.info(f"ℹ️  Подписка пользователя {current_user.id} истекла, можно продлить")
             else:
-                logger.info(f"ℹ️  Подписка пользователя {current_user.id} истекла, можно продлить")
-        else:
-            logger.warning(f"⚠️  У пользователя {current_user.id} account_type=PREMIUM, но нет платежей")
-            # Если нет платежей, но тип PREMIUM - сбрасываем на FREE
-            current_user.account_type = AccountType.FREE
-            db.commit()
+                logger.warning(f"⚠️  У пользователя {current_user.id} account_type=PREMIUM, но нет платежей")
+                # Если нет платежей, но тип PREMIUM - сбрасываем на FREE
+                db.add(current_user)
+                current_user.account_type = AccountType.FREE
+                db.commit()
+                await SessionService.invalidate_user(redis_client, current_user.id)
+    
+        # Получаем account_id из request
+        from_account_id = request.from_account_id
+        logger.info(f"🔍 Получен from_account_id: {from_account_id}")
     
-    # Получаем account_id из request
-    from_account_id = request.from_account_id
-    logger.info(f"🔍 Получен from_account_id: {from_account_id}")
+        if not from_account_id or from_account_id == 0:
+            logger.error(f"❌ Не указан счет для списания")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Не указан счет для списания"
+            )
     
-    if not from_account_id or from_account_id == 0:
-        logger.error(f"❌ Не указан счет для списания")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Не указан счет для списания"
+        # Создаем платеж
+        logger.info(f"💳 Создание платежа Premium для пользователя {current_user.id}, счет: {from_account_id}")
+        payment, error = await PaymentService.create_premium_payment(
+            db,
+            current_user.id,
+            from_account_id,
+            amount=299.0
         )
     
-    # Создаем платеж
-    logger.info(f"💳 Создание платежа Premium для пользователя {current_user.id}, счет: {from_account_id}")
-    payment, error = PaymentService.create_premium_payment(
-        db,
-        current_user.id,
-        from_account_id,
-        amount=299.0
-    )
+        if error:
+            logger.error(f"❌ Ошибка создания платежа Premium: {error}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=error
+            )
     
-    if error:
-        logger.error(f"❌ Ошибка создания платежа Premium: {error}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error
-        )
+        logger.info(f"✅ Платеж Premium успешно создан: {payment.id}")
     
-    logger.info(f"✅ Платеж Premium успешно создан: {payment.id}")
+        # Обновляем тариф пользователя на Premium
+        db.add(current_user)
+        current_user.account_type = AccountType.PREMIUM
+        try:
+            db.commit()
+            db.refresh(current_user)
+            logger.info(f"✅ Тип аккаунта пользователя {current_user.id} обновлен на PREMIUM")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Ошибка обновления типа аккаунта: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Ошибка обновления типа аккаунта"
+            )
     
-    # Обновляем тариф пользователя на Premium
-    current_user.account_type = AccountType.PREMIUM
-    try:
-        db.commit()
-        db.refresh(current_user)
-        logger.info(f"✅ Тип аккаунта пользователя {current_user.id} обновлен на PREMIUM")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"❌ Ошибка обновления типа аккаунта: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Ошибка обновления типа аккаунта"
-        )
+        await SessionService.invalidate_user(redis_client, current_user.id)
     
-    # Начисляем награду рефералу за покупку Premium
-    try:
-        from src.services.referral_service import ReferralService
-        ReferralService.reward_premium_purchase(db, current_user.id)
-        logger.info(f"Начислена награда рефералу за покупку Premium пользователем {current_user.id}")
-    except Exception as e:
-        logger.warning(f"Ошибка начисления награды рефералу: {e}")
-        # Не блокируем покупку Premium, если ошибка с рефералом
+        # Начисляем награду рефералу за покупку Premium
+        try:
+            from src.services.referral_service import ReferralService
+            ReferralService.reward_premium_purchase(db, current_user.id)
+            logger.info(f"Начислена награда рефералу за покупку Premium пользователем {current_user.id}")
+        except Exception as e:
+            logger.warning(f"Ошибка начисления награды рефералу: {e}")
+            # Не блокируем покупку Premium, если ошибка с рефералом
     
-    return {
-        "success": True,
-        "data": {
-            "message": "🎉 Поздравляем! Вы перешли на Premium!",
-            "accountType": current_user.account_type.value,
-            "payment": {
-                "id": payment.id,
-                "amount": payment.amount,
-                "status": payment.status.value,
-                "createdAt": payment.created_at.isoformat()
+        return {
+            "success": True,
+            "data": {
+                "message": "🎉 Поздравляем! Вы перешли на Premium!",
+                "accountType": current_user.account_type.value,
+                "payment": {
+                    "id": payment.id,
+                    "amount": payment.amount,
+                    "status": payment.status.value,
+                    "createdAt": payment.created_at.isoformat()
+                }
             }
         }
-    }
+
+    return await IdempotencyService(db, redis_client).run(
+        current_user.id, idempotency_key, "premium:purchase", request, execute
+    )
 
 
 @router.get("/status", response_model=dict)
 async def get_premium_status(
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """Проверить статус Premium подписки"""
     is_premium = current_user.account_type == AccountType.PREMIUM
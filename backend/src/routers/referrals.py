@@ -4,8 +4,9 @@ from sqlalchemy.orm import Session
 from typing import List
 
 from src.database import get_db
-from src.dependencies import get_current_user
+from src.dependencies import get_current_user, get_current_user_record
 from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.referral_service import ReferralService
 from src.utils.responses import success_response, error_response
 
@@ -15,7 +16,7 @@ router = APIRouter(prefix="/api/referrals", tags=["Referrals"])
 
 @router.get("/my-code")
 async def get_my_referral_code(
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получить свой реферальный код"""
@@ -31,12 +32,13 @@ async def get_my_referral_code(
 
 @router.post("/regenerate-code")
 async def regenerate_referral_code(
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_record),
     db: Session = Depends(get_db)
 ):
     """Обновить (регенерировать) реферальный код"""
     try:
         # Сбрасываем текущий код
+        db.add(current_user)
         current_user.referral_code = None
         db.commit()
         
@@ -53,7 +55,7 @@ async def regenerate_referral_code(
 
 @router.get("/stats")
 async def get_referral_stats(
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получить статистику рефералов"""
@@ -66,7 +68,7 @@ async def get_referral_stats(
 
 @router.get("/list")
 async def get_referral_list(
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Получить список приглашенных пользователей"""
@@ -79,7 +81,7 @@ async def get_referral_list(
 
 @router.post("/claim-reward")
 async def claim_reward(
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Запросить выплату награды"""
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from src.database import get_db
 from src.dependencies import get_current_user
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.savings_service import SavingsService
 from src.schemas.savings import (
     SavingsGoalCreate,
@@ -24,7 +24,7 @@ router = APIRouter(prefix="/api/savings", tags=["Savings Goals"])
 async def create_savings_goal(
     goal_data: SavingsGoalCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """
     Создать цель накопления
@@ -90,7 +90,7 @@ async def create_savings_goal(
 @router.get("/goals", response_model=dict)
 async def get_savings_goals(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """Получить все цели пользователя"""
     goals = SavingsService.get_user_goals(db, current_user.id)
@@ -121,7 +121,7 @@ async def contribute_to_goal(
     goal_id: int,
     amount: float,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """Внести средства в цель"""
     
@@ -165,7 +165,7 @@ async def contribute_to_goal(
 async def delete_goal(
     goal_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """Удалить цель"""
     
@@ -196,7 +196,7 @@ async def add_rule_to_goal(
     goal_id: int,
     rule_data: ContributionRuleCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: SessionUser = Depends(get_current_user)
 ):
     """Добавить правило пополнения к цели"""
     
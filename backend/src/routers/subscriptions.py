@@ -7,7 +7,7 @@ from pydantic import BaseModel, Field
 from src.database import get_db
 from src.redis_client import get_redis
 from src.dependencies import get_current_user
-from src.models.user import User
+from src.services.session_service import SessionUser
 from src.models.bank_subscription import BankSubscription, SubscriptionStatus, ServiceType
 from src.services.subscription_service import SubscriptionService
 from src.utils.responses import success_response, error_response
@@ -33,14 +33,14 @@ class CreateSubscriptionRequest(BaseModel):
 async def get_products(
     bank_id: int = Query(..., description="ID банка"),
     product_type: Optional[str] = Query(None, description="Тип продукта (card, deposit, loan, account)"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
     """Получить каталог доступных продуктов банка"""
     try:
         service = SubscriptionService(db, redis_client)
-        products = service.get_available_products(current_user.id, bank_id, product_type)
+        products = await service.get_available_products(current_user.id, bank_id, product_type)
         return success_response({"products": products})
     except Exception as e:
         logger.error(f"Ошибка получения продуктов: {e}")
@@ -49,7 +49,7 @@ async def get_products(
 @router.get("")
 async def get_subscriptions(
     bank_id: Optional[int] = Query(None, description="ID банка (опционально)"),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
@@ -80,7 +80,7 @@ async def get_subscriptions(
 @router.post("/bank-services")
 async def create_subscription(
     request: CreateSubscriptionRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
@@ -93,7 +93,7 @@ async def create_subscription(
             return error_response(f"Неподдерживаемый тип услуги: {request.service_type}", 400)
 
         service = SubscriptionService(db, redis_client)
-        subscription, error = service.create_subscription(
+        subscription, error = await service.create_subscription(
             current_user.id,
             request.bank_id,
             service_type,
@@ -120,7 +120,7 @@ async def create_subscription(
 @router.get("/{subscription_id}")
 async def get_subscription(
     subscription_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
@@ -148,8 +148,7 @@ async def get_subscription(
         }
 
         if subscription.extra_data:
-            import json
-            result["metadata"] = json.loads(subscription.extra_data)
+            result["metadata"] = subscription.extra_data
 
         return success_response(result)
     except Exception as e:
@@ -159,7 +158,7 @@ async def get_subscription(
 @router.delete("/{subscription_id}")
 async def cancel_subscription(
     subscription_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis)
 ):
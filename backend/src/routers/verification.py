@@ -5,9 +5,12 @@ from fastapi import APIRouter, Depends, Body
 from sqlalchemy.orm import Session
 from typing import Optional
 from src.database import get_db
-from src.dependencies import get_current_user
+from src.dependencies import get_current_user, get_current_user_record
+from src.redis_client import get_async_redis
 from src.models.user import User
+from src.services.session_service import SessionUser
 from src.services.otp_service import OTPService
+from src.services.session_service import SessionService
 from src.utils.responses import success_response, error_response
 
 router = APIRouter(prefix="/api/verification", tags=["Verification"])
@@ -15,7 +18,7 @@ router = APIRouter(prefix="/api/verification", tags=["Verification"])
 @router.post("/send-phone-code")
 async def send_phone_verification_code(
     request: dict = Body(default={}),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_record),
     db: Session = Depends(get_db)
 ):
     """Отправить код подтверждения на телефон"""
@@ -23,9 +26,11 @@ async def send_phone_verification_code(
     phone = request.get('phone') if request else None
     if phone:
         # Обновляем телефон пользователя
+        db.add(current_user)
         current_user.phone = phone
         db.commit()
         db.refresh(current_user)
+        await SessionService.invalidate_user(get_async_redis(), current_user.id)
     elif not current_user.phone:
         return error_response("Номер телефона не указан", 400)
     
@@ -45,7 +50,7 @@ async def send_phone_verification_code(
 @router.post("/verify-phone")
 async def verify_phone(
     request: dict = Body(...),
-    current_user: User = Depends(get_current_user),
+    current_user: SessionUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Подтвердить номер телефона кодом"""
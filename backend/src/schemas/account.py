@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 class BankInfo(BaseModel):
     id: int
@@ -14,6 +14,11 @@ class AccountCreateRequest(BaseModel):
 class AccountAttachRequest(BaseModel):
     id: int
 
+class BalanceBatchRequest(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    account_ids: List[str] = Field(..., alias='accountIds', min_length=1, max_length=100)
+
 class BalanceResponse(BaseModel):
     amount: float
     currency: str
@@ -26,6 +31,16 @@ class TransactionResponse(BaseModel):
     date: datetime
     type: str
 
+class TransactionFeedFilters(BaseModel):
+    bank_ids: Optional[List[int]] = None
+    account_ids: Optional[List[str]] = None
+    categories: Optional[List[str]] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    direction: Optional[str] = None  # debit / credit
+
 class AccountResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
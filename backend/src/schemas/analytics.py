@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field, ConfigDict
+from typing import Optional
+
+class CategoryRuleCreate(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    category: str
+    mcc_code: Optional[str] = Field(None, alias='mccCode', max_length=4)
+    keyword: Optional[str] = Field(None, max_length=255)
@@ -3,7 +3,7 @@
 """
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class TransferRequest(BaseModel):
@@ -74,3 +74,32 @@ class UserSearchResult(BaseModel):
     phone: str
     avatar_url: Optional[str]
 
+
+
+class PaymentTemplateCreate(BaseModel):
+    """Создание шаблона платежа"""
+    payment_type: str = Field(..., alias='paymentType', description="to_person, card_to_card, mobile, utilities, internet, tv, phone, electricity, to_organization")
+    name: str = Field(..., min_length=1, max_length=255)
+    to_phone: Optional[str] = Field(None, alias='toPhone', description="Телефон получателя (для to_person)")
+    to_account: Optional[str] = Field(None, alias='toAccount', description="Номер счета или лицевой счет")
+    to_name: Optional[str] = Field(None, alias='toName', description="Получатель или провайдер")
+    amount: Optional[float] = Field(None, gt=0)
+    description: Optional[str] = None
+    
+    class Config:
+        populate_by_name = True
+
+
+class TemplateExecutionItem(BaseModel):
+    """Позиция пакетного исполнения шаблонов"""
+    template_id: int = Field(..., alias='templateId')
+    from_account_id: int = Field(..., alias='fromAccountId')
+    amount: Optional[float] = Field(None, gt=0, description="Сумма, если в шаблоне она не задана или меняется")
+    
+    class Config:
+        populate_by_name = True
+
+
+class ExecuteTemplatesRequest(BaseModel):
+    """Пакетное исполнение шаблонов (ежемесячные платежи, переводы семье)"""
+    items: List[TemplateExecutionItem] = Field(..., min_length=1, max_length=50)
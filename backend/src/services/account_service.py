@@ -1,13 +1,23 @@
+import asyncio
 import logging
-import json
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional, Tuple
 import redis
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, tuple_
 
 from src.models.account import BankAccount
 from src.models.user import User
-from src.services.bank_client import BankClient
+from src.models.transaction import Transaction
+from src.schemas.account import TransactionFeedFilters
+from src.redis_client import get_async_redis
+from src.services.bank_client import AsyncBankClient
+from src.services.bank_data_cache import BankDataCache, CacheMeta, bump_account_data_version
+from src.services.ledger_service import LedgerService
+from src.services.transaction_sync_service import TransactionSyncService, spawn_sync_accounts
+from src.utils.fanout import fan_out
+from src.utils.pagination import decode_cursor, encode_cursor
 from src.config import settings
 
 logger = logging.getLogger(__name__)
@@ -17,36 +27,51 @@ class AccountService:
     def __init__(self, db: Session, redis_client: redis.Redis):
         self.db = db
         self.redis_client = redis_client
-        self.bank_client = BankClient(redis_client)
+        self.bank_client = AsyncBankClient(get_async_redis())
+        self.cache = BankDataCache(redis_client)
 
     def get_user_accounts(
         self,
         user_id: int,
         bank_id: Optional[int] = None
     ) -> List[Dict[str, Any]]:
-        query = self.db.query(BankAccount).filter(BankAccount.user_id == user_id)
+        accounts = self.db.scalars(self._user_accounts_query(user_id, bank_id))
+        return [self._account_to_dict(acc) for acc in accounts]
 
-        if bank_id:
-            query = query.filter(BankAccount.bank_id == bank_id)
+    @classmethod
+    async def get_user_accounts_async(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        bank_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """То же, что get_user_accounts, но через асинхронную сессию (не блокирует event loop)"""
+        accounts = await db.scalars(cls._user_accounts_query(user_id, bank_id))
+        return [cls._account_to_dict(acc) for acc in accounts]
 
-        accounts = query.all()
+    @staticmethod
+    def _user_accounts_query(user_id: int, bank_id: Optional[int]):
+        query = select(BankAccount).where(BankAccount.user_id == user_id)
 
-        result = []
-        for acc in accounts:
-            result.append({
-                "id": acc.id,
-                "accountId": acc.account_id,
-                "accountName": acc.account_name,
-                "clientId": acc.bank_id,
-                "clientName": self._get_bank_name(acc.bank_id),
-                "isActive": acc.is_active,
-                "isHidden": acc.is_hidden,
-                "priority": acc.priority
-            })
+        if bank_id:
+            query = query.where(BankAccount.bank_id == bank_id)
+
+        return query
 
-        return result
+    @classmethod
+    def _account_to_dict(cls, acc: BankAccount) -> Dict[str, Any]:
+        return {
+            "id": acc.id,
+            "accountId": acc.account_id,
+            "accountName": acc.account_name,
+            "clientId": acc.bank_id,
+            "clientName": cls._get_bank_name(acc.bank_id),
+            "isActive": acc.is_active,
+            "isHidden": acc.is_hidden,
+            "priority": acc.priority
+        }
 
-    def create_account(
+    async def create_account(
         self,
         user_id: int,
         bank_id: int,
@@ -55,14 +80,14 @@ class AccountService:
         try:
             client_id = f"{settings.TEAM_CLIENT_ID}-{user_id}"
 
-            consent_id = self.bank_client.create_consent(
+            consent_id = await self.bank_client.consents.get_consent(
                 user_id,
                 bank_id,
                 client_id,
                 ["ReadAccountsDetail", "ReadBalances", "ReadTransactionsDetail"]
             )
 
-            bank_accounts = self.bank_client.get_accounts(user_id, bank_id, client_id)
+            bank_accounts = await self.bank_client.get_accounts(user_id, bank_id, client_id)
 
             if not bank_accounts:
                 return None, "Не удалось получить счета из банка"
@@ -81,6 +106,7 @@ class AccountService:
             self.db.add(new_account)
             self.db.commit()
             self.db.refresh(new_account)
+            bump_account_data_version(self.redis_client, user_id)
 
             logger.info(f"✅ Создан счёт {new_account.id} для пользователя {user_id}")
             return new_account, None
@@ -105,6 +131,7 @@ class AccountService:
         account.user_id = user_id
         account.is_active = True
         self.db.commit()
+        bump_account_data_version(self.redis_client, user_id)
 
         logger.info(f"✅ Счёт {account_id} привязан к пользователю {user_id}")
         return True, None
@@ -117,10 +144,10 @@ class AccountService:
     ) -> Optional[Dict[str, Any]]:
         cache_key = f"account_info:{user_id}:{account_id}"
 
-        cached = self.redis_client.get(cache_key)
+        cached = self.cache.get(cache_key)
         if cached:
             logger.info(f"✅ Используем кешированную информацию о счёте {account_id}")
-            return json.loads(cached)
+            return cached
 
         account = (
             self.db.query(BankAccount)
@@ -143,68 +170,194 @@ class AccountService:
             "isActive": account.is_active
         }
 
-        self.redis_client.setex(
-            cache_key,
-            settings.BANK_DATA_CACHE_TTL,
-            json.dumps(info)
-        )
+        self.cache.set(cache_key, info)
 
         return info
 
-    def get_account_balance(
+    async def get_account_balance(
         self,
         user_id: int,
         account_id: str,
         bank_id: int
     ) -> Optional[Dict[str, Any]]:
+        """Баланс счёта с учётом внутреннего журнала и метаданными кеша fetchedAt/stale"""
+        balance = await self.get_bank_balance(user_id, account_id, bank_id)
+        LedgerService(self.db, self.redis_client).apply_to_balances(user_id, {account_id: balance})
+        return balance
+
+    async def get_bank_balance(
+        self,
+        user_id: int,
+        account_id: str,
+        bank_id: int
+    ) -> Optional[Dict[str, Any]]:
+        """Баланс счёта по данным банка (без внутренних платежей) с метаданными кеша"""
         cache_key = f"balance:{user_id}:{account_id}"
+        client_id = f"{settings.TEAM_CLIENT_ID}-{user_id}"
 
-        cached = self.redis_client.get(cache_key)
-        if cached:
-            logger.info(f"✅ Используем кешированный баланс для {account_id}")
-            return json.loads(cached)
+        balance, meta = await self.cache.get_or_fetch(
+            cache_key,
+            lambda: self.bank_client.get_account_balance(user_id, bank_id, account_id, client_id)
+        )
+
+        return {**balance, **meta}
+
+    async def get_balances_batch(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        account_ids: List[str],
+        cached: Optional[Dict[str, Tuple[Any, CacheMeta]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Балансы нескольких счетов за один запрос.
+        Кеш читается одним MGET, промахи группируются по банкам: в каждый банк
+        один токен и один consent, балансы счетов запрашиваются параллельно.
+        Счета и проекции журнала читаются через асинхронную сессию db.
+        cached - уже прочитанный результат cache.get_many, если вызывающий читает
+        кеш сразу для нескольких пользователей.
+        """
+        accounts = list(await db.scalars(
+            select(BankAccount).where(
+                BankAccount.user_id == user_id,
+                BankAccount.account_id.in_(account_ids)
+            )
+        ))
+        accounts_by_id = {acc.account_id: acc for acc in accounts}
 
         client_id = f"{settings.TEAM_CLIENT_ID}-{user_id}"
-        balance = self.bank_client.get_account_balance(user_id, bank_id, account_id, client_id)
+        if cached is None:
+            cached = self.cache.get_many([f"balance:{user_id}:{acc.account_id}" for acc in accounts])
 
-        self.redis_client.setex(
-            cache_key,
-            settings.BANK_DATA_CACHE_TTL,
-            json.dumps(balance)
+        balances: Dict[str, Dict[str, Any]] = {}
+        errors = []
+        misses_by_bank: Dict[int, List[str]] = {}
+
+        for acc in accounts:
+            cache_key = f"balance:{user_id}:{acc.account_id}"
+            if cache_key not in cached:
+                misses_by_bank.setdefault(acc.bank_id, []).append(acc.account_id)
+                continue
+
+            balance, meta = cached[cache_key]
+            if meta["stale"]:
+                self.cache.revalidate(
+                    cache_key,
+                    lambda acc=acc: self.bank_client.get_account_balance(user_id, acc.bank_id, acc.account_id, client_id)
+                )
+            balances[acc.account_id] = {**balance, **meta}
+
+        async def fetch_bank(bank_id: int, bank_account_ids: List[str]) -> None:
+            results = await self.bank_client.get_account_balances(user_id, bank_id, bank_account_ids, client_id)
+
+            fetched = {}
+            for account_id, result in results.items():
+                if isinstance(result, Exception):
+                    errors.append({"accountId": account_id, "clientId": bank_id, "error": str(result)})
+                else:
+                    fetched[account_id] = result
+
+            meta = self.cache.set_many({
+                f"balance:{user_id}:{account_id}": balance
+                for account_id, balance in fetched.items()
+            })
+            for account_id, balance in fetched.items():
+                balances[account_id] = {**balance, **meta}
+
+        await asyncio.gather(*[
+            fetch_bank(bank_id, bank_account_ids)
+            for bank_id, bank_account_ids in misses_by_bank.items()
+        ])
+
+        await db.run_sync(
+            lambda session: LedgerService(session, self.redis_client).apply_to_balances(user_id, balances)
         )
 
-        return balance
+        result = []
+        for account_id in account_ids:
+            acc = accounts_by_id.get(account_id)
+            if acc is None:
+                errors.append({"accountId": account_id, "clientId": None, "error": "Счёт не найден"})
+                continue
+            if account_id not in balances:
+                continue
+            result.append({
+                "accountId": acc.account_id,
+                "accountName": acc.account_name,
+                "clientId": acc.bank_id,
+                "clientName": self._get_bank_name(acc.bank_id),
+                "balance": balances[account_id]
+            })
+
+        return {
+            "balances": result,
+            "errors": errors
+        }
 
-    def get_account_transactions(
+    async def get_account_transactions(
         self,
         user_id: int,
         account_id: str,
         bank_id: int
     ) -> List[Dict[str, Any]]:
         cache_key = f"transactions:{user_id}:{account_id}"
-
-        cached = self.redis_client.get(cache_key)
-        if cached:
-            logger.info(f"✅ Используем кешированные транзакции для {account_id}")
-            return json.loads(cached)
-
         client_id = f"{settings.TEAM_CLIENT_ID}-{user_id}"
-        transactions = self.bank_client.get_account_transactions(
-            user_id,
-            bank_id,
-            account_id,
-            client_id
-        )
 
-        self.redis_client.setex(
+        transactions, _ = await self.cache.get_or_fetch(
             cache_key,
-            settings.BANK_DATA_CACHE_TTL,
-            json.dumps(transactions)
+            lambda: self.bank_client.get_account_transactions(
+                user_id,
+                bank_id,
+                account_id,
+                client_id
+            )
         )
-
         return transactions
 
-    def _get_bank_name(self, bank_id: int) -> str:
+    async def refresh_account_data(
+        self,
+        user_id: int,
+        account_id: str,
+        bank_id: int,
+        ahead: int = 0
+    ) -> None:
+        """
+        Обновить кеш баланса и транзакций счёта и догрузить транзакции в БД.
+        Кеш обновляется, если до мягкого TTL осталось меньше ahead секунд.
+        """
+        client_id = f"{settings.TEAM_CLIENT_ID}-{user_id}"
+        refresh_after = self.cache.soft_ttl - ahead
+
+        balance_key = f"balance:{user_id}:{account_id}"
+        balance_age = self.cache.age(balance_key)
+        if balance_age is None or balance_age >= refresh_after:
+            await self.cache.refresh(
+                balance_key,
+                lambda: self.bank_client.get_account_balance(user_id, bank_id, account_id, client_id)
+            )
+
+        transactions_key = f"transactions:{user_id}:{account_id}"
+        transactions_age = self.cache.age(transactions_key)
+        if transactions_age is None or transactions_age >= refresh_after:
+            await self.cache.refresh(
+                transactions_key,
+                lambda: self.bank_client.get_account_transactions(user_id, bank_id, account_id, client_id)
+            )
+
+        await TransactionSyncService(self.db, self.redis_client).sync_account(user_id, bank_id, account_id)
+
+    @staticmethod
+    def _merge_meta(metas: List[CacheMeta]) -> CacheMeta:
+        """Общие метаданные для набора счетов: самые старые данные и есть ли устаревшие"""
+        if not metas:
+            return {"fetchedAt": None, "stale": False}
+        return {
+            "fetchedAt": min(meta["fetchedAt"] for meta in metas),
+            "stale": any(meta["stale"] for meta in metas)
+        }
+
+    @staticmethod
+    def _get_bank_name(bank_id: int) -> str:
         bank_names = {
             1: "vbank",
             2: "sbank",
@@ -212,140 +365,156 @@ class AccountService:
         }
         return bank_names.get(bank_id, f"bank{bank_id}")
 
-    def get_all_user_balances(
+    async def get_all_user_balances(
         self,
         user_id: int,
         bank_ids: Optional[List[int]] = None
     ) -> Dict[str, Any]:
         """
         Получить балансы всех счетов пользователя.
-        Оптимизировано для избежания N+1 проблемы.
+        Запросы к банкам выполняются параллельно, недоступные счета попадают в errors.
         """
         accounts = self.get_user_accounts(user_id, None)
 
         if bank_ids:
             accounts = [acc for acc in accounts if acc["clientId"] in bank_ids]
 
+        results, errors = await fan_out(
+            accounts,
+            lambda account: self.get_bank_balance(
+                user_id,
+                account["accountId"],
+                account["clientId"]
+            )
+        )
+        LedgerService(self.db, self.redis_client).apply_to_balances(
+            user_id,
+            {account["accountId"]: balance for account, balance in results}
+        )
+
         balances_data = []
         total_balance = {}
 
-        for account in accounts:
-            try:
-                balance = self.get_account_balance(
-                    user_id,
-                    account["accountId"],
-                    account["clientId"]
-                )
-
-                balance_item = {
-                    "accountId": account["accountId"],
-                    "accountName": account["accountName"],
-                    "clientId": account["clientId"],
-                    "clientName": account["clientName"],
-                    "balance": balance
-                }
-                balances_data.append(balance_item)
-
-                currency = balance.get("currency", "RUB")
-                amount = balance.get("amount", 0)
+        for account, balance in results:
+            balances_data.append({
+                "accountId": account["accountId"],
+                "accountName": account["accountName"],
+                "clientId": account["clientId"],
+                "clientName": account["clientName"],
+                "balance": balance
+            })
 
-                if currency not in total_balance:
-                    total_balance[currency] = 0
-                total_balance[currency] += amount
+            currency = balance.get("currency", "RUB")
+            amount = balance.get("amount", 0)
 
-            except Exception as e:
-                logger.error(f"Ошибка получения баланса для {account['accountId']}: {e}")
-                continue
+            if currency not in total_balance:
+                total_balance[currency] = 0
+            total_balance[currency] += amount
 
         return {
             "accounts": balances_data,
             "total": [{"currency": curr, "amount": amt} for curr, amt in total_balance.items()],
-            "count": len(balances_data)
+            "count": len(balances_data),
+            "errors": errors,
+            **self._merge_meta([balance for _, balance in results])
         }
 
-    def get_all_user_transactions(
-        self,
+    @classmethod
+    async def get_all_user_transactions(
+        cls,
+        db: AsyncSession,
+        redis_client: redis.Redis,
         user_id: int,
-        bank_ids: Optional[List[int]] = None,
-        offset: int = 0,
+        filters: Optional[TransactionFeedFilters] = None,
         limit: int = 20,
-        start_date: Optional[str] = None,
-        end_date: Optional[str] = None
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Получить транзакции всех счетов пользователя с пагинацией и фильтрацией.
-        Оптимизировано для избежания N+1 проблемы.
+        Лента транзакций всех счетов пользователя из таблицы transactions.
+        Фильтры применяются в SQL, пагинация keyset по (booking_date, id), поэтому
+        любая страница читается по индексу без OFFSET и подсчёта общего количества.
+        В банк запрос не ходит: данные догружает фоновая синхронизация, а счета,
+        которые давно не синхронизировались, ставятся на догрузку в фоне.
         """
-        from datetime import datetime
-
-        accounts = self.get_user_accounts(user_id, None)
-
-        if bank_ids:
-            accounts = [acc for acc in accounts if acc["clientId"] in bank_ids]
-
-        all_transactions = []
-
-        for account in accounts:
-            try:
-                transactions = self.get_account_transactions(
-                    user_id,
-                    account["accountId"],
-                    account["clientId"]
-                )
-
-                for txn in transactions:
-                    txn["accountId"] = account["accountId"]
-                    txn["accountName"] = account["accountName"]
-                    txn["clientId"] = account["clientId"]
-                    txn["clientName"] = account["clientName"]
-
-                all_transactions.extend(transactions)
-
-            except Exception as e:
-                logger.error(f"Ошибка получения транзакций для {account['accountId']}: {e}")
-                continue
-
-        if start_date or end_date:
-            filtered_transactions = []
-            for txn in all_transactions:
-                txn_date_str = txn.get("date", "")
-                if not txn_date_str:
-                    continue
-
-                try:
-                    txn_date = datetime.fromisoformat(txn_date_str.replace('Z', '+00:00'))
-                    txn_date_only = txn_date.date()
+        filters = filters or TransactionFeedFilters()
 
-                    if start_date:
-                        start = datetime.strptime(start_date, "%Y-%m-%d").date()
-                        if txn_date_only < start:
-                            continue
+        accounts = await cls.get_user_accounts_async(db, user_id, None)
 
-                    if end_date:
-                        end = datetime.strptime(end_date, "%Y-%m-%d").date()
-                        if txn_date_only > end:
-                            continue
+        if filters.bank_ids:
+            accounts = [acc for acc in accounts if acc["clientId"] in filters.bank_ids]
+        if filters.account_ids:
+            accounts = [acc for acc in accounts if acc["accountId"] in filters.account_ids]
 
-                    filtered_transactions.append(txn)
+        spawn_sync_accounts(redis_client, user_id, accounts, settings.TRANSACTION_SYNC_MIN_INTERVAL)
 
-                except Exception as e:
-                    logger.warning(f"Ошибка парсинга даты {txn_date_str}: {e}")
-                    filtered_transactions.append(txn)
+        accounts_by_id = {acc["accountId"]: acc for acc in accounts}
 
-            all_transactions = filtered_transactions
+        query = select(Transaction).where(
+            Transaction.user_id == user_id,
+            Transaction.account_id.in_(list(accounts_by_id.keys()))
+        )
 
-        all_transactions.sort(key=lambda x: x.get("date", ""), reverse=True)
+        if filters.bank_ids:
+            query = query.where(Transaction.bank_id.in_(filters.bank_ids))
+        if filters.categories:
+            query = query.where(Transaction.category.in_(filters.categories))
+        if filters.direction:
+            query = query.where(Transaction.direction == filters.direction)
+        if filters.start_date:
+            start = datetime.combine(filters.start_date, datetime.min.time(), tzinfo=timezone.utc)
+            query = query.where(Transaction.booking_date >= start)
+        if filters.end_date:
+            end = datetime.combine(filters.end_date, datetime.min.time(), tzinfo=timezone.utc) + timedelta(days=1)
+            query = query.where(Transaction.booking_date < end)
+        if filters.min_amount is not None:
+            query = query.where(Transaction.amount >= filters.min_amount)
+        if filters.max_amount is not None:
+            query = query.where(Transaction.amount <= filters.max_amount)
+
+        if cursor:
+            position = decode_cursor(cursor)
+            try:
+                after = (datetime.fromisoformat(position["date"]), int(position["id"]))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Неверный курсор пагинации")
+            query = query.where(tuple_(Transaction.booking_date, Transaction.id) < after)
+
+        rows = list(await db.scalars(
+            query.order_by(Transaction.booking_date.desc(), Transaction.id.desc())
+            .limit(limit + 1)
+        ))
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        transactions = []
+        for row in rows:
+            account = accounts_by_id[row.account_id]
+            transactions.append({
+                "id": row.transaction_id,
+                "date": row.booking_date.isoformat(),
+                "description": row.description,
+                "amount": float(row.amount),
+                "currency": row.currency,
+                "type": row.direction,
+                "category": row.category,
+                "mccCode": row.mcc_code or "",
+                "accountId": account["accountId"],
+                "accountName": account["accountName"],
+                "clientId": account["clientId"],
+                "clientName": account["clientName"]
+            })
 
-        total_count = len(all_transactions)
-        paginated_transactions = all_transactions[offset:offset + limit]
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor({"date": rows[-1].booking_date.isoformat(), "id": rows[-1].id})
 
         return {
-            "transactions": paginated_transactions,
+            "transactions": transactions,
             "pagination": {
-                "offset": offset,
                 "limit": limit,
-                "total": total_count,
-                "hasMore": offset + limit < total_count
+                "hasMore": has_more,
+                "nextCursor": next_cursor
             }
         }
     
@@ -369,11 +538,12 @@ class AccountService:
         
         account.account_name = new_name
         self.db.commit()
+        bump_account_data_version(self.redis_client, user_id)
         
         logger.info(f"Счёт {account_id} переименован в '{new_name}'")
         return True, None
     
-    def force_sync_account(
+    async def force_sync_account(
         self,
         user_id: int,
         account_id: int
@@ -390,18 +560,20 @@ class AccountService:
         if not account:
             return None, "Счёт не найден"
         
-        cache_keys = [
+        self.cache.invalidate(
             f"balance:{user_id}:{account.account_id}",
             f"transactions:{user_id}:{account.account_id}",
             f"account_info:{user_id}:{account.account_id}"
-        ]
-        
-        for key in cache_keys:
-            self.redis_client.delete(key)
+        )
         
         try:
-            balance = self.get_account_balance(user_id, account.account_id, account.bank_id)
-            transactions = self.get_account_transactions(user_id, account.account_id, account.bank_id)
+            balance = await self.get_account_balance(user_id, account.account_id, account.bank_id)
+            transactions = await self.get_account_transactions(user_id, account.account_id, account.bank_id)
+            await TransactionSyncService(self.db, self.redis_client).sync_account(
+                user_id,
+                account.bank_id,
+                account.account_id
+            )
             
             logger.info(f"Счёт {account_id} синхронизирован принудительно")
             
@@ -1,216 +1,127 @@
 import logging
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Dict, Any, List
-from datetime import datetime, timedelta
+from sqlalchemy.sql import func
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta, timezone
 import redis
 
+from src.config import settings
 from src.services.account_service import AccountService
-from src.constants.mcc_mapping import categorize_transaction, CATEGORY_NAMES_RU
+from src.services.ledger_service import LedgerService
+from src.services.spending_aggregate_service import SpendingAggregateService, month_start, payment_category, to_utc
+from src.services.transaction_sync_service import spawn_sync_accounts
+from src.utils.analytics_kernel import CATEGORIES, month_index, percent_change, shares, sum_by_month_category, top_n
+from src.utils.fanout import fan_out
+from src.constants.mcc_mapping import CATEGORY_NAMES_RU
 from src.constants.constants import TransactionCategory
-from src.models.payment import Payment, PaymentType, PaymentStatus
+from src.models.payment import Payment, PaymentStatus
+from src.models.transaction import Transaction
 
 logger = logging.getLogger(__name__)
 
 class AnalyticsService:
     
-    def __init__(self, db: Session, redis_client: redis.Redis):
+    def __init__(self, db: Session, redis_client: redis.Redis, async_db: AsyncSession):
+        """
+        db - синхронная сессия для проекций внутреннего журнала (LedgerService),
+        async_db - асинхронная для чтения счетов и агрегатов. Запросы агрегатов
+        выполняются через run_sync: тот же ORM-код, но ввод-вывод идёт через asyncpg
+        """
         self.db = db
+        self.async_db = async_db
         self.redis_client = redis_client
         self.account_service = AccountService(db, redis_client)
     
-    def get_user_overview(
+    async def get_user_overview(
         self,
         user_id: int,
         bank_ids: List[int] = None
     ) -> Dict[str, Any]:
         """
-        Обзорная аналитика пользователя: балансы, доходы, расходы
+        Обзорная аналитика пользователя: балансы, доходы, расходы.
+        Доходы и расходы читаются из месячных агрегатов (monthly_spending_aggregates),
+        давно не синхронизированные счета догружаются в фоне.
         """
-        accounts = self.account_service.get_user_accounts(user_id, None)
+        accounts = await AccountService.get_user_accounts_async(self.async_db, user_id)
         
         if bank_ids:
             accounts = [acc for acc in accounts if acc["clientId"] in bank_ids]
         
+        spawn_sync_accounts(self.redis_client, user_id, accounts, settings.TRANSACTION_SYNC_MIN_INTERVAL)
+        
+        balance_results, balance_errors = await fan_out(
+            accounts,
+            lambda account: self.account_service.get_bank_balance(
+                user_id,
+                account["accountId"],
+                account["clientId"]
+            )
+        )
+        LedgerService(self.db, self.redis_client).apply_to_balances(
+            user_id,
+            {account["accountId"]: balance for account, balance in balance_results}
+        )
+        
         total_balance = 0.0
         balances_by_currency = {}
         
-        for account in accounts:
-            try:
-                balance = self.account_service.get_account_balance(
-                    user_id,
-                    account["accountId"],
-                    account["clientId"]
-                )
-                
-                amount = balance.get("amount", 0)
-                currency = balance.get("currency", "RUB")
-                
-                total_balance += amount
-                
-                if currency not in balances_by_currency:
-                    balances_by_currency[currency] = 0
-                balances_by_currency[currency] += amount
-                
-            except Exception as e:
-                logger.error(f"Ошибка получения баланса: {e}")
-                continue
-        
-        current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        previous_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
-        
-        current_expenses = 0.0
-        current_income = 0.0
-        previous_expenses = 0.0
-        previous_income = 0.0
-        
-        category_totals = {}
-        
-        # Обрабатываем транзакции из Bank API
-        for account in accounts:
-            try:
-                transactions = self.account_service.get_account_transactions(
-                    user_id,
-                    account["accountId"],
-                    account["clientId"]
-                )
-                
-                for txn in transactions:
-                    try:
-                        txn_date = datetime.fromisoformat(txn["date"].replace('Z', '+00:00'))
-                        amount = abs(txn["amount"])
-                        txn_type = txn.get("type", "debit")
-                        
-                        category = categorize_transaction(
-                            txn.get("mccCode", ""),
-                            txn.get("description", "")
-                        )
-                        
-                        if txn_date >= current_month_start:
-                            if txn_type == "debit":
-                                current_expenses += amount
-                                
-                                if category not in category_totals:
-                                    category_totals[category] = 0
-                                category_totals[category] += amount
-                            else:
-                                current_income += amount
-                        
-                        elif txn_date >= previous_month_start and txn_date < current_month_start:
-                            if txn_type == "debit":
-                                previous_expenses += amount
-                            else:
-                                previous_income += amount
-                    
-                    except Exception as e:
-                        logger.warning(f"Ошибка обработки транзакции: {e}")
-                        continue
-                
-            except Exception as e:
-                logger.error(f"Ошибка получения транзакций: {e}")
-                continue
-        
-        # Обрабатываем внутренние платежи (Payment модель)
-        try:
-            from sqlalchemy import or_
-            internal_payments = self.db.query(Payment).filter(
-                or_(
-                    Payment.user_id == user_id,  # Исходящие платежи
-                    Payment.to_user_id == user_id  # Входящие платежи
-                ),
-                Payment.status == PaymentStatus.COMPLETED,
-                Payment.completed_at.isnot(None)
-            ).all()
+        for account, balance in balance_results:
+            amount = balance.get("amount", 0)
+            currency = balance.get("currency", "RUB")
             
-            for payment in internal_payments:
-                try:
-                    payment_date = payment.completed_at
-                    if not payment_date:
-                        payment_date = payment.created_at
-                    
-                    amount = float(payment.amount)
-                    
-                    # Определяем, это доход или расход
-                    is_incoming = payment.to_user_id == user_id if payment.to_user_id else False
-                    is_outgoing = payment.user_id == user_id
-                    
-                    if payment_date >= current_month_start:
-                        if is_outgoing:
-                            # Исходящий платеж - это расход
-                            current_expenses += amount
-                            
-                            # Определяем категорию по типу платежа
-                            category = TransactionCategory.OTHER
-                            if payment.payment_type == PaymentType.UTILITIES:
-                                category = TransactionCategory.UTILITIES
-                            elif payment.payment_type == PaymentType.MOBILE or payment.payment_type == PaymentType.PHONE:
-                                category = TransactionCategory.COMMUNICATIONS
-                            elif payment.payment_type == PaymentType.INTERNET:
-                                category = TransactionCategory.COMMUNICATIONS
-                            elif payment.payment_type == PaymentType.TV:
-                                category = TransactionCategory.ENTERTAINMENT
-                            elif payment.payment_type == PaymentType.ELECTRICITY:
-                                category = TransactionCategory.UTILITIES
-                            elif payment.payment_type == PaymentType.PREMIUM:
-                                category = TransactionCategory.OTHER
-                            elif payment.payment_type == PaymentType.TO_PERSON or payment.payment_type == PaymentType.CARD_TO_CARD:
-                                category = TransactionCategory.TRANSFERS
-                            
-                            if category not in category_totals:
-                                category_totals[category] = 0
-                            category_totals[category] += amount
-                        elif is_incoming:
-                            # Входящий платеж - это доход
-                            current_income += amount
-                    
-                    elif payment_date >= previous_month_start and payment_date < current_month_start:
-                        if is_outgoing:
-                            previous_expenses += amount
-                        elif is_incoming:
-                            previous_income += amount
-                
-                except Exception as e:
-                    logger.warning(f"Ошибка обработки внутреннего платежа: {e}")
-                    continue
-        
-        except Exception as e:
-            logger.error(f"Ошибка получения внутренних платежей: {e}")
-        
-        top_categories = sorted(
-            [
-                {
-                    "category": cat.value,
-                    "categoryName": CATEGORY_NAMES_RU.get(cat, cat.value),
-                    "amount": amount,
-                    "percentage": round((amount / current_expenses * 100) if current_expenses > 0 else 0, 1)
-                }
-                for cat, amount in category_totals.items()
-            ],
-            key=lambda x: x["amount"],
-            reverse=True
-        )[:5]
-        
-        expense_change = 0.0
-        if previous_expenses > 0:
-            expense_change = round(((current_expenses - previous_expenses) / previous_expenses) * 100, 1)
-        
-        income_change = 0.0
-        if previous_income > 0:
-            income_change = round(((current_income - previous_income) / previous_income) * 100, 1)
+            total_balance += amount
+            
+            if currency not in balances_by_currency:
+                balances_by_currency[currency] = 0
+            balances_by_currency[currency] += amount
+        
+        current_month = month_start(datetime.now(timezone.utc))
+        previous_month = (current_month - timedelta(days=1)).replace(day=1)
+        
+        columns = await self.async_db.run_sync(
+            lambda session: SpendingAggregateService(session).load_columns(
+                user_id, [previous_month, current_month], bank_ids
+            )
+        )
+        months = [month_index(previous_month), month_index(current_month)]
+        expenses, _ = sum_by_month_category(columns, months, columns.debit)
+        income, _ = sum_by_month_category(columns, months, ~columns.debit)
+        
+        (previous_expenses, current_expenses) = expenses.sum(axis=1)
+        (previous_income, current_income) = income.sum(axis=1)
+        expense_change, income_change = percent_change(
+            [current_expenses, current_income],
+            [previous_expenses, previous_income]
+        )
+        
+        current_categories = expenses[1]
+        category_shares = shares(current_categories)
+        top_categories = [
+            {
+                "category": CATEGORIES[code].value,
+                "categoryName": CATEGORY_NAMES_RU.get(CATEGORIES[code], CATEGORIES[code].value),
+                "amount": float(current_categories[code]),
+                "percentage": float(category_shares[code])
+            }
+            for code in top_n(current_categories, 5)
+        ]
         
         return {
             "totalBalance": total_balance,
             "balanceByCurrency": balances_by_currency,
             "currentMonth": {
-                "expenses": current_expenses,
-                "income": current_income,
-                "expenseChange": expense_change,
-                "incomeChange": income_change
+                "expenses": float(current_expenses),
+                "income": float(current_income),
+                "expenseChange": float(expense_change),
+                "incomeChange": float(income_change)
             },
             "topCategories": top_categories,
-            "accountsCount": len(accounts)
+            "accountsCount": len(accounts),
+            "errors": balance_errors
         }
     
-    def get_categories_breakdown(
+    async def get_categories_breakdown(
         self,
         user_id: int,
         start_date: str = None,
@@ -219,145 +130,116 @@ class AnalyticsService:
         """
         Детальная разбивка расходов по категориям
         """
-        accounts = self.account_service.get_user_accounts(user_id, None)
-        
-        category_data = {}
-        
-        # Обрабатываем транзакции из Bank API
-        for account in accounts:
-            try:
-                transactions = self.account_service.get_account_transactions(
-                    user_id,
-                    account["accountId"],
-                    account["clientId"]
-                )
-                
-                for txn in transactions:
-                    try:
-                        txn_date = datetime.fromisoformat(txn["date"].replace('Z', '+00:00'))
-                        
-                        if start_date:
-                            start = datetime.fromisoformat(start_date)
-                            if txn_date < start:
-                                continue
-                        
-                        if end_date:
-                            end = datetime.fromisoformat(end_date)
-                            if txn_date > end:
-                                continue
-                        
-                        if txn.get("type") == "debit":
-                            category = categorize_transaction(
-                                txn.get("mccCode", ""),
-                                txn.get("description", "")
-                            )
-                            
-                            if category not in category_data:
-                                category_data[category] = {
-                                    "amount": 0,
-                                    "count": 0,
-                                    "transactions": []
-                                }
-                            
-                            category_data[category]["amount"] += abs(txn["amount"])
-                            category_data[category]["count"] += 1
-                            category_data[category]["transactions"].append({
-                                "id": txn["id"],
-                                "date": txn["date"],
-                                "description": txn["description"],
-                                "amount": abs(txn["amount"])
-                            })
-                    
-                    except Exception as e:
-                        logger.warning(f"Ошибка обработки транзакции: {e}")
-                        continue
-            
-            except Exception as e:
-                logger.error(f"Ошибка получения транзакций: {e}")
-                continue
+        accounts = await AccountService.get_user_accounts_async(self.async_db, user_id)
+        spawn_sync_accounts(self.redis_client, user_id, accounts, settings.TRANSACTION_SYNC_MIN_INTERVAL)
         
-        # Обрабатываем внутренние платежи (Payment модель) - только исходящие (расходы)
         try:
-            from sqlalchemy import or_
-            internal_payments = self.db.query(Payment).filter(
-                Payment.user_id == user_id,  # Только исходящие платежи
-                Payment.status == PaymentStatus.COMPLETED,
-                Payment.completed_at.isnot(None)
-            ).all()
-            
-            for payment in internal_payments:
-                try:
-                    payment_date = payment.completed_at
-                    if not payment_date:
-                        payment_date = payment.created_at
-                    
-                    if start_date:
-                        start = datetime.fromisoformat(start_date)
-                        if payment_date < start:
-                            continue
-                    
-                    if end_date:
-                        end = datetime.fromisoformat(end_date)
-                        if payment_date > end:
-                            continue
-                    
-                    # Определяем категорию по типу платежа
-                    category = TransactionCategory.OTHER
-                    if payment.payment_type == PaymentType.UTILITIES:
-                        category = TransactionCategory.UTILITIES
-                    elif payment.payment_type == PaymentType.MOBILE or payment.payment_type == PaymentType.PHONE:
-                        category = TransactionCategory.COMMUNICATIONS
-                    elif payment.payment_type == PaymentType.INTERNET:
-                        category = TransactionCategory.COMMUNICATIONS
-                    elif payment.payment_type == PaymentType.TV:
-                        category = TransactionCategory.ENTERTAINMENT
-                    elif payment.payment_type == PaymentType.ELECTRICITY:
-                        category = TransactionCategory.UTILITIES
-                    elif payment.payment_type == PaymentType.PREMIUM:
-                        category = TransactionCategory.OTHER
-                    elif payment.payment_type == PaymentType.TO_PERSON or payment.payment_type == PaymentType.CARD_TO_CARD:
-                        category = TransactionCategory.TRANSFERS
-                    
-                    if category not in category_data:
-                        category_data[category] = {
-                            "amount": 0,
-                            "count": 0,
-                            "transactions": []
-                        }
-                    
-                    amount = float(payment.amount)
-                    category_data[category]["amount"] += amount
-                    category_data[category]["count"] += 1
-                    category_data[category]["transactions"].append({
-                        "id": f"payment_{payment.id}",
-                        "date": payment_date.isoformat(),
-                        "description": payment.description or f"Платеж {payment.payment_type.value}",
-                        "amount": amount
-                    })
-                
-                except Exception as e:
-                    logger.warning(f"Ошибка обработки внутреннего платежа: {e}")
-                    continue
-        
-        except Exception as e:
-            logger.error(f"Ошибка получения внутренних платежей: {e}")
+            start = datetime.fromisoformat(start_date) if start_date else None
+            end = datetime.fromisoformat(end_date) if end_date else None
+        except ValueError as e:
+            logger.warning(f"Неверный период разбивки по категориям: {e}")
+            return []
+        
+        totals = await self.async_db.run_sync(
+            lambda session: SpendingAggregateService(session).get_category_totals(user_id, start, end)
+        )
+        category_data = {
+            category: bucket for category, bucket in totals.items()
+            if bucket["expenses"] > 0
+        }
+        top_transactions = await self.async_db.run_sync(self._get_top_expenses, user_id, start, end)
         
-        total_amount = sum(data["amount"] for data in category_data.values())
+        total_amount = sum(data["expenses"] for data in category_data.values())
         
         result = []
         for category, data in category_data.items():
             result.append({
-                "category": category.value,
-                "categoryName": CATEGORY_NAMES_RU.get(category, category.value),
-                "amount": data["amount"],
-                "count": data["count"],
-                "percentage": round((data["amount"] / total_amount * 100) if total_amount > 0 else 0, 1),
-                "topTransactions": sorted(data["transactions"], key=lambda x: x["amount"], reverse=True)[:5]
+                "category": category,
+                "categoryName": CATEGORY_NAMES_RU.get(category, category),
+                "amount": data["expenses"],
+                "count": data["expenseCount"],
+                "percentage": round((data["expenses"] / total_amount * 100) if total_amount > 0 else 0, 1),
+                "topTransactions": top_transactions.get(category, [])
             })
         
         return sorted(result, key=lambda x: x["amount"], reverse=True)
     
-    def get_advanced_insights(
+    @staticmethod
+    def _get_top_expenses(
+        session: Session,
+        user_id: int,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        limit: int = 5
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Крупнейшие расходы каждой категории за период: отбор делает БД оконной функцией"""
+        txn_rank = func.row_number().over(
+            partition_by=Transaction.category,
+            order_by=func.abs(Transaction.amount).desc()
+        ).label("rank")
+        txn_query = session.query(
+            Transaction.transaction_id,
+            Transaction.booking_date,
+            Transaction.description,
+            Transaction.amount,
+            Transaction.category,
+            txn_rank
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.direction == "debit"
+        )
+        if start:
+            txn_query = txn_query.filter(Transaction.booking_date >= to_utc(start))
+        if end:
+            txn_query = txn_query.filter(Transaction.booking_date <= to_utc(end))
+        txn_ranked = txn_query.subquery()
+        
+        top: Dict[str, List[Dict[str, Any]]] = {}
+        for row in session.query(txn_ranked).filter(txn_ranked.c.rank <= limit):
+            top.setdefault(row.category or TransactionCategory.OTHER.value, []).append({
+                "id": row.transaction_id,
+                "date": row.booking_date.isoformat(),
+                "description": row.description,
+                "amount": abs(float(row.amount))
+            })
+        
+        # Внутренние платежи: категория определяется типом платежа
+        payment_rank = func.row_number().over(
+            partition_by=Payment.payment_type,
+            order_by=Payment.amount.desc()
+        ).label("rank")
+        payment_query = session.query(
+            Payment.id,
+            Payment.payment_type,
+            Payment.amount,
+            Payment.description,
+            Payment.completed_at,
+            payment_rank
+        ).filter(
+            Payment.user_id == user_id,
+            Payment.status == PaymentStatus.COMPLETED,
+            Payment.completed_at.isnot(None)
+        )
+        if start:
+            payment_query = payment_query.filter(Payment.completed_at >= to_utc(start).replace(tzinfo=None))
+        if end:
+            payment_query = payment_query.filter(Payment.completed_at <= to_utc(end).replace(tzinfo=None))
+        payment_ranked = payment_query.subquery()
+        
+        for row in session.query(payment_ranked).filter(payment_ranked.c.rank <= limit):
+            top.setdefault(payment_category(row.payment_type).value, []).append({
+                "id": f"payment_{row.id}",
+                "date": row.completed_at.isoformat(),
+                "description": row.description or f"Платеж {row.payment_type.value}",
+                "amount": float(row.amount)
+            })
+        
+        return {
+            category: sorted(items, key=lambda x: x["amount"], reverse=True)[:limit]
+            for category, items in top.items()
+        }
+    
+    async def get_advanced_insights(
         self,
         user_id: int,
         bank_ids: List[int] = None
@@ -365,8 +247,8 @@ class AnalyticsService:
         """
         Расширенная аналитика с выводами и советами
         """
-        overview = self.get_user_overview(user_id, bank_ids)
-        categories = self.get_categories_breakdown(user_id)
+        overview = await self.get_user_overview(user_id, bank_ids)
+        categories = await self.get_categories_breakdown(user_id)
         
         current_month = overview.get("currentMonth", {})
         expenses = current_month.get("expenses", 0)
@@ -1,19 +1,36 @@
+import asyncio
+import json
 import logging
+import time
 import httpx
-from typing import Dict, Any, Optional, List
-import redis
+from typing import Dict, Any, Optional, List, Tuple
+import redis.asyncio as aioredis
 from datetime import datetime, timedelta
 
 from src.config import settings
 from src.constants.bank_config import get_bank_url, get_bank_name
+from src.http_client import BankHttpPool, get_bank_http_pool
+from src.redis_client import acquire_lock_async, release_lock_async
+from src.services.circuit_breaker import BankCircuitBreaker, CircuitOpenError
+from src.services.consent_registry import ConsentRegistry
+from src.utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-class BankClient:
+# Один запрос токена на (user_id, bank_id) внутри процесса
+_token_flight = SingleFlight()
 
-    def __init__(self, redis_client: redis.Redis):
+class AsyncBankClient:
+    """
+    Клиент банковских API. Токены, последние известные ответы, consent и состояние
+    circuit breaker хранятся в Redis и читаются через общий асинхронный пул.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis, http_pool: Optional[BankHttpPool] = None):
         self.redis_client = redis_client
-        self.timeout = httpx.Timeout(30.0, connect=10.0)
+        self.http_pool = http_pool or get_bank_http_pool()
+        self.circuit_breaker = BankCircuitBreaker(redis_client)
+        self.consents = ConsentRegistry(redis_client, self)
 
     def _get_bank_config(self, bank_id: int) -> Dict[str, str]:
         return {
@@ -23,14 +40,119 @@ class BankClient:
             "client_secret": settings.TEAM_CLIENT_SECRET
         }
 
-    def get_bank_token(self, user_id: int, bank_id: int) -> str:
+    async def _send(
+        self,
+        bank_id: int,
+        endpoint: str,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Запрос в банк через circuit breaker: при открытом breaker запрос не уходит,
+        таймаут подбирается по наблюдаемой задержке эндпоинта.
+        """
+        allowed, timeout, probe = await self.circuit_breaker.check(bank_id, endpoint)
+        if not allowed:
+            raise CircuitOpenError(f"Банк {bank_id} временно недоступен")
+
+        client = self.http_pool.get_client(get_bank_url(bank_id))
+        started = time.monotonic()
+        recorded = False
+
+        try:
+            response = await client.request(method, url, timeout=timeout, **kwargs)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code >= 500 or e.response.status_code == 429:
+                await self.circuit_breaker.record_failure(bank_id, endpoint, str(e))
+            else:
+                # 4xx - ошибка запроса, но банк ответил: для breaker это успех
+                await self.circuit_breaker.record_success(bank_id, endpoint, time.monotonic() - started)
+            recorded = True
+            raise
+        except httpx.TransportError as e:
+            await self.circuit_breaker.record_failure(bank_id, endpoint, repr(e))
+            recorded = True
+            raise
+        else:
+            await self.circuit_breaker.record_success(bank_id, endpoint, time.monotonic() - started)
+            recorded = True
+        finally:
+            # Отмена, ошибка декодирования ответа и т.п.: вердикта нет, но пробу
+            # half-open нельзя оставлять занятой до истечения лиза
+            if probe and not recorded:
+                await self.circuit_breaker.release_probe(bank_id)
+
+        return response
+
+    async def _save_last_known(self, key: str, value: Any) -> None:
+        await self.redis_client.setex(f"bank_last:{key}", settings.BANK_LAST_KNOWN_TTL, json.dumps(value))
+
+    async def _get_last_known(self, key: str) -> Optional[Any]:
+        cached = await self.redis_client.get(f"bank_last:{key}")
+        return json.loads(cached) if cached else None
+
+    async def get_bank_token(self, user_id: int, bank_id: int) -> str:
         token_key = f"bank_token:{user_id}:{bank_id}"
 
-        cached_token = self.redis_client.get(token_key)
+        pipe = self.redis_client.pipeline()
+        pipe.get(token_key)
+        pipe.ttl(token_key)
+        cached_token, ttl = await pipe.execute()
+
         if cached_token:
+            if 0 <= ttl < settings.BANK_TOKEN_REFRESH_MARGIN:
+                logger.info(f"🔄 Токен для банка {bank_id} скоро истечёт, обновляем в фоне")
+                _token_flight.spawn(
+                    (user_id, bank_id),
+                    lambda: self._acquire_bank_token(user_id, bank_id, refresh=True)
+                )
             logger.info(f"✅ Используем кешированный токен для банка {bank_id}")
             return cached_token
 
+        return await _token_flight.do(
+            (user_id, bank_id),
+            lambda: self._acquire_bank_token(user_id, bank_id)
+        )
+
+    async def _acquire_bank_token(self, user_id: int, bank_id: int, refresh: bool = False) -> str:
+        """
+        Получить токен под Redis-локом, чтобы между воркерами в банк
+        уходил только один запрос на (user, bank). Остальные ждут, пока токен
+        появится в кеше.
+        """
+        token_key = f"bank_token:{user_id}:{bank_id}"
+        lock_key = f"bank_token_lock:{user_id}:{bank_id}"
+        loop = asyncio.get_running_loop()
+        wait_until = loop.time() + settings.bank_token_lock_wait
+
+        while True:
+            lock_token = await acquire_lock_async(self.redis_client, lock_key, settings.bank_token_lock_lease_ms)
+            if lock_token:
+                try:
+                    if not refresh:
+                        cached_token = await self.redis_client.get(token_key)
+                        if cached_token:
+                            return cached_token
+                    return await self._request_bank_token(user_id, bank_id)
+                finally:
+                    await release_lock_async(self.redis_client, lock_key, lock_token)
+
+            cached_token = await self.redis_client.get(token_key)
+            if cached_token:
+                # Токен уже получил (или обновляет) другой воркер
+                return cached_token
+
+            if loop.time() >= wait_until:
+                logger.warning(f"⚠️  Не дождались токена банка {bank_id} от другого воркера, запрашиваем сами")
+                return await self._request_bank_token(user_id, bank_id)
+
+            await asyncio.sleep(0.1)
+
+    async def _request_bank_token(self, user_id: int, bank_id: int) -> str:
+        token_key = f"bank_token:{user_id}:{bank_id}"
+
         bank_config = self._get_bank_config(bank_id)
         url = f"{bank_config['base_url']}/auth/bank-token"
 
@@ -40,20 +162,18 @@ class BankClient:
         }
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, params=params)
-                response.raise_for_status()
+            response = await self._send(bank_id, "token", "POST", url, params=params)
 
-                data = response.json()
-                token = data.get("access_token")
+            data = response.json()
+            token = data.get("access_token")
 
-                if not token:
-                    raise ValueError("Токен не получен от банка")
+            if not token:
+                raise ValueError("Токен не получен от банка")
 
-                self.redis_client.setex(token_key, 82800, token)
+            await self.redis_client.setex(token_key, settings.BANK_TOKEN_TTL, token)
 
-                logger.info(f"✅ Получен новый токен для банка {bank_id} ({bank_config['name']})")
-                return token
+            logger.info(f"✅ Получен новый токен для банка {bank_id} ({bank_config['name']})")
+            return token
 
         except Exception as e:
             logger.error(f"❌ Ошибка получения токена от банка {bank_id}: {e}")
@@ -63,15 +183,19 @@ class BankClient:
                 return mock_token
             raise
 
-    def create_consent(
+    async def create_consent(
         self,
         user_id: int,
         bank_id: int,
         client_id: str,
         permissions: List[str]
-    ) -> str:
+    ) -> Optional[str]:
+        """
+        Запросить согласие в банке. Возвращает consent_id только одобренного согласия;
+        если банк не ответил или согласие ждёт ручного подтверждения - None.
+        """
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/account-consents/request"
 
@@ -90,93 +214,84 @@ class BankClient:
         }
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, headers=headers, json=body)
-                response.raise_for_status()
+            response = await self._send(bank_id, "consent", "POST", url, headers=headers, json=body)
 
-                data = response.json()
-                consent_id = data.get("consent_id")
-                consent_status = data.get("status", "unknown")
+            data = response.json()
+            consent_id = data.get("consent_id")
+            consent_status = data.get("status", "unknown")
 
-                if not consent_id:
-                    if consent_status == "pending":
-                        logger.warning(f"⚠️  Consent pending в банке {bank_id} - требуется ручное подтверждение")
-                        consent_id = data.get("request_id", f"pending_{bank_id}_{user_id}")
-                    else:
-                        raise ValueError("Consent ID не получен")
+            if consent_status == "pending":
+                logger.warning(f"⚠️  Consent pending в банке {bank_id} - требуется ручное подтверждение")
+                return None
+            if not consent_id:
+                raise ValueError("Consent ID не получен")
+            if consent_status != "approved":
+                logger.warning(f"⚠️  Consent {consent_id} в статусе: {consent_status}")
+                return None
 
-                consent_key = f"consent:{user_id}:{bank_id}"
-                self.redis_client.setex(consent_key, settings.CONSENT_REQUEST_TTL, consent_id)
-
-                if consent_status == "approved":
-                    logger.info(f"✅ Consent {consent_id} одобрен для банка {bank_id}")
-                else:
-                    logger.warning(f"⚠️  Consent {consent_id} в статусе: {consent_status}")
-
-                return consent_id
+            logger.info(f"✅ Consent {consent_id} одобрен для банка {bank_id}")
+            return consent_id
 
         except Exception as e:
             logger.error(f"❌ Ошибка создания consent: {e}")
-            if settings.DEBUG:
-                mock_consent = f"consent_{bank_id}_{user_id}_dev"
-                logger.warning(f"⚠️  Используем mock consent для разработки")
-                return mock_consent
-            raise
+            return None
 
-    def get_accounts(
+    async def get_accounts(
         self,
         user_id: int,
         bank_id: int,
         client_id: str
     ) -> List[Dict[str, Any]]:
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        last_known_key = f"accounts:{user_id}:{bank_id}"
 
-        consent_key = f"consent:{user_id}:{bank_id}"
-        consent_id = self.redis_client.get(consent_key)
+        try:
+            token = await self.get_bank_token(user_id, bank_id)
 
-        if not consent_id:
-            consent_id = self.create_consent(
+            consent_id = await self.consents.get_consent(
                 user_id,
                 bank_id,
                 client_id,
                 ["ReadAccountsDetail", "ReadBalances", "ReadTransactionsDetail"]
             )
 
-        url = f"{bank_config['base_url']}/accounts"
+            url = f"{bank_config['base_url']}/accounts"
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "X-Requesting-Bank": bank_config["client_id"],
-            "X-Consent-Id": consent_id
-        }
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "X-Requesting-Bank": bank_config["client_id"],
+                "X-Consent-Id": consent_id
+            }
 
-        params = {
-            "client_id": client_id
-        }
+            params = {
+                "client_id": client_id
+            }
 
-        try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.get(url, headers=headers, params=params)
-                response.raise_for_status()
+            response = await self._send(bank_id, "accounts", "GET", url, headers=headers, params=params)
 
-                data = response.json()
+            data = response.json()
 
-                accounts = []
-                if "data" in data and "account" in data["data"]:
-                    for acc in data["data"]["account"]:
-                        accounts.append({
-                            "accountId": acc.get("accountId"),
-                            "accountName": acc.get("nickname", "Счёт"),
-                            "currency": acc.get("currency", "RUB"),
-                            "accountType": acc.get("accountType", "Personal")
-                        })
+            accounts = []
+            if "data" in data and "account" in data["data"]:
+                for acc in data["data"]["account"]:
+                    accounts.append({
+                        "accountId": acc.get("accountId"),
+                        "accountName": acc.get("nickname", "Счёт"),
+                        "currency": acc.get("currency", "RUB"),
+                        "accountType": acc.get("accountType", "Personal")
+                    })
 
-                logger.info(f"✅ Получено {len(accounts)} счетов из {bank_config['name']}")
-                return accounts
+            await self._save_last_known(last_known_key, accounts)
+
+            logger.info(f"✅ Получено {len(accounts)} счетов из {bank_config['name']}")
+            return accounts
 
         except Exception as e:
             logger.error(f"❌ Ошибка получения счетов: {e}")
+            last_known = await self._get_last_known(last_known_key)
+            if last_known is not None:
+                logger.warning(f"⚠️  Используем последний известный список счетов {bank_config['name']}")
+                return last_known
             if settings.DEBUG:
                 logger.warning(f"⚠️  Используем mock данные для разработки")
                 return [
@@ -189,26 +304,79 @@ class BankClient:
                 ]
             raise
 
-    def get_account_balance(
+    async def get_account_balance(
         self,
         user_id: int,
         bank_id: int,
         account_id: str,
         client_id: str
     ) -> Dict[str, Any]:
-        bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        balances = await self.get_account_balances(user_id, bank_id, [account_id], client_id)
+        balance = balances[account_id]
+        if isinstance(balance, Exception):
+            raise balance
+        return balance
 
-        consent_key = f"consent:{user_id}:{bank_id}"
-        consent_id = self.redis_client.get(consent_key)
+    async def get_account_balances(
+        self,
+        user_id: int,
+        bank_id: int,
+        account_ids: List[str],
+        client_id: str
+    ) -> Dict[str, Any]:
+        """
+        Балансы нескольких счетов одного банка: токен и consent получаются один раз,
+        балансы запрашиваются параллельно. Для счёта, баланс которого получить
+        не удалось, в результате лежит исключение.
+        """
+        credentials = None
+        credentials_error = None
+        try:
+            token = await self.get_bank_token(user_id, bank_id)
 
-        if not consent_id:
-            consent_id = self.create_consent(
+            consent_id = await self.consents.get_consent(
                 user_id,
                 bank_id,
                 client_id,
                 ["ReadAccountsDetail", "ReadBalances"]
             )
+            credentials = (token, consent_id)
+        except Exception as e:
+            credentials_error = e
+
+        async def fetch(account_id: str) -> Dict[str, Any]:
+            last_known_key = f"balance:{user_id}:{account_id}"
+            try:
+                if credentials is None:
+                    raise credentials_error
+                balance = await self._fetch_balance(bank_id, account_id, *credentials)
+                await self._save_last_known(last_known_key, balance)
+                return balance
+            except Exception as e:
+                logger.error(f"❌ Ошибка получения баланса: {e}")
+                last_known = await self._get_last_known(last_known_key)
+                if last_known is not None:
+                    logger.warning(f"⚠️  Используем последний известный баланс для {account_id}")
+                    return last_known
+                if settings.DEBUG:
+                    import random
+                    return {
+                        "amount": round(random.uniform(1000, 50000), 2),
+                        "currency": "RUB"
+                    }
+                raise
+
+        results = await asyncio.gather(*[fetch(account_id) for account_id in account_ids], return_exceptions=True)
+        return dict(zip(account_ids, results))
+
+    async def _fetch_balance(
+        self,
+        bank_id: int,
+        account_id: str,
+        token: str,
+        consent_id: str
+    ) -> Dict[str, Any]:
+        bank_config = self._get_bank_config(bank_id)
 
         url = f"{bank_config['base_url']}/accounts/{account_id}/balances"
 
@@ -218,36 +386,24 @@ class BankClient:
             "X-Consent-Id": consent_id
         }
 
-        try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.get(url, headers=headers)
-                response.raise_for_status()
-
-                data = response.json()
+        response = await self._send(bank_id, "balances", "GET", url, headers=headers)
 
-                if "data" in data and "balance" in data["data"]:
-                    balances = data["data"]["balance"]
-                    if balances:
-                        first_balance = balances[0]
-                        return {
-                            "amount": float(first_balance.get("amount", {}).get("amount", 0)),
-                            "currency": first_balance.get("amount", {}).get("currency", "RUB")
-                        }
+        data = response.json()
 
-                logger.info(f"✅ Получен баланс для счёта {account_id}")
-                return {"amount": 0, "currency": "RUB"}
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения баланса: {e}")
-            if settings.DEBUG:
-                import random
-                return {
-                    "amount": round(random.uniform(1000, 50000), 2),
-                    "currency": "RUB"
+        balance = {"amount": 0, "currency": "RUB"}
+        if "data" in data and "balance" in data["data"]:
+            balances = data["data"]["balance"]
+            if balances:
+                first_balance = balances[0]
+                balance = {
+                    "amount": float(first_balance.get("amount", {}).get("amount", 0)),
+                    "currency": first_balance.get("amount", {}).get("currency", "RUB")
                 }
-            raise
 
-    def get_account_transactions(
+        logger.info(f"✅ Получен баланс для счёта {account_id}")
+        return balance
+
+    async def get_account_transactions(
         self,
         user_id: int,
         bank_id: int,
@@ -256,56 +412,50 @@ class BankClient:
         limit: int = 10
     ) -> List[Dict[str, Any]]:
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        last_known_key = f"transactions:{user_id}:{account_id}"
 
-        consent_key = f"consent:{user_id}:{bank_id}"
-        consent_id = self.redis_client.get(consent_key)
+        try:
+            token = await self.get_bank_token(user_id, bank_id)
 
-        if not consent_id:
-            consent_id = self.create_consent(
+            consent_id = await self.consents.get_consent(
                 user_id,
                 bank_id,
                 client_id,
                 ["ReadTransactionsDetail"]
             )
 
-        url = f"{bank_config['base_url']}/accounts/{account_id}/transactions"
+            url = f"{bank_config['base_url']}/accounts/{account_id}/transactions"
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "X-Requesting-Bank": bank_config["client_id"],
-            "X-Consent-Id": consent_id
-        }
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "X-Requesting-Bank": bank_config["client_id"],
+                "X-Consent-Id": consent_id
+            }
 
-        params = {
-            "limit": limit
-        }
+            params = {
+                "limit": limit
+            }
 
-        try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.get(url, headers=headers, params=params)
-                response.raise_for_status()
+            response = await self._send(bank_id, "transactions", "GET", url, headers=headers, params=params)
 
-                data = response.json()
+            data = response.json()
 
-                transactions = []
-                if "data" in data and "transaction" in data["data"]:
-                    for txn in data["data"]["transaction"]:
-                        amount_data = txn.get("amount", {})
-                        transactions.append({
-                            "id": txn.get("transactionId", ""),
-                            "date": txn.get("bookingDateTime", datetime.utcnow().isoformat()),
-                            "description": txn.get("transactionInformation", "Транзакция"),
-                            "amount": float(amount_data.get("amount", 0)),
-                            "currency": amount_data.get("currency", "RUB"),
-                            "type": txn.get("creditDebitIndicator", "debit").lower()
-                        })
-
-                logger.info(f"✅ Получено {len(transactions)} транзакций для {account_id}")
-                return transactions
+            transactions = [
+                self._parse_transaction(txn)
+                for txn in data.get("data", {}).get("transaction", [])
+            ]
+
+            await self._save_last_known(last_known_key, transactions)
+
+            logger.info(f"✅ Получено {len(transactions)} транзакций для {account_id}")
+            return transactions
 
         except Exception as e:
             logger.error(f"❌ Ошибка получения транзакций: {e}")
+            last_known = await self._get_last_known(last_known_key)
+            if last_known is not None:
+                logger.warning(f"⚠️  Используем последние известные транзакции для {account_id}")
+                return last_known
             if settings.DEBUG:
                 import random
                 transactions = []
@@ -326,9 +476,101 @@ class BankClient:
                 return transactions
             raise
 
+    @staticmethod
+    def _parse_transaction(txn: Dict[str, Any]) -> Dict[str, Any]:
+        amount_data = txn.get("amount", {})
+        merchant = txn.get("merchant") or {}
+        return {
+            "id": txn.get("transactionId", ""),
+            "date": txn.get("bookingDateTime", datetime.utcnow().isoformat()),
+            "description": txn.get("transactionInformation", "Транзакция"),
+            "amount": float(amount_data.get("amount", 0)),
+            "currency": amount_data.get("currency", "RUB"),
+            "type": txn.get("creditDebitIndicator", "debit").lower(),
+            "mccCode": merchant.get("mccCode") or txn.get("mccCode", "")
+        }
+
+    async def get_account_transactions_page(
+        self,
+        user_id: int,
+        bank_id: int,
+        account_id: str,
+        client_id: str,
+        page: int = 1,
+        limit: int = 100,
+        from_date: Optional[datetime] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Одна страница транзакций для инкрементальной синхронизации.
+        Возвращает (транзакции, есть ли следующая страница). Ошибки не подменяются кешем.
+        """
+        bank_config = self._get_bank_config(bank_id)
+
+        try:
+            token = await self.get_bank_token(user_id, bank_id)
+
+            consent_id = await self.consents.get_consent(
+                user_id,
+                bank_id,
+                client_id,
+                ["ReadTransactionsDetail"]
+            )
+
+            url = f"{bank_config['base_url']}/accounts/{account_id}/transactions"
+
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "X-Requesting-Bank": bank_config["client_id"],
+                "X-Consent-Id": consent_id
+            }
+
+            params = {
+                "page": page,
+                "limit": limit
+            }
+            if from_date:
+                params["from_booking_date_time"] = from_date.isoformat()
+
+            response = await self._send(bank_id, "transactions", "GET", url, headers=headers, params=params)
+
+            data = response.json()
+
+            transactions = [
+                self._parse_transaction(txn)
+                for txn in data.get("data", {}).get("transaction", [])
+            ]
+            has_more = bool(data.get("links", {}).get("next")) or len(transactions) >= limit
+
+            return transactions, has_more
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения страницы транзакций {account_id}: {e}")
+            if settings.DEBUG and page == 1:
+                import random
+                logger.warning(f"⚠️  Используем mock данные для разработки")
+                transactions = []
+                for i in range(5):
+                    txn_date = (datetime.utcnow() - timedelta(days=i)).replace(hour=12, minute=0, second=0, microsecond=0)
+                    transactions.append({
+                        "id": f"txn_{account_id}_{txn_date.strftime('%Y%m%d')}",
+                        "date": txn_date.isoformat(),
+                        "description": random.choice([
+                            "Покупка в магазине",
+                            "Оплата ресторана",
+                            "Перевод",
+                            "Снятие наличных"
+                        ]),
+                        "amount": round(random.uniform(-500, 1000), 2),
+                        "currency": "RUB",
+                        "type": random.choice(["debit", "credit"]),
+                        "mccCode": ""
+                    })
+                return transactions, False
+            raise
+
     # ========== НОВЫЕ API ИЗ api_new.txt ==========
 
-    def create_payment_consent_vrp(
+    async def create_payment_consent_vrp(
         self,
         user_id: int,
         bank_id: int,
@@ -341,7 +583,7 @@ class BankClient:
     ) -> Dict[str, Any]:
         """Создать VRP согласие для подписок (Variable Recurring Payments)"""
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/payment-consents/request"
 
@@ -364,18 +606,16 @@ class BankClient:
         }
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, headers=headers, json=body)
-                response.raise_for_status()
+            response = await self._send(bank_id, "payment_consent", "POST", url, headers=headers, json=body)
 
-                data = response.json()
-                consent_id = data.get("consent_id") or data.get("data", {}).get("consentId")
+            data = response.json()
+            consent_id = data.get("consent_id") or data.get("data", {}).get("consentId")
 
-                logger.info(f"✅ Создано VRP согласие {consent_id} для банка {bank_id}")
-                return {
-                    "consent_id": consent_id,
-                    "status": data.get("status", "approved")
-                }
+            logger.info(f"✅ Создано VRP согласие {consent_id} для банка {bank_id}")
+            return {
+                "consent_id": consent_id,
+                "status": data.get("status", "approved")
+            }
 
         except Exception as e:
             logger.error(f"❌ Ошибка создания VRP согласия: {e}")
@@ -385,7 +625,7 @@ class BankClient:
                 return {"consent_id": mock_consent, "status": "approved"}
             raise
 
-    def get_products(
+    async def get_products(
         self,
         user_id: int,
         bank_id: int,
@@ -393,7 +633,7 @@ class BankClient:
     ) -> List[Dict[str, Any]]:
         """Получить каталог продуктов банка"""
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/products"
 
@@ -407,23 +647,21 @@ class BankClient:
             params["product_type"] = product_type
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.get(url, headers=headers, params=params)
-                response.raise_for_status()
+            response = await self._send(bank_id, "products", "GET", url, headers=headers, params=params)
 
-                data = response.json()
+            data = response.json()
                 
-                products = []
-                if isinstance(data, list):
-                    products = data
-                elif "data" in data:
-                    if isinstance(data["data"], list):
-                        products = data["data"]
-                    elif "product" in data["data"]:
-                        products = data["data"]["product"]
-
-                logger.info(f"✅ Получено {len(products)} продуктов из {bank_config['name']}")
-                return products
+            products = []
+            if isinstance(data, list):
+                products = data
+            elif "data" in data:
+                if isinstance(data["data"], list):
+                    products = data["data"]
+                elif "product" in data["data"]:
+                    products = data["data"]["product"]
+
+            logger.info(f"✅ Получено {len(products)} продуктов из {bank_config['name']}")
+            return products
 
         except Exception as e:
             logger.error(f"❌ Ошибка получения продуктов: {e}")
@@ -451,7 +689,7 @@ class BankClient:
                 ]
             raise
 
-    def get_product_details(
+    async def get_product_details(
         self,
         user_id: int,
         bank_id: int,
@@ -459,7 +697,7 @@ class BankClient:
     ) -> Dict[str, Any]:
         """Получить детали продукта"""
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/products/{product_id}"
 
@@ -469,12 +707,10 @@ class BankClient:
         }
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.get(url, headers=headers)
-                response.raise_for_status()
+            response = await self._send(bank_id, "product_details", "GET", url, headers=headers)
 
-                data = response.json()
-                return data if isinstance(data, dict) else {"data": data}
+            data = response.json()
+            return data if isinstance(data, dict) else {"data": data}
 
         except Exception as e:
             logger.error(f"❌ Ошибка получения деталей продукта: {e}")
@@ -487,7 +723,7 @@ class BankClient:
                 }
             raise
 
-    def create_product_agreement_consent(
+    async def create_product_agreement_consent(
         self,
         user_id: int,
         bank_id: int,
@@ -501,7 +737,7 @@ class BankClient:
     ) -> Dict[str, Any]:
         """Создать согласие на управление договорами с продуктами"""
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/product-agreement-consents/request"
 
@@ -527,18 +763,16 @@ class BankClient:
             body["valid_until"] = valid_until
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, headers=headers, json=body)
-                response.raise_for_status()
+            response = await self._send(bank_id, "product_agreement_consent", "POST", url, headers=headers, json=body)
 
-                data = response.json()
-                consent_id = data.get("consent_id") or data.get("data", {}).get("consentId")
+            data = response.json()
+            consent_id = data.get("consent_id") or data.get("data", {}).get("consentId")
 
-                logger.info(f"✅ Создано согласие на управление договорами {consent_id}")
-                return {
-                    "consent_id": consent_id,
-                    "status": data.get("status", "approved")
-                }
+            logger.info(f"✅ Создано согласие на управление договорами {consent_id}")
+            return {
+                "consent_id": consent_id,
+                "status": data.get("status", "approved")
+            }
 
         except Exception as e:
             logger.error(f"❌ Ошибка создания согласия на управление договорами: {e}")
@@ -548,7 +782,7 @@ class BankClient:
                 return {"consent_id": mock_consent, "status": "approved"}
             raise
 
-    def create_product_agreement(
+    async def create_product_agreement(
         self,
         user_id: int,
         bank_id: int,
@@ -561,7 +795,7 @@ class BankClient:
     ) -> Dict[str, Any]:
         """Открыть договор с продуктом (депозит, кредит, карта)"""
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/product-agreements"
 
@@ -587,18 +821,16 @@ class BankClient:
         params = {"client_id": client_id}
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, headers=headers, json=body, params=params)
-                response.raise_for_status()
+            response = await self._send(bank_id, "product_agreement", "POST", url, headers=headers, json=body, params=params)
 
-                data = response.json()
-                agreement_id = data.get("agreement_id") or data.get("data", {}).get("agreementId")
+            data = response.json()
+            agreement_id = data.get("agreement_id") or data.get("data", {}).get("agreementId")
 
-                logger.info(f"✅ Создан договор с продуктом {agreement_id}")
-                return {
-                    "agreement_id": agreement_id,
-                    "status": data.get("status", "active")
-                }
+            logger.info(f"✅ Создан договор с продуктом {agreement_id}")
+            return {
+                "agreement_id": agreement_id,
+                "status": data.get("status", "active")
+            }
 
         except Exception as e:
             logger.error(f"❌ Ошибка создания договора с продуктом: {e}")
@@ -608,7 +840,7 @@ class BankClient:
                 return {"agreement_id": mock_agreement, "status": "active"}
             raise
 
-    def create_card(
+    async def create_card(
         self,
         user_id: int,
         bank_id: int,
@@ -620,7 +852,7 @@ class BankClient:
     ) -> Dict[str, Any]:
         """Выпустить новую карту и привязать к счету"""
         bank_config = self._get_bank_config(bank_id)
-        token = self.get_bank_token(user_id, bank_id)
+        token = await self.get_bank_token(user_id, bank_id)
 
         url = f"{bank_config['base_url']}/cards"
 
@@ -642,18 +874,16 @@ class BankClient:
         params = {"client_id": client_id}
 
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, headers=headers, json=body, params=params)
-                response.raise_for_status()
+            response = await self._send(bank_id, "cards", "POST", url, headers=headers, json=body, params=params)
 
-                data = response.json()
-                card_id = data.get("card_id") or data.get("data", {}).get("cardId")
+            data = response.json()
+            card_id = data.get("card_id") or data.get("data", {}).get("cardId")
 
-                logger.info(f"✅ Выпущена карта {card_id}")
-                return {
-                    "card_id": card_id,
-                    "status": data.get("status", "active")
-                }
+            logger.info(f"✅ Выпущена карта {card_id}")
+            return {
+                "card_id": card_id,
+                "status": data.get("status", "active")
+            }
 
         except Exception as e:
             logger.error(f"❌ Ошибка выпуска карты: {e}")
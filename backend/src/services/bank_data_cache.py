@@ -0,0 +1,227 @@
+import json
+import logging
+import time
+import redis
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.config import settings
+from src.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Один запрос в банк на ключ кеша внутри процесса
+_cache_flight = SingleFlight()
+
+CacheMeta = Dict[str, Any]
+
+def account_data_version_key(user_id: int) -> str:
+    return f"account_data_version:{user_id}"
+
+def bump_account_data_version(redis_client: redis.Redis, *user_ids: int) -> None:
+    """Отметить, что данные счетов пользователя изменились (сбрасывает групповые агрегаты)"""
+    if not user_ids:
+        return
+    pipe = redis_client.pipeline()
+    _queue_version_bumps(pipe, user_ids)
+    pipe.execute()
+
+def _queue_version_bumps(pipe, user_ids) -> None:
+    for user_id in set(user_ids):
+        pipe.incr(account_data_version_key(user_id))
+
+def _user_id_from_key(key: str) -> Optional[int]:
+    # Ключи данных счетов имеют вид {тип}:{user_id}:{account_id}
+    parts = key.split(":")
+    if len(parts) >= 3 and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+class BankDataCache:
+    """
+    Кеш данных из банков по схеме stale-while-revalidate.
+    В Redis лежит {"value": ..., "fetchedAt": unix time} с TTL = жёсткий TTL.
+    До мягкого TTL значение свежее, после него отдаётся сразу, а в фоне
+    запускается одно обновление. Промахи по одному ключу объединяются.
+    Остаётся на синхронном клиенте: кешем и версиями данных пользуются синхронные
+    методы AccountService и PaymentService, перевод на redis.asyncio - отдельная задача.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        soft_ttl: Optional[int] = None,
+        hard_ttl: Optional[int] = None
+    ):
+        self.redis_client = redis_client
+        self.soft_ttl = soft_ttl or settings.BANK_DATA_CACHE_SOFT_TTL
+        self.hard_ttl = hard_ttl or settings.BANK_DATA_CACHE_TTL
+
+    @staticmethod
+    def _meta(fetched_at: float, stale: bool) -> CacheMeta:
+        return {
+            "fetchedAt": datetime.fromtimestamp(fetched_at).isoformat(),
+            "stale": stale
+        }
+
+    @staticmethod
+    def _decode(cached: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not cached:
+            return None
+        try:
+            entry = json.loads(cached)
+        except ValueError:
+            return None
+        if not isinstance(entry, dict) or "fetchedAt" not in entry:
+            # Значение в старом формате (без метаданных) считаем промахом
+            return None
+        return entry
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(self.redis_client.get(key))
+
+    def get_many(self, keys: List[str]) -> Dict[str, Tuple[Any, CacheMeta]]:
+        """
+        Прочитать несколько ключей одним MGET. Возвращает только найденные:
+        key -> (значение, метаданные). Проверка мягкого TTL - на вызывающей стороне по meta["stale"].
+        """
+        if not keys:
+            return {}
+
+        now = time.time()
+        result = {}
+        for key, cached in zip(keys, self.redis_client.mget(keys)):
+            entry = self._decode(cached)
+            if entry is not None:
+                stale = now - entry["fetchedAt"] >= self.soft_ttl
+                result[key] = (entry["value"], self._meta(entry["fetchedAt"], stale))
+        return result
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return entry["value"] if entry else None
+
+    @staticmethod
+    def _changed(pipe, keys: List[str]) -> None:
+        """Поднять версии данных владельцев ключей в том же pipeline, что и запись"""
+        _queue_version_bumps(pipe, [user_id for user_id in map(_user_id_from_key, keys) if user_id is not None])
+
+    def set(self, key: str, value: Any) -> CacheMeta:
+        return self.set_many({key: value})
+
+    def set_many(self, values: Dict[str, Any]) -> CacheMeta:
+        fetched_at = time.time()
+        pipe = self.redis_client.pipeline()
+        for key, value in values.items():
+            pipe.setex(key, self.hard_ttl, json.dumps({"value": value, "fetchedAt": fetched_at}))
+        self._changed(pipe, list(values.keys()))
+        pipe.execute()
+        return self._meta(fetched_at, False)
+
+    def update(self, key: str, updater: Callable[[Any], Any]) -> Optional[Any]:
+        """
+        Изменить закешированное значение, не трогая fetchedAt и оставшийся TTL.
+        Возвращает новое значение или None, если ключа нет в кеше.
+        """
+        return self.update_many({key: updater}).get(key)
+
+    def update_many(
+        self,
+        updaters: Dict[str, Callable[[Any], Any]],
+        invalidate: Sequence[str] = ()
+    ) -> Dict[str, Any]:
+        """
+        Изменить несколько закешированных значений и удалить ключи invalidate
+        за два round trip: MGET и один pipeline с записью, удалением и версиями.
+        Возвращает новые значения найденных ключей.
+        """
+        keys = list(updaters)
+        updated = {}
+        pipe = self.redis_client.pipeline()
+
+        for key, cached in zip(keys, self.redis_client.mget(keys) if keys else []):
+            entry = self._decode(cached)
+            if entry is None:
+                continue
+            entry["value"] = updaters[key](entry["value"])
+            pipe.set(key, json.dumps(entry), keepttl=True)
+            updated[key] = entry["value"]
+
+        if invalidate:
+            pipe.delete(*invalidate)
+        changed = list(updated) + list(invalidate)
+        if changed:
+            self._changed(pipe, changed)
+            pipe.execute()
+        return updated
+
+    def invalidate(self, *keys: str) -> None:
+        if keys:
+            pipe = self.redis_client.pipeline()
+            pipe.delete(*keys)
+            self._changed(pipe, list(keys))
+            pipe.execute()
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, CacheMeta]:
+        entry = self.get_entry(key)
+
+        if entry is not None:
+            stale = time.time() - entry["fetchedAt"] >= self.soft_ttl
+            if stale:
+                self.revalidate(key, fetch)
+            return entry["value"], self._meta(entry["fetchedAt"], stale)
+
+        return await _cache_flight.do(key, lambda: self._fetch_and_store(key, fetch))
+
+    def age(self, key: str) -> Optional[float]:
+        """Сколько секунд назад данные были получены из банка (None - нет в кеше)"""
+        entry = self.get_entry(key)
+        return time.time() - entry["fetchedAt"] if entry else None
+
+    async def refresh(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, CacheMeta]:
+        """Принудительно обновить значение (используется фоновой синхронизацией)"""
+        return await _cache_flight.do(key, lambda: self._fetch_and_store(key, fetch))
+
+    async def _fetch_and_store(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, CacheMeta]:
+        value = await fetch()
+        meta = self.set(key, value)
+        return value, meta
+
+    def revalidate(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """Запустить одно фоновое обновление устаревшего значения"""
+        if _cache_flight.is_running(key):
+            return
+
+        # Между воркерами обновление запускает только тот, кто взял лизу
+        lease_acquired = self.redis_client.set(
+            f"cache_refresh:{key}",
+            "1",
+            nx=True,
+            ex=settings.BANK_DATA_CACHE_REFRESH_LEASE
+        )
+        if not lease_acquired:
+            return
+
+        logger.info(f"🔄 Фоновое обновление кеша {key}")
+        _cache_flight.spawn(key, lambda: self._refresh(key, fetch))
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, CacheMeta]:
+        try:
+            return await self._fetch_and_store(key, fetch)
+        except Exception as e:
+            logger.warning(f"⚠️  Не удалось обновить кеш {key}: {e}")
+            raise
+        finally:
+            self.redis_client.delete(f"cache_refresh:{key}")
@@ -1,140 +1,324 @@
 import logging
-import json
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Dict, List, Optional, Tuple
+from sqlalchemy.sql import func
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from decimal import Decimal
-from datetime import datetime, timedelta
-from collections import defaultdict
-
-from src.models.cashback import CashbackData, CashbackConsent
+from datetime import date, datetime, timedelta, timezone
+
+from src.config import settings
+from src.constants.constants import TransactionCategory
+from src.database import SessionLocal
+from src.models.cashback import CashbackData, CashbackCategoryTotal, CashbackConsent
+from src.models.transaction import Transaction
+from src.redis_client import acquire_lock, release_lock
 from src.services.account_service import AccountService
-from src.constants.mcc_mapping import categorize_transaction
+from src.services.transaction_sync_service import TransactionSyncService
+from src.utils.analytics_kernel import CATEGORIES, TransactionColumns, month_index, sum_by_month_category
+from src.utils.single_flight import SingleFlight
 import redis
 
 logger = logging.getLogger(__name__)
 
+# Один фоновый пересчёт кешбека пользователя за раз внутри процесса
+_rollup_flight = SingleFlight()
+
 # Проценты кешбека по категориям (средние значения)
 CASHBACK_RATES = {
-    "FOOD": Decimal("4.0"),  # Продукты: 3-5%
-    "RESTAURANT": Decimal("7.0"),  # Кафе/рестораны: 5-10%
-    "TRANSPORT": Decimal("2.5"),  # Транспорт: 2-3%
-    "ENTERTAINMENT": Decimal("1.5"),  # Развлечения: 1-2%
-    "SHOPPING": Decimal("2.0"),  # Покупки: 1-3%
-    "UTILITIES": Decimal("0.5"),  # Коммунальные услуги: 0.5-1%
-    "HEALTH": Decimal("1.0"),  # Здоровье: 0.5-1.5%
-    "EDUCATION": Decimal("1.0"),  # Образование: 0.5-1.5%
-    "OTHER": Decimal("0.5")  # Остальное: 0.5-1%
+    TransactionCategory.GROCERIES: Decimal("4.0"),  # Продукты: 3-5%
+    TransactionCategory.RESTAURANTS: Decimal("7.0"),  # Кафе/рестораны: 5-10%
+    TransactionCategory.TRANSPORT: Decimal("2.5"),  # Транспорт: 2-3%
+    TransactionCategory.ENTERTAINMENT: Decimal("1.5"),  # Развлечения: 1-2%
+    TransactionCategory.CLOTHING: Decimal("2.0"),  # Покупки: 1-3%
+    TransactionCategory.UTILITIES: Decimal("0.5"),  # Коммунальные услуги: 0.5-1%
+    TransactionCategory.HEALTH: Decimal("1.0"),  # Здоровье: 0.5-1.5%
+    TransactionCategory.EDUCATION: Decimal("1.0"),  # Образование: 0.5-1.5%
+    TransactionCategory.OTHER: Decimal("0.5")  # Остальное: 0.5-1%
 }
 
+# Ставки в порядке кодов категорий колоночного ядра
+CASHBACK_RATE_VECTOR = np.array([
+    float(CASHBACK_RATES.get(category, CASHBACK_RATES[TransactionCategory.OTHER]))
+    for category in CATEGORIES
+])
+
+def last_months(count: int, today: Optional[date] = None) -> List[str]:
+    """Последние count календарных месяцев в формате YYYY-MM, начиная с текущего"""
+    today = today or datetime.now(timezone.utc).date()
+    year, month = today.year, today.month
+    months = []
+    for _ in range(count):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return months
+
+def _parse_month(month: str) -> date:
+    year, month_num = map(int, month.split("-"))
+    return date(year, month_num, 1)
+
+def _empty_month(month: str) -> Dict:
+    return {
+        "month": month,
+        "total_cashback": 0.0,
+        "transactions_count": 0,
+        "average_cashback_rate": 0.0,
+        "categories_breakdown": {},
+        "total_amount": 0.0
+    }
+
 class CashbackService:
-    def __init__(self, db: Session, redis_client: redis.Redis):
+    """
+    Кешбек считается конвейером: все месяцы за один проход по сохранённым транзакциям
+    (колоночным ядром), результат пишется в cashback_data одной пачкой.
+    Чтение агрегата только читает cashback_data, недостающие и устаревшие месяцы
+    пересчитываются в фоне.
+    Если передана async_db, чтения агрегата идут через неё (тем же ORM-кодом через run_sync).
+    """
+
+    def __init__(self, db: Session, redis_client: redis.Redis, async_db: Optional[AsyncSession] = None):
         self.db = db
+        self.async_db = async_db
         self.redis_client = redis_client
         self.account_service = AccountService(db, redis_client)
 
-    def calculate_cashback(
+    async def _read(self, reader: Callable[["CashbackService"], Any]) -> Any:
+        """Выполнить чтение через асинхронную сессию, если она есть"""
+        if self.async_db is None:
+            return reader(self)
+        return await self.async_db.run_sync(
+            lambda session: reader(CashbackService(session, self.redis_client))
+        )
+
+    async def compute_rollup(
+        self,
+        user_id: int,
+        months: List[str],
+        sync: bool = True
+    ) -> Dict[str, Dict]:
+        """Кешбек за несколько месяцев (формат YYYY-MM) одним запросом транзакций"""
+        accounts = self.account_service.get_user_accounts(user_id, None)
+
+        if sync:
+            # Догружаем новые транзакции счетов один раз на весь пересчёт
+            errors = await TransactionSyncService(self.db, self.redis_client).sync_accounts(
+                user_id,
+                accounts,
+                max_age=settings.TRANSACTION_SYNC_MIN_INTERVAL
+            )
+            for error in errors:
+                logger.warning(f"Ошибка получения транзакций для счета {error['accountId']}: {error['error']}")
+
+        month_starts = [_parse_month(month) for month in months]
+        period_start = datetime.combine(min(month_starts), datetime.min.time(), tzinfo=timezone.utc)
+        last = max(month_starts)
+        period_end = datetime(last.year + last.month // 12, last.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+        # Только дебетовые транзакции (расходы) за весь период
+        rows = self.db.query(
+            Transaction.transaction_id,
+            Transaction.booking_date,
+            Transaction.amount,
+            Transaction.direction,
+            Transaction.bank_id,
+            Transaction.category,
+            Transaction.mcc_code,
+            Transaction.description
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.account_id.in_([account["accountId"] for account in accounts]),
+            Transaction.direction == "debit",
+            Transaction.booking_date >= period_start,
+            Transaction.booking_date < period_end
+        ).all()
+
+        columns = TransactionColumns.from_rows(rows)
+        indexes = [month_index(month_start) for month_start in month_starts]
+        amounts, counts = sum_by_month_category(columns, indexes)
+        cashback = amounts * CASHBACK_RATE_VECTOR / 100
+
+        # sum_by_month_category возвращает строки в порядке возрастания месяца
+        row_by_index = {index: row for row, index in enumerate(sorted(indexes))}
+
+        result = {}
+        for month, index in zip(months, indexes):
+            row = row_by_index[index]
+            result[month] = self._format_month(month, amounts[row], cashback[row], counts[row])
+        return result
+
+    @staticmethod
+    def _format_month(month: str, amounts: np.ndarray, cashback: np.ndarray, counts: np.ndarray) -> Dict:
+        total_amount = float(amounts.sum())
+        total_cashback = float(cashback.sum())
+
+        # Форматируем разбивку по категориям
+        categories_json = {}
+        for code in np.flatnonzero(counts):
+            categories_json[CATEGORIES[code].value] = {
+                "amount": float(amounts[code]),
+                "cashback": float(cashback[code]),
+                "count": int(counts[code]),
+                "rate": float(cashback[code] / amounts[code] * 100) if amounts[code] > 0 else 0.0
+            }
+
+        return {
+            "month": month,
+            "total_cashback": total_cashback,
+            "transactions_count": int(counts.sum()),
+            "average_cashback_rate": (total_cashback / total_amount * 100) if total_amount > 0 else 0.0,
+            "categories_breakdown": categories_json,
+            "total_amount": total_amount
+        }
+
+    async def calculate_cashback(
         self,
         user_id: int,
         month: str  # Формат: YYYY-MM
     ) -> Dict:
         """Рассчитать кешбек за указанный месяц"""
         try:
-            # Парсим месяц
-            year, month_num = map(int, month.split("-"))
-            month_start = datetime(year, month_num, 1)
-            if month_num == 12:
-                month_end = datetime(year + 1, 1, 1)
-            else:
-                month_end = datetime(year, month_num + 1, 1)
-
-            # Получаем все счета пользователя
-            accounts = self.account_service.get_user_accounts(user_id, None)
-
-            total_cashback = Decimal("0")
-            transactions_count = 0
-            category_breakdown = defaultdict(lambda: {"amount": Decimal("0"), "cashback": Decimal("0"), "count": 0})
-
-            # Обрабатываем транзакции по всем счетам
-            for account in accounts:
-                try:
-                    transactions = self.account_service.get_account_transactions(
-                        user_id,
-                        account["accountId"],
-                        account["clientId"]
-                    )
-
-                    for txn in transactions:
-                        try:
-                            txn_date = datetime.fromisoformat(txn["date"].replace('Z', '+00:00'))
-                            
-                            # Проверяем, что транзакция в нужном месяце
-                            if not (month_start <= txn_date < month_end):
-                                continue
-
-                            # Только дебетовые транзакции (расходы)
-                            if txn.get("type", "debit") != "debit":
-                                continue
-
-                            amount = Decimal(str(abs(txn["amount"])))
-                            category = categorize_transaction(
-                                txn.get("mccCode", ""),
-                                txn.get("description", "")
-                            )
-
-                            # Получаем процент кешбека для категории
-                            cashback_rate = CASHBACK_RATES.get(category, CASHBACK_RATES["OTHER"])
-                            cashback_amount = (amount * cashback_rate) / Decimal("100")
-
-                            total_cashback += cashback_amount
-                            transactions_count += 1
-
-                            category_breakdown[category]["amount"] += amount
-                            category_breakdown[category]["cashback"] += cashback_amount
-                            category_breakdown[category]["count"] += 1
-
-                        except Exception as e:
-                            logger.warning(f"Ошибка обработки транзакции: {e}")
-                            continue
-
-                except Exception as e:
-                    logger.warning(f"Ошибка получения транзакций для счета {account['accountId']}: {e}")
-                    continue
-
-            # Вычисляем средний процент кешбека
-            total_amount = sum([cat["amount"] for cat in category_breakdown.values()])
-            average_rate = (total_cashback / total_amount * Decimal("100")) if total_amount > 0 else Decimal("0")
-
-            # Форматируем разбивку по категориям
-            categories_json = {}
-            for category, data in category_breakdown.items():
-                categories_json[category] = {
-                    "amount": float(data["amount"]),
-                    "cashback": float(data["cashback"]),
-                    "count": data["count"],
-                    "rate": float((data["cashback"] / data["amount"] * Decimal("100")) if data["amount"] > 0 else Decimal("0"))
-                }
-
-            return {
-                "month": month,
-                "total_cashback": float(total_cashback),
-                "transactions_count": transactions_count,
-                "average_cashback_rate": float(average_rate),
-                "categories_breakdown": categories_json,
-                "total_amount": float(total_amount)
-            }
-
+            return (await self.compute_rollup(user_id, [month]))[month]
         except Exception as e:
             logger.error(f"Ошибка расчета кешбека: {e}")
-            return {
+            return _empty_month(month)
+
+    def save_rollup(self, user_id: int, rollup: Dict[str, Dict]) -> None:
+        """
+        Записать месяцы одной пачкой: итоги - upsert'ом в cashback_data по (user_id, month),
+        разбивку по категориям - строками в cashback_category_totals.
+        Одновременные пересчёты (фоновый и из запроса) не создают дублей месяца.
+        """
+        if not rollup:
+            return
+
+        now = datetime.now(timezone.utc)
+        stmt = insert(CashbackData).values([
+            {
+                "user_id": user_id,
                 "month": month,
-                "total_cashback": 0.0,
-                "transactions_count": 0,
-                "average_cashback_rate": 0.0,
-                "categories_breakdown": {},
-                "total_amount": 0.0
+                "total_cashback": Decimal(str(round(calculated["total_cashback"], 2))),
+                "transactions_count": calculated["transactions_count"],
+                "average_cashback_rate": Decimal(str(round(calculated["average_cashback_rate"], 2))),
+                "updated_at": now
+            }
+            for month, calculated in rollup.items()
+        ])
+        self.db.execute(stmt.on_conflict_do_update(
+            constraint="uq_cashback_data_user_month",
+            set_={
+                "total_cashback": stmt.excluded.total_cashback,
+                "transactions_count": stmt.excluded.transactions_count,
+                "average_cashback_rate": stmt.excluded.average_cashback_rate,
+                "updated_at": stmt.excluded.updated_at
             }
+        ))
+
+        self.db.query(CashbackCategoryTotal).filter(
+            CashbackCategoryTotal.user_id == user_id,
+            CashbackCategoryTotal.month.in_(list(rollup.keys()))
+        ).delete(synchronize_session=False)
+        totals = [
+            {
+                "user_id": user_id,
+                "month": month,
+                "category": category,
+                "amount": Decimal(str(round(data["amount"], 2))),
+                "cashback": Decimal(str(round(data["cashback"], 2))),
+                "transactions_count": data["count"]
+            }
+            for month, calculated in rollup.items()
+            for category, data in calculated["categories_breakdown"].items()
+        ]
+        if totals:
+            stmt = insert(CashbackCategoryTotal).values(totals)
+            self.db.execute(stmt.on_conflict_do_update(
+                constraint="uq_cashback_category_month",
+                set_={
+                    "amount": stmt.excluded.amount,
+                    "cashback": stmt.excluded.cashback,
+                    "transactions_count": stmt.excluded.transactions_count
+                }
+            ))
+        self.db.commit()
+
+    @staticmethod
+    def _category_entry(amount, cashback, count) -> Dict:
+        amount, cashback = float(amount or 0), float(cashback or 0)
+        return {
+            "amount": amount,
+            "cashback": cashback,
+            "count": int(count or 0),
+            "rate": (cashback / amount * 100) if amount > 0 else 0.0
+        }
 
-    def get_or_create_cashback_data(
+    def get_month_breakdowns(self, user_id: int, months: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """Разбивка по категориям для каждого из месяцев - одним запросом"""
+        rows = self.db.query(CashbackCategoryTotal).filter(
+            CashbackCategoryTotal.user_id == user_id,
+            CashbackCategoryTotal.month.in_(months)
+        ).all()
+
+        result = {month: {} for month in months}
+        for row in rows:
+            result[row.month][row.category] = self._category_entry(row.amount, row.cashback, row.transactions_count)
+        return result
+
+    async def backfill(self, user_id: int, months: Optional[List[str]] = None, sync: bool = True) -> bool:
+        """
+        Пересчитать и сохранить кешбек за последние месяцы.
+        Между воркерами пересчёт пользователя выполняет только один (Redis-лок).
+        """
+        lock_key = f"cashback_rollup:{user_id}"
+        lock_token = acquire_lock(self.redis_client, lock_key, settings.CASHBACK_ROLLUP_LOCK_LEASE_MS)
+        if not lock_token:
+            return False
+
+        try:
+            months = months or last_months(settings.CASHBACK_ROLLUP_MONTHS)
+            rollup = await self.compute_rollup(user_id, months, sync=sync)
+            self.save_rollup(user_id, rollup)
+            logger.info(f"✅ Кешбек пользователя {user_id} пересчитан за {len(months)} мес.")
+            return True
+        finally:
+            release_lock(self.redis_client, lock_key, lock_token)
+
+    def schedule_backfill(self, user_id: int) -> None:
+        """Фоновый пересчёт кешбека (со своей сессией БД - сессия запроса к тому времени закрыта)"""
+        _rollup_flight.spawn(user_id, lambda: self._run_backfill(user_id))
+
+    async def _run_backfill(self, user_id: int) -> None:
+        db = SessionLocal()
+        try:
+            await CashbackService(db, self.redis_client).backfill(user_id)
+        except Exception as e:
+            logger.warning(f"⚠️  Фоновый пересчёт кешбека пользователя {user_id} не удался: {e}")
+        finally:
+            db.close()
+
+    def _read_months(self, user_id: int, months: List[str]) -> Dict[str, CashbackData]:
+        """Сохранённые месяцы; недостающие или устаревшие ставятся на фоновый пересчёт"""
+        rows = self.db.query(CashbackData).filter(
+            CashbackData.user_id == user_id,
+            CashbackData.month.in_(months)
+        ).all()
+        by_month = {row.month: row for row in rows}
+
+        current = by_month.get(months[0])
+        stale = False
+        if current is not None:
+            computed_at = current.updated_at or current.created_at
+            if computed_at is not None:
+                if computed_at.tzinfo is None:
+                    computed_at = computed_at.replace(tzinfo=timezone.utc)
+                stale = datetime.now(timezone.utc) - computed_at > timedelta(seconds=settings.CASHBACK_ROLLUP_MAX_AGE)
+
+        if stale or any(month not in by_month for month in months):
+            self.schedule_backfill(user_id)
+
+        return by_month
+
+    async def get_or_create_cashback_data(
         self,
         user_id: int,
         month: str
@@ -149,42 +333,33 @@ class CashbackService:
             return cashback_data
 
         # Рассчитываем кешбек
-        calculated = self.calculate_cashback(user_id, month)
+        calculated = await self.calculate_cashback(user_id, month)
+        self.save_rollup(user_id, {month: calculated})
 
-        # Создаем новую запись
-        cashback_data = CashbackData(
-            user_id=user_id,
-            month=month,
-            total_cashback=Decimal(str(calculated["total_cashback"])),
-            transactions_count=calculated["transactions_count"],
-            average_cashback_rate=Decimal(str(calculated["average_cashback_rate"])),
-            categories_breakdown=json.dumps(calculated["categories_breakdown"])
-        )
-
-        self.db.add(cashback_data)
-        self.db.commit()
-        self.db.refresh(cashback_data)
-
-        return cashback_data
+        return self.db.query(CashbackData).filter(
+            CashbackData.user_id == user_id,
+            CashbackData.month == month
+        ).first()
 
-    def aggregate_cashback(self, user_id: int) -> Dict:
-        """Агрегированные данные о кешбеке за все месяцы"""
-        # Получаем данные за последние 12 месяцев
-        months = []
-        current = datetime.now()
-        for i in range(12):
-            month_date = current - timedelta(days=30 * i)
-            month_str = month_date.strftime("%Y-%m")
-            months.append(month_str)
+    async def aggregate_cashback(self, user_id: int) -> Dict:
+        """Агрегированные данные о кешбеке за последние 12 месяцев (только чтение cashback_data)"""
+        months = last_months(settings.CASHBACK_ROLLUP_MONTHS)
+        by_month, breakdowns = await self._read(
+            lambda service: (service._read_months(user_id, months), service.get_month_breakdowns(user_id, months))
+        )
 
         monthly_data = []
         total_cashback = Decimal("0")
         total_transactions = 0
 
         for month in months:
-            cashback_data = self.get_or_create_cashback_data(user_id, month)
-            breakdown = json.loads(cashback_data.categories_breakdown) if cashback_data.categories_breakdown else {}
-            total_amount = sum([cat.get("amount", 0) for cat in breakdown.values()])
+            cashback_data = by_month.get(month)
+            if cashback_data is None:
+                monthly_data.append(_empty_month(month))
+                continue
+
+            breakdown = breakdowns[month]
+            total_amount = sum([cat["amount"] for cat in breakdown.values()])
             
             monthly_data.append({
                 "month": month,
@@ -204,47 +379,44 @@ class CashbackService:
         return {
             "total_cashback": float(total_cashback),
             "total_transactions": total_transactions,
-            "average_monthly_cashback": float(total_cashback / Decimal("12")),
+            "average_monthly_cashback": float(total_cashback / Decimal(len(months))),
             "average_cashback_rate": float(avg_rate) if avg_rate else 0.0,
-            "monthly_data": monthly_data
+            "monthly_data": monthly_data,
+            "pending": len(by_month) < len(months)
         }
 
-    def get_categories_breakdown(
+    async def get_categories_breakdown(
         self,
         user_id: int,
         month: Optional[str] = None
     ) -> Dict:
-        """Разбивка кешбека по категориям"""
+        """Разбивка кешбека по категориям (суммирование по месяцам - в SQL)"""
         if month:
-            cashback_data = self.get_or_create_cashback_data(user_id, month)
-            return json.loads(cashback_data.categories_breakdown) if cashback_data.categories_breakdown else {}
-        else:
-            # За последние 3 месяца
-            current = datetime.now()
-            categories_total = defaultdict(lambda: {"amount": Decimal("0"), "cashback": Decimal("0"), "count": 0})
-
-            for i in range(3):
-                month_date = current - timedelta(days=30 * i)
-                month_str = month_date.strftime("%Y-%m")
-                cashback_data = self.get_or_create_cashback_data(user_id, month_str)
-                
-                if cashback_data.categories_breakdown:
-                    breakdown = json.loads(cashback_data.categories_breakdown)
-                    for category, data in breakdown.items():
-                        categories_total[category]["amount"] += Decimal(str(data["amount"]))
-                        categories_total[category]["cashback"] += Decimal(str(data["cashback"]))
-                        categories_total[category]["count"] += data["count"]
-
-            result = {}
-            for category, data in categories_total.items():
-                result[category] = {
-                    "amount": float(data["amount"]),
-                    "cashback": float(data["cashback"]),
-                    "count": data["count"],
-                    "rate": float((data["cashback"] / data["amount"] * Decimal("100")) if data["amount"] > 0 else Decimal("0"))
-                }
+            await self.get_or_create_cashback_data(user_id, month)
+            return self.get_month_breakdowns(user_id, [month])[month]
 
-            return result
+        # За последние 3 месяца
+        months = last_months(3)
+        rows = await self._read(lambda service: service._read_category_totals(user_id, months))
+
+        return {
+            category: self._category_entry(amount, cashback, count)
+            for category, amount, cashback, count in rows
+        }
+
+    def _read_category_totals(self, user_id: int, months: List[str]) -> List[Tuple]:
+        """Итоги по категориям за месяцы, суммированные в SQL"""
+        self._read_months(user_id, months)
+
+        return self.db.query(
+            CashbackCategoryTotal.category,
+            func.sum(CashbackCategoryTotal.amount),
+            func.sum(CashbackCategoryTotal.cashback),
+            func.sum(CashbackCategoryTotal.transactions_count)
+        ).filter(
+            CashbackCategoryTotal.user_id == user_id,
+            CashbackCategoryTotal.month.in_(months)
+        ).group_by(CashbackCategoryTotal.category).all()
 
     def create_consent(
         self,
@@ -267,7 +439,7 @@ class CashbackService:
 
         return consent
 
-    def export_cashback_data(
+    async def export_cashback_data(
         self,
         user_id: int,
         partner_id: Optional[int] = None
@@ -286,17 +458,35 @@ class CashbackService:
         if consent.expires_at and consent.expires_at < datetime.utcnow():
             return None, "Согласие на экспорт данных истекло"
 
-        # Получаем агрегированные данные
-        aggregated = self.aggregate_cashback(user_id)
+        # Итоги за 12 месяцев - агрегатами SQL по cashback_data и cashback_category_totals
+        months = last_months(settings.CASHBACK_ROLLUP_MONTHS)
+        self._read_months(user_id, months)
+
+        total_cashback, total_transactions = self.db.query(
+            func.coalesce(func.sum(CashbackData.total_cashback), 0),
+            func.coalesce(func.sum(CashbackData.transactions_count), 0)
+        ).filter(
+            CashbackData.user_id == user_id,
+            CashbackData.month.in_(months)
+        ).one()
+
+        total_amount = self.db.query(
+            func.coalesce(func.sum(CashbackCategoryTotal.amount), 0)
+        ).filter(
+            CashbackCategoryTotal.user_id == user_id,
+            CashbackCategoryTotal.month.in_(months)
+        ).scalar()
+
+        total_cashback, total_amount = float(total_cashback), float(total_amount)
 
         # Формируем данные для экспорта (анонимизированные)
         export_data = {
             "user_id_hash": f"user_{user_id}_hash",  # В реальности - хеш
-            "total_cashback_12m": aggregated["total_cashback"],
-            "average_monthly_cashback": aggregated["average_monthly_cashback"],
-            "average_cashback_rate": aggregated["average_cashback_rate"],
-            "total_transactions": aggregated["total_transactions"],
-            "categories_breakdown": aggregated["monthly_data"][0]["categories_breakdown"] if aggregated["monthly_data"] else {}
+            "total_cashback_12m": total_cashback,
+            "average_monthly_cashback": total_cashback / len(months),
+            "average_cashback_rate": (total_cashback / total_amount * 100) if total_amount > 0 else 0.0,
+            "total_transactions": int(total_transactions),
+            "categories_breakdown": self.get_month_breakdowns(user_id, months[:1])[months[0]]
         }
 
         return export_data, None
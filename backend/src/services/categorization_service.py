@@ -0,0 +1,137 @@
+import logging
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from typing import List, Optional, Tuple
+
+from src.config import settings
+from src.constants.constants import TransactionCategory
+from src.models.category_rule import CategoryRule
+from src.models.transaction import Transaction
+from src.services.spending_aggregate_service import SpendingAggregateService
+from src.utils.analytics_kernel import CATEGORIES, categorize_columns
+from src.utils.categorizer import Categorizer, default_categorizer, normalize_mcc
+
+logger = logging.getLogger(__name__)
+
+# Скомпилированные правила пользователей: user_id -> ((количество правил, последний id), категоризатор)
+_user_categorizers: "OrderedDict[int, Tuple[Tuple[int, Optional[int]], Categorizer]]" = OrderedDict()
+
+class CategorizationService:
+    """
+    Категоризация с пользовательскими правилами поверх общих.
+    Правила пользователя компилируются в отдельный категоризатор (базой служит общий)
+    и переиспользуются, пока набор правил в БД не изменился.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_categorizer(self, user_id: int) -> Categorizer:
+        count, last_id = self.db.query(
+            func.count(CategoryRule.id),
+            func.max(CategoryRule.id)
+        ).filter(CategoryRule.user_id == user_id).one()
+
+        if not count:
+            return default_categorizer
+
+        stamp = (count, last_id)
+        cached = _user_categorizers.get(user_id)
+        if cached and cached[0] == stamp:
+            _user_categorizers.move_to_end(user_id)
+            return cached[1]
+
+        rules = self.list_rules(user_id)
+
+        # Более новое правило важнее: для MCC перезаписывает старое, ключевые слова проверяются первыми
+        mcc_codes = {rule.mcc_code: TransactionCategory(rule.category) for rule in reversed(rules) if rule.mcc_code}
+        keyword_rules = [(TransactionCategory(rule.category), [rule.keyword]) for rule in rules if rule.keyword]
+
+        categorizer = Categorizer(
+            mcc_codes,
+            keyword_rules,
+            base=default_categorizer,
+            cache_size=settings.CATEGORIZER_USER_CACHE_SIZE
+        )
+
+        _user_categorizers[user_id] = (stamp, categorizer)
+        _user_categorizers.move_to_end(user_id)
+        while len(_user_categorizers) > settings.CATEGORIZER_MAX_USERS:
+            _user_categorizers.popitem(last=False)
+
+        return categorizer
+
+    def list_rules(self, user_id: int) -> List[CategoryRule]:
+        return self.db.query(CategoryRule).filter(
+            CategoryRule.user_id == user_id
+        ).order_by(CategoryRule.id.desc()).all()
+
+    def create_rule(
+        self,
+        user_id: int,
+        category: str,
+        mcc_code: Optional[str] = None,
+        keyword: Optional[str] = None
+    ) -> Tuple[Optional[CategoryRule], Optional[str]]:
+        if category not in {item.value for item in TransactionCategory}:
+            return None, "Неизвестная категория"
+
+        keyword = (keyword or "").strip().lower() or None
+        if mcc_code is not None:
+            mcc_code = normalize_mcc(mcc_code)
+            if not mcc_code:
+                return None, "MCC код должен состоять из 4 цифр"
+
+        if bool(mcc_code) == bool(keyword):
+            return None, "Укажите либо MCC код, либо ключевое слово"
+
+        rule = CategoryRule(user_id=user_id, category=category, mcc_code=mcc_code, keyword=keyword)
+        self.db.add(rule)
+        self.db.commit()
+        self.db.refresh(rule)
+
+        logger.info(f"✅ Правило категоризации {rule.id} создано для пользователя {user_id}")
+        self.recategorize_user(user_id)
+        return rule, None
+
+    def delete_rule(self, user_id: int, rule_id: int) -> Optional[str]:
+        rule = self.db.query(CategoryRule).filter(
+            CategoryRule.id == rule_id,
+            CategoryRule.user_id == user_id
+        ).first()
+
+        if not rule:
+            return "Правило не найдено"
+
+        self.db.delete(rule)
+        self.db.commit()
+
+        self.recategorize_user(user_id)
+        return None
+
+    def recategorize_user(self, user_id: int) -> int:
+        """Пересчитать категории сохранённых транзакций и агрегаты после изменения правил"""
+        rows = self.db.query(
+            Transaction.id,
+            Transaction.mcc_code,
+            Transaction.description,
+            Transaction.category
+        ).filter(Transaction.user_id == user_id).all()
+
+        changed = []
+        if rows:
+            ids, mcc_codes, descriptions, categories = zip(*rows)
+            codes = categorize_columns(mcc_codes, descriptions, self.get_categorizer(user_id))
+            for txn_id, old_category, code in zip(ids, categories, codes):
+                category = CATEGORIES[code].value
+                if category != old_category:
+                    changed.append({"id": txn_id, "category": category})
+
+        if changed:
+            self.db.bulk_update_mappings(Transaction, changed)
+
+        SpendingAggregateService(self.db).rebuild_user(user_id)
+
+        logger.info(f"🔄 Перекатегоризировано {len(changed)} транзакций пользователя {user_id}")
+        return len(changed)
@@ -0,0 +1,151 @@
+import logging
+import time
+import httpx
+import redis.asyncio as aioredis
+from typing import Any, Dict, List, Tuple
+
+from src.config import settings
+from src.constants.bank_config import BANK_NAMES
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Банк временно исключён из запросов: circuit breaker открыт"""
+
+class BankCircuitBreaker:
+    """
+    Circuit breaker по банкам. Состояние хранится в Redis и общее для всех воркеров:
+    circuit:{bank_id} - hash (state, failures, opened_at),
+    circuit_latency:{bank_id}:{endpoint} - последние задержки для p95 и адаптивных таймаутов.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis_client = redis_client
+
+    @staticmethod
+    def _state_key(bank_id: int) -> str:
+        return f"circuit:{bank_id}"
+
+    @staticmethod
+    def _latency_key(bank_id: int, endpoint: str) -> str:
+        return f"circuit_latency:{bank_id}:{endpoint}"
+
+    @staticmethod
+    def _probe_key(bank_id: int) -> str:
+        return f"circuit_probe:{bank_id}"
+
+    @staticmethod
+    def _p95(latencies: List[float]) -> float:
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _timeout_from_latencies(self, latencies: List[float]) -> httpx.Timeout:
+        if len(latencies) < settings.BANK_CIRCUIT_MIN_SAMPLES:
+            read_timeout = settings.BANK_HTTP_TIMEOUT
+        else:
+            read_timeout = self._p95(latencies) * settings.BANK_TIMEOUT_P95_MULTIPLIER
+            read_timeout = max(settings.BANK_TIMEOUT_MIN, min(read_timeout, settings.BANK_HTTP_TIMEOUT))
+
+        return httpx.Timeout(read_timeout, connect=min(settings.BANK_HTTP_CONNECT_TIMEOUT, read_timeout))
+
+    async def check(self, bank_id: int, endpoint: str) -> Tuple[bool, httpx.Timeout, bool]:
+        """
+        Можно ли отправить запрос в банк, с каким таймаутом и пробный ли это запрос
+        half-open (по нему обязательно нужно записать исход или освободить пробу)
+        """
+        pipe = self.redis_client.pipeline()
+        pipe.hgetall(self._state_key(bank_id))
+        pipe.lrange(self._latency_key(bank_id, endpoint), 0, -1)
+        circuit, latencies = await pipe.execute()
+
+        timeout = self._timeout_from_latencies([float(x) for x in latencies])
+        state = circuit.get("state", STATE_CLOSED)
+
+        if state == STATE_CLOSED:
+            return True, timeout, False
+
+        if state == STATE_OPEN:
+            opened_at = float(circuit.get("opened_at", 0))
+            if time.time() - opened_at < settings.BANK_CIRCUIT_OPEN_SECONDS:
+                return False, timeout, False
+            await self.redis_client.hset(self._state_key(bank_id), "state", STATE_HALF_OPEN)
+            logger.info(f"🟡 Circuit breaker банка {bank_id} переведён в half-open")
+
+        # half-open: пропускаем только один пробный запрос за раз
+        probe_acquired = await self.redis_client.set(
+            self._probe_key(bank_id),
+            "1",
+            nx=True,
+            ex=settings.BANK_CIRCUIT_PROBE_LEASE_SECONDS
+        )
+        return bool(probe_acquired), timeout, bool(probe_acquired)
+
+    async def release_probe(self, bank_id: int) -> None:
+        """Пробный запрос завершился без вердикта (например, отменён) - следующий может пробовать сразу"""
+        await self.redis_client.delete(self._probe_key(bank_id))
+
+    async def _open(self, bank_id: int, endpoint: str, reason: str) -> None:
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self._state_key(bank_id), mapping={
+            "state": STATE_OPEN,
+            "opened_at": time.time(),
+            "failures": 0,
+            "reason": reason
+        })
+        pipe.delete(self._latency_key(bank_id, endpoint))
+        pipe.delete(self._probe_key(bank_id))
+        await pipe.execute()
+        logger.warning(f"🔴 Circuit breaker банка {bank_id} открыт: {reason}")
+
+    async def record_success(self, bank_id: int, endpoint: str, latency: float) -> None:
+        pipe = self.redis_client.pipeline()
+        pipe.hget(self._state_key(bank_id), "state")
+        pipe.hset(self._state_key(bank_id), "failures", 0)
+        pipe.lpush(self._latency_key(bank_id, endpoint), round(latency, 3))
+        pipe.ltrim(self._latency_key(bank_id, endpoint), 0, settings.BANK_CIRCUIT_LATENCY_WINDOW - 1)
+        pipe.lrange(self._latency_key(bank_id, endpoint), 0, -1)
+        state, _, _, _, latencies = await pipe.execute()
+
+        if state == STATE_HALF_OPEN:
+            pipe = self.redis_client.pipeline()
+            pipe.hset(self._state_key(bank_id), mapping={"state": STATE_CLOSED, "reason": ""})
+            pipe.delete(self._probe_key(bank_id))
+            await pipe.execute()
+            logger.info(f"🟢 Circuit breaker банка {bank_id} закрыт")
+            return
+
+        latencies = [float(x) for x in latencies]
+        if len(latencies) >= settings.BANK_CIRCUIT_MIN_SAMPLES:
+            p95 = self._p95(latencies)
+            if p95 > settings.BANK_CIRCUIT_LATENCY_THRESHOLD:
+                await self._open(bank_id, endpoint, f"p95 {endpoint} = {p95:.1f}с")
+
+    async def record_failure(self, bank_id: int, endpoint: str, error: str) -> None:
+        pipe = self.redis_client.pipeline()
+        pipe.hget(self._state_key(bank_id), "state")
+        pipe.hincrby(self._state_key(bank_id), "failures", 1)
+        state, failures = await pipe.execute()
+
+        if state == STATE_HALF_OPEN:
+            await self._open(bank_id, endpoint, f"пробный запрос не прошёл: {error}")
+        elif failures >= settings.BANK_CIRCUIT_FAILURE_THRESHOLD:
+            await self._open(bank_id, endpoint, f"{failures} ошибок подряд: {error}")
+
+    async def get_all_states(self) -> Dict[str, Dict[str, Any]]:
+        pipe = self.redis_client.pipeline()
+        for bank_id in BANK_NAMES:
+            pipe.hgetall(self._state_key(bank_id))
+        circuits = await pipe.execute()
+
+        result = {}
+        for (bank_id, bank_name), circuit in zip(BANK_NAMES.items(), circuits):
+            result[bank_name] = {
+                "state": circuit.get("state", STATE_CLOSED),
+                "failures": int(circuit.get("failures", 0)),
+                "reason": circuit.get("reason") or None
+            }
+        return result
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import time
+import redis.asyncio as aioredis
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from sqlalchemy import select, update
+
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.models.account import BankAccount
+from src.models.bank_consent import BankConsent
+from src.redis_client import acquire_lock_async, release_lock_async
+from src.utils.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from src.services.bank_client import AsyncBankClient
+
+logger = logging.getLogger(__name__)
+
+# Одно создание/продление consent на (user_id, bank_id) внутри процесса
+_consent_flight = SingleFlight()
+
+class ConsentUnavailableError(Exception):
+    """Банк не выдал одобренное согласие (ошибка банка или согласие ждёт подтверждения)"""
+
+class ConsentRegistry:
+    """
+    Реестр согласий на чтение счетов. Согласия хранятся в БД вместе с разрешениями
+    и сроком действия, в Redis (consent:{user_id}:{bank_id}) лежит актуальное.
+    Новое согласие запрашивается только если нет действующего с нужными разрешениями,
+    и сразу на объединение разрешений, чтобы следующие запросы его переиспользовали.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis, bank_client: "AsyncBankClient"):
+        self.redis_client = redis_client
+        self.bank_client = bank_client
+
+    @staticmethod
+    def _cache_key(user_id: int, bank_id: int) -> str:
+        return f"consent:{user_id}:{bank_id}"
+
+    @staticmethod
+    def _covers(consent: Dict[str, Any], permissions: List[str]) -> bool:
+        return set(permissions).issubset(consent["permissions"])
+
+    async def _get_cached(self, user_id: int, bank_id: int) -> Optional[Dict[str, Any]]:
+        cached = await self.redis_client.get(self._cache_key(user_id, bank_id))
+        if not cached:
+            return None
+        try:
+            consent = json.loads(cached)
+        except ValueError:
+            return None
+        return consent if isinstance(consent, dict) else None
+
+    async def _cache(self, user_id: int, bank_id: int, consent: Dict[str, Any]) -> None:
+        ttl = int(consent["expiresAt"] - time.time())
+        if ttl > 0:
+            await self.redis_client.setex(self._cache_key(user_id, bank_id), ttl, json.dumps(consent))
+
+    @staticmethod
+    def _to_dict(record: BankConsent) -> Dict[str, Any]:
+        return {
+            "consentId": record.consent_id,
+            "permissions": json.loads(record.permissions),
+            "expiresAt": record.expires_at.timestamp()
+        }
+
+    async def get_consent(
+        self,
+        user_id: int,
+        bank_id: int,
+        client_id: str,
+        permissions: List[str]
+    ) -> str:
+        cached = await self._get_cached(user_id, bank_id)
+        if cached and self._covers(cached, permissions):
+            self._renew_if_expiring(user_id, bank_id, client_id, cached)
+            return cached["consentId"]
+
+        flight_key = (user_id, bank_id, tuple(sorted(permissions)))
+        consent = await _consent_flight.do(
+            flight_key,
+            lambda: self._resolve(user_id, bank_id, client_id, permissions)
+        )
+        return consent["consentId"]
+
+    def _renew_if_expiring(
+        self,
+        user_id: int,
+        bank_id: int,
+        client_id: str,
+        consent: Dict[str, Any]
+    ) -> None:
+        if consent["expiresAt"] - time.time() >= settings.CONSENT_RENEW_MARGIN:
+            return
+
+        logger.info(f"🔄 Consent {consent['consentId']} скоро истекает, продлеваем в фоне")
+        _consent_flight.spawn(
+            ("renew", user_id, bank_id),
+            lambda: self._resolve(user_id, bank_id, client_id, consent["permissions"], renew=True)
+        )
+
+    async def _resolve(
+        self,
+        user_id: int,
+        bank_id: int,
+        client_id: str,
+        permissions: List[str],
+        renew: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Найти подходящее согласие в БД или создать новое под Redis-локом,
+        чтобы между воркерами в банк уходил только один запрос на (user, bank).
+        """
+        lock_key = f"consent_lock:{user_id}:{bank_id}"
+        loop = asyncio.get_running_loop()
+        wait_until = loop.time() + settings.consent_lock_wait
+
+        while True:
+            lock_token = await acquire_lock_async(self.redis_client, lock_key, settings.consent_lock_lease_ms)
+            if lock_token:
+                try:
+                    if not renew:
+                        consent = await self._find_covering(user_id, bank_id, permissions)
+                        if consent:
+                            await self._cache(user_id, bank_id, consent)
+                            return consent
+                    return await self._create(user_id, bank_id, client_id, permissions)
+                finally:
+                    await release_lock_async(self.redis_client, lock_key, lock_token)
+
+            cached = await self._get_cached(user_id, bank_id)
+            if cached and self._covers(cached, permissions):
+                if not renew or cached["expiresAt"] - time.time() >= settings.CONSENT_RENEW_MARGIN:
+                    # Согласие уже создал (или продлил) другой воркер
+                    return cached
+
+            if loop.time() >= wait_until:
+                logger.warning(f"⚠️  Не дождались consent банка {bank_id} от другого воркера, запрашиваем сами")
+                return await self._create(user_id, bank_id, client_id, permissions)
+
+            await asyncio.sleep(0.1)
+
+    async def _find_covering(
+        self,
+        user_id: int,
+        bank_id: int,
+        permissions: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        min_expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.CONSENT_RENEW_MARGIN)
+
+        async with AsyncSessionLocal() as db:
+            records = await db.scalars(
+                select(BankConsent).where(
+                    BankConsent.user_id == user_id,
+                    BankConsent.bank_id == bank_id,
+                    BankConsent.status == "active",
+                    BankConsent.expires_at > min_expires_at
+                ).order_by(BankConsent.expires_at.desc())
+            )
+
+            for record in records:
+                consent = self._to_dict(record)
+                if self._covers(consent, permissions):
+                    return consent
+            return None
+
+    async def _create(
+        self,
+        user_id: int,
+        bank_id: int,
+        client_id: str,
+        permissions: List[str]
+    ) -> Dict[str, Any]:
+        async with AsyncSessionLocal() as db:
+            active_permissions = await db.scalars(
+                select(BankConsent.permissions).where(
+                    BankConsent.user_id == user_id,
+                    BankConsent.bank_id == bank_id,
+                    BankConsent.status == "active"
+                )
+            )
+
+            # Запрашиваем сразу всё, что уже было выдано, чтобы новое согласие заменило старые
+            all_permissions = set(permissions)
+            for record_permissions in active_permissions:
+                all_permissions.update(json.loads(record_permissions))
+            all_permissions = sorted(all_permissions)
+
+        # Соединение с БД не держим, пока ждём банк
+        consent_id = await self.bank_client.create_consent(user_id, bank_id, client_id, all_permissions)
+        if not consent_id:
+            # Ничего не сохраняем: действующие согласия и счета остаются как были
+            raise ConsentUnavailableError(f"Банк {bank_id} не выдал согласие")
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.CONSENT_REQUEST_TTL)
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(BankConsent)
+                .where(
+                    BankConsent.user_id == user_id,
+                    BankConsent.bank_id == bank_id,
+                    BankConsent.status == "active",
+                    BankConsent.consent_id != consent_id
+                )
+                .values(status="replaced")
+            )
+
+            record = await db.scalar(select(BankConsent).where(BankConsent.consent_id == consent_id))
+            if record is None:
+                record = BankConsent(user_id=user_id, bank_id=bank_id, consent_id=consent_id)
+                db.add(record)
+
+            record.client_id = client_id
+            record.permissions = json.dumps(all_permissions)
+            record.status = "active"
+            record.expires_at = expires_at
+
+            await db.execute(
+                update(BankAccount)
+                .where(
+                    BankAccount.user_id == user_id,
+                    BankAccount.bank_id == bank_id,
+                    ~BankAccount.account_id.like("virtual-%")
+                )
+                .values(consent_id=consent_id)
+            )
+
+            await db.commit()
+
+        consent = {
+            "consentId": consent_id,
+            "permissions": all_permissions,
+            "expiresAt": expires_at.timestamp()
+        }
+        await self._cache(user_id, bank_id, consent)
+
+        logger.info(f"✅ Consent {consent_id} сохранён в реестре (user {user_id}, банк {bank_id})")
+        return consent
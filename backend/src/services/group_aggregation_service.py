@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import settings
+from src.constants.bank_config import get_bank_name
+from src.database import AsyncSessionLocal
+from src.redis_client import get_async_redis
+from src.models.account import BankAccount
+from src.models.group import GroupMember
+from src.models.user import User
+from src.services.account_service import AccountService
+from src.services.bank_data_cache import account_data_version_key
+from src.utils.fanout import fan_out
+
+logger = logging.getLogger(__name__)
+
+class GroupAggregationService:
+    """
+    Сводные балансы и транзакции группы (семьи).
+    Счета всех членов группы загружаются одним запросом, данные из банков - параллельно.
+    Готовый агрегат хранится в Redis вместе с версиями данных членов группы
+    (account_data_version:{user_id}) и считается недействительным, как только
+    у кого-то из них изменились данные счетов или поменялся состав группы.
+    БД читается через асинхронную сессию async_db.
+    """
+
+    def __init__(self, db: Session, redis_client: redis.Redis, async_db: AsyncSession):
+        self.db = db
+        self.async_db = async_db
+        self.redis_client = redis_client
+        self.async_redis = get_async_redis()
+        self.account_service = AccountService(db, redis_client)
+
+    @staticmethod
+    def load_member_accounts(
+        db: Session,
+        group_id: int,
+        bank_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Все счета членов группы вместе с владельцем - одним запросом"""
+        query = (
+            db.query(BankAccount, User)
+            .join(GroupMember, GroupMember.user_id == BankAccount.user_id)
+            .join(User, User.id == BankAccount.user_id)
+            .filter(GroupMember.group_id == group_id)
+        )
+
+        if bank_id:
+            query = query.filter(BankAccount.bank_id == bank_id)
+
+        result = []
+        for account, owner in query.order_by(User.id, BankAccount.id).all():
+            result.append({
+                "userId": owner.id,
+                "owner": {"name": owner.name},
+                "accountId": account.account_id,
+                "accountName": account.account_name,
+                "clientId": account.bank_id,
+                "clientName": get_bank_name(account.bank_id)
+            })
+        return result
+
+    async def _member_ids(self, group_id: int) -> List[int]:
+        user_ids = await self.async_db.scalars(
+            select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+        )
+        return sorted(user_ids)
+
+    @staticmethod
+    def _aggregate_key(group_id: int, kind: str, bank_id: Optional[int]) -> str:
+        return f"group_aggregate:{group_id}:{kind}:{bank_id or 'all'}"
+
+    async def _read_aggregate(self, key: str, member_ids: List[int]) -> Tuple[Optional[Any], Dict[str, str]]:
+        """
+        Агрегат, если версии данных всех членов группы не изменились, и текущие версии
+        (один round trip). Версии нужно передать в _save_aggregate: снятые до загрузки,
+        они не дадут сохранить агрегат поверх изменений, случившихся во время загрузки.
+        """
+        pipe = self.async_redis.pipeline()
+        pipe.get(key)
+        for user_id in member_ids:
+            pipe.get(account_data_version_key(user_id))
+        cached, *member_versions = await pipe.execute()
+        versions = self._versions(member_ids, member_versions)
+
+        if not cached:
+            return None, versions
+
+        aggregate = json.loads(cached)
+        if aggregate.get("versions") != versions:
+            return None, versions
+        return aggregate["data"], versions
+
+    @staticmethod
+    def _versions(member_ids: List[int], member_versions: List[Optional[str]]) -> Dict[str, str]:
+        return {str(user_id): version or "0" for user_id, version in zip(member_ids, member_versions)}
+
+    async def _save_aggregate(self, key: str, versions: Dict[str, str], data: Any) -> None:
+        await self.async_redis.setex(
+            key,
+            settings.GROUP_AGGREGATE_TTL,
+            json.dumps({"versions": versions, "data": data})
+        )
+
+    async def get_balances(self, group_id: int, bank_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        key = self._aggregate_key(group_id, "balances", bank_id)
+        member_ids = await self._member_ids(group_id)
+        data, versions = await self._read_aggregate(key, member_ids)
+        if data is not None:
+            logger.info(f"✅ Используем агрегат балансов группы {group_id}")
+            return data
+
+        accounts = await self.async_db.run_sync(self.load_member_accounts, group_id, bank_id)
+
+        accounts_by_member: Dict[int, List[Dict[str, Any]]] = {}
+        for acc in accounts:
+            accounts_by_member.setdefault(acc["userId"], []).append(acc)
+
+        # Кеш балансов всех членов группы - одним MGET, промахи каждого члена - одним
+        # батчем в банк (токен и consent на банк один)
+        cached = self.account_service.cache.get_many([
+            f"balance:{acc['userId']}:{acc['accountId']}" for acc in accounts
+        ])
+        async def member_balances(user_id: int, member_accounts: List[Dict[str, Any]]) -> Dict[str, Any]:
+            # Батчи идут параллельно, а AsyncSession не допускает конкурентных запросов
+            async with AsyncSessionLocal() as db:
+                return await self.account_service.get_balances_batch(
+                    db,
+                    user_id,
+                    [acc["accountId"] for acc in member_accounts],
+                    cached=cached
+                )
+
+        batches = await asyncio.gather(*[
+            member_balances(user_id, member_accounts)
+            for user_id, member_accounts in accounts_by_member.items()
+        ])
+
+        # Один и тот же accountId банка может быть у разных членов группы
+        balances_by_account = {}
+        for user_id, batch in zip(accounts_by_member, batches):
+            for item in batch["balances"]:
+                balances_by_account[(user_id, item["accountId"])] = item["balance"]
+            for error in batch["errors"]:
+                logger.error(f"Ошибка получения баланса {error['accountId']}: {error['error']}")
+
+        balances = []
+        for acc in accounts:
+            balance = balances_by_account.get((acc["userId"], acc["accountId"]))
+            if balance is None:
+                continue
+            balances.append({
+                "clientId": str(acc["clientId"]),
+                "name": acc["clientName"],
+                "accountName": acc["accountName"],
+                "owner": acc["owner"],
+                "balance": balance
+            })
+
+        await self._save_aggregate(key, versions, balances)
+        return balances
+
+    async def get_transactions(self, group_id: int, bank_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        key = self._aggregate_key(group_id, "transactions", bank_id)
+        member_ids = await self._member_ids(group_id)
+        data, versions = await self._read_aggregate(key, member_ids)
+        if data is not None:
+            logger.info(f"✅ Используем агрегат транзакций группы {group_id}")
+            return data
+
+        accounts = await self.async_db.run_sync(self.load_member_accounts, group_id, bank_id)
+
+        results, errors = await fan_out(
+            accounts,
+            lambda acc: self.account_service.get_account_transactions(
+                acc["userId"],
+                acc["accountId"],
+                acc["clientId"]
+            )
+        )
+
+        for error in errors:
+            logger.error(f"Ошибка получения транзакций {error['accountId']}: {error['error']}")
+
+        all_transactions = []
+        for acc, transactions in results:
+            for txn in transactions:
+                all_transactions.append({
+                    **txn,
+                    "owner": acc["owner"],
+                    "accountName": acc["accountName"]
+                })
+
+        all_transactions.sort(key=lambda x: x.get("date", ""), reverse=True)
+
+        await self._save_aggregate(key, versions, all_transactions)
+        return all_transactions
@@ -4,7 +4,6 @@ from typing import List, Optional, Tuple, Dict, Any
 
 from src.models.group import Group, GroupMember
 from src.models.user import User
-from src.models.account import BankAccount
 from src.constants.constants import AccountType, ACCOUNT_LIMITS, GroupRole
 
 logger = logging.getLogger(__name__)
@@ -142,24 +141,18 @@ class GroupService:
 
     @staticmethod
     def get_group_accounts(db: Session, group_id: int) -> List[Dict[str, Any]]:
-        members = GroupService.get_group_members(db, group_id)
-
-        result = []
-        for member in members:
-            accounts = db.query(BankAccount).filter(BankAccount.user_id == member.id).all()
-
-            for acc in accounts:
-                result.append({
-                    "owner": {
-                        "name": member.name
-                    },
-                    "clientId": str(acc.bank_id),
-                    "clientName": GroupService._get_bank_name(acc.bank_id),
-                    "accountId": acc.account_id,
-                    "accountName": acc.account_name
-                })
-
-        return result
+        from src.services.group_aggregation_service import GroupAggregationService
+
+        return [
+            {
+                "owner": acc["owner"],
+                "clientId": str(acc["clientId"]),
+                "clientName": acc["clientName"],
+                "accountId": acc["accountId"],
+                "accountName": acc["accountName"]
+            }
+            for acc in GroupAggregationService.load_member_accounts(db, group_id)
+        ]
 
     @staticmethod
     def can_add_member(
@@ -189,11 +182,6 @@ class GroupService:
         group = db.query(Group).filter(Group.id == group_id).first()
         return group and group.owner_id == user_id
 
-    @staticmethod
-    def _get_bank_name(bank_id: int) -> str:
-        bank_names = {1: "vbank", 2: "sbank", 3: "abank"}
-        return bank_names.get(bank_id, f"bank{bank_id}")
-    
     @staticmethod
     def get_member_role(db: Session, group_id: int, user_id: int) -> Optional[GroupRole]:
         """
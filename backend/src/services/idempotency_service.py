@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+import redis.asyncio as aioredis
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from src.config import settings
+from src.models.idempotency import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+# Поле сохранённого ответа, которым отмечена ошибка (статус и detail для повтора)
+ERROR_FIELD = "_error"
+
+def _redis_key(user_id: int, key: str) -> str:
+    return f"idempotency:{user_id}:{key}"
+
+class IdempotencyService:
+    """
+    Повтор платёжных запросов по заголовку Idempotency-Key.
+    Первый запрос с ключом занимает его (SET NX в Redis + строка с уникальным
+    (user_id, key) в БД) и сохраняет ответ; повтор отдаёт сохранённый ответ сразу,
+    без проверок баланса и обращений к банку. Пока исходный запрос выполняется,
+    повтор получает 409. Если запрос завершился ошибкой до первого коммита в сессии
+    запроса, ключ освобождается - ничего не сохранено, и клиент может повторить
+    запрос с тем же ключом. Если коммит уже был (платёж сохранён), ошибка
+    сохраняется как ответ ключа и отдаётся повторам, чтобы платёж не прошёл дважды.
+    """
+
+    def __init__(self, db: Session, redis_client: aioredis.Redis):
+        self.db = db
+        self.redis_client = redis_client
+
+    async def run(
+        self,
+        user_id: int,
+        key: Optional[str],
+        scope: str,
+        payload: BaseModel,
+        handler: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Выполнить handler не более одного раза для ключа; без ключа - просто выполнить"""
+        if not key:
+            return await handler()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key длиннее {MAX_KEY_LENGTH} символов"
+            )
+
+        fingerprint = hashlib.sha256(f"{scope}:{payload.model_dump_json()}".encode()).hexdigest()
+        redis_key = _redis_key(user_id, key)
+
+        claimed = await self.redis_client.set(
+            redis_key,
+            json.dumps({"fingerprint": fingerprint, "response": None}),
+            nx=True,
+            ex=settings.IDEMPOTENCY_LOCK_TTL
+        )
+        if not claimed:
+            raw = await self.redis_client.get(redis_key)
+            stored = json.loads(raw) if raw else {"fingerprint": fingerprint, "response": None}
+            return self._replay(user_id, key, fingerprint, stored["fingerprint"], stored["response"])
+
+        record = self._claim_record(user_id, key, scope, fingerprint)
+        if record.fingerprint != fingerprint or record.response is not None:
+            # Redis потерял ключ, но запрос уже был: ответ берём из БД
+            await self._cache(redis_key, record.fingerprint, record.response)
+            return self._replay(user_id, key, fingerprint, record.fingerprint, record.response)
+
+        commits = []
+        on_commit = lambda session: commits.append(True)
+        event.listen(self.db, "after_commit", on_commit)
+        try:
+            response = jsonable_encoder(await handler())
+        except BaseException as e:
+            event.remove(self.db, "after_commit", on_commit)
+            self.db.rollback()
+            if commits:
+                logger.warning(f"⚠️ Запрос по ключу идемпотентности упал после коммита: user_id={user_id}")
+                record.response = self._error_response(e)
+                self.db.commit()
+                await self._cache(redis_key, fingerprint, record.response)
+            else:
+                self.db.query(IdempotencyKey).filter(IdempotencyKey.id == record.id).delete()
+                self.db.commit()
+                await self.redis_client.delete(redis_key)
+            raise
+        event.remove(self.db, "after_commit", on_commit)
+
+        record.response = response
+        self.db.commit()
+        await self._cache(redis_key, fingerprint, response)
+        return response
+
+    def _claim_record(self, user_id: int, key: str, scope: str, fingerprint: str) -> IdempotencyKey:
+        """
+        Строка ключа в БД. Если ключ уже занят, возвращается существующая строка;
+        незавершённая строка старше IDEMPOTENCY_LOCK_TTL (запрос оборвался) перезанимается.
+        """
+        record = IdempotencyKey(user_id=user_id, key=key, scope=scope, fingerprint=fingerprint)
+        self.db.add(record)
+        try:
+            self.db.commit()
+            return record
+        except IntegrityError:
+            self.db.rollback()
+
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TTL)
+        taken_over = self.db.execute(
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.response.is_(None),
+                IdempotencyKey.created_at < stale_before
+            )
+            .values(scope=scope, fingerprint=fingerprint, created_at=func.now())
+        ).rowcount
+        self.db.commit()
+        if taken_over:
+            logger.warning(f"⚠️ Перезанят незавершённый ключ идемпотентности: user_id={user_id}")
+
+        record = self.db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key
+        ).one()
+        if taken_over or record.response is not None or record.fingerprint != fingerprint:
+            return record
+        # Тот же запрос выполняется прямо сейчас (например, в другом воркере)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Запрос с этим Idempotency-Key ещё выполняется"
+        )
+
+    async def _cache(self, redis_key: str, fingerprint: str, response: Optional[Dict[str, Any]]) -> None:
+        if response is None:
+            await self.redis_client.delete(redis_key)
+            return
+        await self.redis_client.set(
+            redis_key,
+            json.dumps({"fingerprint": fingerprint, "response": response}),
+            ex=settings.IDEMPOTENCY_KEY_TTL
+        )
+
+    @staticmethod
+    def _error_response(error: BaseException) -> Dict[str, Any]:
+        if isinstance(error, HTTPException):
+            return {ERROR_FIELD: {"status_code": error.status_code, "detail": jsonable_encoder(error.detail)}}
+        return {ERROR_FIELD: {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": "Внутренняя ошибка сервера"}}
+
+    @staticmethod
+    def _replay(
+        user_id: int,
+        key: str,
+        fingerprint: str,
+        stored_fingerprint: str,
+        response: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        if stored_fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key уже использован для другого запроса"
+            )
+        if response is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Запрос с этим Idempotency-Key ещё выполняется"
+            )
+        logger.info(f"🔄 Повтор запроса по ключу идемпотентности: user_id={user_id}, key={key[:16]}")
+        if ERROR_FIELD in response:
+            raise HTTPException(**response[ERROR_FIELD])
+        return response
@@ -0,0 +1,111 @@
+import logging
+import redis
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Хеш ledger_balance:{user_id}:
+#   {account_id}   - проекция журнала в копейках
+#   {account_id}:v - id последней проводки, вошедшей в загруженное из БД значение
+#   _gen           - поколение, растёт при каждом применении платежа
+# Проводки по счёту журнала коммитятся в порядке id (счёт заблокирован до коммита),
+# поэтому значение из БД содержит ровно проводки с id <= версии, и нога платежа
+# прибавляется, только если её проводка новее. Поколение не даёт записать снимок
+# из БД, если между его чтением и записью платёж уже был применён к кешу.
+
+# KEYS - хеши пользователей; ARGV: ttl, затем четвёрки (номер ключа, account_id, дельта в копейках, id проводки).
+# Отсутствующее в кеше поле не создаётся - оно будет прочитано из БД. TTL хеша не продлевается.
+ADJUST_SCRIPT = """
+for i = 2, #ARGV, 4 do
+    local key = KEYS[tonumber(ARGV[i])]
+    local field = ARGV[i + 1]
+    if redis.call("hexists", key, field) == 1
+        and tonumber(ARGV[i + 3]) > tonumber(redis.call("hget", key, field .. ":v") or "0") then
+        redis.call("hincrby", key, field, ARGV[i + 2])
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call("hincrby", key, "_gen", 1)
+    if redis.call("ttl", key) < 0 then
+        redis.call("expire", key, ARGV[1])
+    end
+end
+return 1
+"""
+
+# KEYS[1] - хеш пользователя; ARGV: ttl, ожидаемое поколение, затем тройки (account_id, копейки, версия)
+LOAD_SCRIPT = """
+if (redis.call("hget", KEYS[1], "_gen") or "0") ~= ARGV[2] then
+    return 0
+end
+for i = 3, #ARGV, 3 do
+    redis.call("hset", KEYS[1], ARGV[i], ARGV[i + 1], ARGV[i] .. ":v", ARGV[i + 2])
+end
+if redis.call("ttl", KEYS[1]) < 0 then
+    redis.call("expire", KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+GENERATION_FIELD = "_gen"
+
+# (user_id, account_id, дельта, id проводки)
+LedgerLeg = Tuple[int, str, Decimal, int]
+
+def ledger_balance_key(user_id: int) -> str:
+    return f"ledger_balance:{user_id}"
+
+def _to_kopecks(amount: Decimal) -> int:
+    return int((amount * 100).to_integral_value())
+
+class LedgerBalanceCache:
+    """
+    Проекции журнала в Redis. Суммы хранятся целыми копейками в хеше, обе ноги
+    платежа применяются после коммита одним Lua-скриптом (HINCRBY на сервере) -
+    один сетевой вызов и никаких гонок "прочитал-изменил-записал".
+    Клиент синхронный: кеш вызывается из LedgerService внутри синхронной сессии БД
+    (в том числе через run_sync), где await недоступен.
+    """
+
+    def __init__(self, redis_client: redis.Redis, ttl: Optional[int] = None):
+        self.redis_client = redis_client
+        self.ttl = ttl or settings.LEDGER_BALANCE_CACHE_TTL
+
+    def get_many(self, user_id: int, account_ids: List[str]) -> Tuple[Dict[str, Decimal], str]:
+        """Закешированные проекции и поколение хеша (его нужно передать в load)"""
+        values = self.redis_client.hmget(ledger_balance_key(user_id), [GENERATION_FIELD] + account_ids)
+        generation, amounts = values[0] or "0", values[1:]
+        cached = {
+            account_id: Decimal(int(amount)) / 100
+            for account_id, amount in zip(account_ids, amounts)
+            if amount is not None
+        }
+        return cached, generation
+
+    def load(self, user_id: int, generation: str, balances: Dict[str, Tuple[Decimal, int]]) -> bool:
+        """Записать снимок из БД (account_id -> (проекция, версия)), если поколение не изменилось"""
+        if not balances:
+            return False
+        args: List = [self.ttl, generation]
+        for account_id, (amount, version) in balances.items():
+            args.extend([account_id, _to_kopecks(amount), version])
+        return self.redis_client.eval(LOAD_SCRIPT, 1, ledger_balance_key(user_id), *args) == 1
+
+    def adjust(self, legs: Iterable[LedgerLeg]) -> None:
+        """Применить ноги платежей атомарно, одним вызовом"""
+        keys: List[str] = []
+        args: List = [self.ttl]
+        for user_id, account_id, delta, entry_id in legs:
+            key = ledger_balance_key(user_id)
+            if key not in keys:
+                keys.append(key)
+            args.extend([keys.index(key) + 1, account_id, _to_kopecks(delta), entry_id])
+        if keys:
+            self.redis_client.eval(ADJUST_SCRIPT, len(keys), *keys, *args)
+
+    def invalidate(self, *user_ids: int) -> None:
+        if user_ids:
+            self.redis_client.delete(*[ledger_balance_key(user_id) for user_id in set(user_ids)])
@@ -0,0 +1,220 @@
+import logging
+import redis
+from decimal import Decimal
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.models.account import BankAccount
+from src.models.ledger import LedgerAccount, LedgerEntry
+from src.models.payment import Payment
+from src.services.ledger_balance_cache import LedgerBalanceCache, LedgerLeg
+
+logger = logging.getLogger(__name__)
+
+EXTERNAL_ACCOUNT_CODE = "external"
+
+def _money(value: float) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+
+class LedgerService:
+    """
+    Внутренний журнал с двойной записью для платежей внутри приложения.
+    Проводки и изменение проекций балансов делаются в транзакции платежа: счета журнала
+    блокируются SELECT ... FOR UPDATE в порядке id, проверка средств выполняется уже под
+    блокировкой, поэтому параллельные переводы с одного счёта не могут списать больше остатка.
+    Коммит - на вызывающей стороне; после него publish() переносит изменения в кеш проекций.
+    """
+
+    def __init__(self, db: Session, redis_client: Optional[redis.Redis] = None):
+        self.db = db
+        self.cache = LedgerBalanceCache(redis_client) if redis_client is not None else None
+        # Ноги проведённых, но ещё не применённых к кешу платежей
+        self._pending: List[LedgerLeg] = []
+
+    def _ensure_accounts(self, accounts: Iterable[BankAccount]) -> None:
+        rows = [{"bank_account_id": acc.id, "user_id": acc.user_id, "balance": 0} for acc in accounts]
+        if rows:
+            self.db.execute(
+                insert(LedgerAccount).values(rows).on_conflict_do_nothing(index_elements=["bank_account_id"])
+            )
+
+    def _external_account(self) -> LedgerAccount:
+        account = self.db.query(LedgerAccount).filter(LedgerAccount.code == EXTERNAL_ACCOUNT_CODE).first()
+        if account is None:
+            self.db.execute(
+                insert(LedgerAccount)
+                .values(code=EXTERNAL_ACCOUNT_CODE, balance=0)
+                .on_conflict_do_nothing(index_elements=["code"])
+            )
+            account = self.db.query(LedgerAccount).filter(LedgerAccount.code == EXTERNAL_ACCOUNT_CODE).one()
+        return account
+
+    def _lock(self, accounts: List[BankAccount]) -> Dict[int, LedgerAccount]:
+        """Счета журнала для банковских счетов, заблокированные до конца транзакции"""
+        self._ensure_accounts(accounts)
+        locked = self.db.execute(
+            select(LedgerAccount)
+            .where(LedgerAccount.bank_account_id.in_([acc.id for acc in accounts]))
+            .order_by(LedgerAccount.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).scalars()
+        return {account.bank_account_id: account for account in locked}
+
+    def post_payment(
+        self,
+        payment: Payment,
+        from_account: BankAccount,
+        bank_balance: Optional[float],
+        to_account: Optional[BankAccount] = None
+    ) -> Optional[str]:
+        """
+        Проводки платежа: списание с from_account и зачисление на to_account
+        (или на внешний счёт, если получатель вне приложения).
+        bank_balance - баланс счёта в банке; доступно bank_balance + проекция журнала.
+        Если баланс банка неизвестен, проверка средств пропускается.
+        Возвращает текст ошибки или None.
+        """
+        return self.post_payments([(payment, from_account, to_account)], {from_account.id: bank_balance})[0]
+
+    def post_payments(
+        self,
+        postings: List[Tuple[Payment, BankAccount, Optional[BankAccount]]],
+        bank_balances: Dict[int, Optional[float]]
+    ) -> List[Optional[str]]:
+        """
+        Проводки нескольких платежей (payment, счёт списания, счёт зачисления или None).
+        Все счета журнала блокируются один раз, средства проверяются нарастающим итогом
+        по каждому счёту списания (bank_balances: BankAccount.id -> баланс в банке).
+        Платёж, на который не хватило средств, в сессию не добавляется, остальные проводятся.
+        Возвращает ошибки по позициям (None - платёж проведён).
+        """
+        accounts = {acc.id: acc for _, from_account, to_account in postings for acc in (from_account, to_account) if acc}
+        locked = self._lock(list(accounts.values())) if accounts else {}
+
+        available: Dict[int, Decimal] = {}
+        accepted = []
+        errors: List[Optional[str]] = []
+        for payment, from_account, to_account in postings:
+            amount = _money(payment.amount)
+            if amount <= 0:
+                errors.append("Сумма платежа должна быть больше нуля")
+                continue
+
+            bank_balance = bank_balances.get(from_account.id)
+            if bank_balance is not None:
+                if from_account.id not in available:
+                    available[from_account.id] = _money(bank_balance) + locked[from_account.id].balance
+                if available[from_account.id] < amount:
+                    logger.error(f"❌ Недостаточно средств: доступно={available[from_account.id]}₽, требуется={amount}₽")
+                    errors.append(
+                        f"Недостаточно средств на счете. Текущий баланс: {float(available[from_account.id])}₽, "
+                        f"требуется: {float(amount)}₽"
+                    )
+                    continue
+                logger.info(f"✅ Баланс проверен под блокировкой: {available[from_account.id]}₽ >= {amount}₽")
+                available[from_account.id] -= amount
+
+            accepted.append((payment, from_account, to_account, amount))
+            errors.append(None)
+
+        if not accepted:
+            return errors
+
+        self.db.add_all([payment for payment, _, _, _ in accepted])
+        self.db.flush()
+
+        external = None
+        deltas: Dict[int, Decimal] = {}
+        legs = []
+        for payment, from_account, to_account, amount in accepted:
+            debit = locked[from_account.id]
+            if to_account:
+                credit = locked[to_account.id]
+            else:
+                external = external or self._external_account()
+                credit = external
+            debit_entry = LedgerEntry(payment_id=payment.id, ledger_account_id=debit.id, amount=-amount)
+            credit_entry = LedgerEntry(payment_id=payment.id, ledger_account_id=credit.id, amount=amount)
+            self.db.add_all([debit_entry, credit_entry])
+
+            deltas[from_account.id] = deltas.get(from_account.id, Decimal("0")) - amount
+            legs.append((from_account, -amount, debit_entry))
+            if to_account:
+                deltas[to_account.id] = deltas.get(to_account.id, Decimal("0")) + amount
+                legs.append((to_account, amount, credit_entry))
+
+        # Атомарные дельты проекций, по одной на счёт; строки уже заблокированы этой транзакцией
+        for bank_account_id, delta in deltas.items():
+            locked[bank_account_id].balance = LedgerAccount.balance + delta
+        self.db.flush()
+
+        self._pending.extend(
+            (account.user_id, account.account_id, delta, entry.id) for account, delta, entry in legs
+        )
+        return errors
+
+    def publish(self) -> None:
+        """После коммита: применить ноги платежей к кешу проекций одним вызовом"""
+        legs, self._pending = self._pending, []
+        if self.cache is None or not legs:
+            return
+        try:
+            self.cache.adjust(legs)
+        except Exception as cache_error:
+            logger.warning(f"⚠️  Не удалось обновить кеш проекций журнала: {cache_error}")
+            try:
+                self.cache.invalidate(*[leg[0] for leg in legs])
+            except Exception:
+                pass
+
+    def get_balances(self, user_id: int, account_ids: Iterable[str]) -> Dict[str, Decimal]:
+        """Проекции журнала по account_id счетов пользователя: из кеша, промахи - одним запросом"""
+        account_ids = list(account_ids)
+        if not account_ids:
+            return {}
+
+        balances: Dict[str, Decimal] = {}
+        generation = None
+        if self.cache is not None:
+            try:
+                balances, generation = self.cache.get_many(user_id, account_ids)
+            except Exception as cache_error:
+                logger.warning(f"⚠️  Кеш проекций журнала недоступен: {cache_error}")
+
+        missing = [account_id for account_id in account_ids if account_id not in balances]
+        if missing:
+            loaded = self._read_balances(user_id, missing)
+            # Счета без проводок кешируются нулём, чтобы не ходить за ними в БД
+            loaded = {account_id: loaded.get(account_id, (Decimal("0"), 0)) for account_id in missing}
+            if generation is not None:
+                try:
+                    self.cache.load(user_id, generation, loaded)
+                except Exception as cache_error:
+                    logger.warning(f"⚠️  Не удалось закешировать проекции журнала: {cache_error}")
+            balances.update({account_id: balance for account_id, (balance, _) in loaded.items()})
+        return balances
+
+    def _read_balances(self, user_id: int, account_ids: List[str]) -> Dict[str, Tuple[Decimal, int]]:
+        """account_id -> (проекция, id последней проводки) - одним запросом, из одного снимка"""
+        last_entry_id = (
+            select(func.max(LedgerEntry.id))
+            .where(LedgerEntry.ledger_account_id == LedgerAccount.id)
+            .correlate(LedgerAccount)
+            .scalar_subquery()
+        )
+        rows = (
+            self.db.query(BankAccount.account_id, LedgerAccount.balance, last_entry_id)
+            .join(LedgerAccount, LedgerAccount.bank_account_id == BankAccount.id)
+            .filter(BankAccount.user_id == user_id, BankAccount.account_id.in_(account_ids))
+        )
+        return {account_id: (balance, version or 0) for account_id, balance, version in rows}
+
+    def apply_to_balances(self, user_id: int, balances: Dict[str, Dict[str, Any]]) -> None:
+        """Добавить проекцию журнала к балансам из банка: account_id -> {"amount": ...}"""
+        for account_id, delta in self.get_balances(user_id, balances.keys()).items():
+            if delta:
+                balance = balances[account_id]
+                balance["amount"] = round(balance.get("amount", 0) + float(delta), 2)
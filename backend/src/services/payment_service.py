@@ -2,27 +2,56 @@
 Сервис для работы с платежами
 """
 import logging
+from sqlalchemy import and_, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime
-from src.models.payment import Payment, PaymentType, PaymentStatus
+from src.models.payment import Payment, PaymentTemplate, PaymentType, PaymentStatus
 from src.models.user import User
 from src.models.account import BankAccount
 from src.config import settings
+from src.redis_client import get_redis
+from src.services.bank_data_cache import BankDataCache
+from src.services.ledger_service import LedgerService
+from src.services.spending_aggregate_service import SpendingAggregateService
+from src.schemas.payment import PaymentTemplateCreate, TemplateExecutionItem
+from src.utils.fanout import fan_out
+from src.utils.pagination import decode_cursor, encode_cursor
 
 logger = logging.getLogger(__name__)
 
+UTILITY_PAYMENT_TYPES = {
+    PaymentType.MOBILE,
+    PaymentType.UTILITIES,
+    PaymentType.INTERNET,
+    PaymentType.TV,
+    PaymentType.PHONE,
+    PaymentType.ELECTRICITY,
+}
+
+# Шаблоны - для регулярных переводов и оплаты услуг; Premium и наличные через них не проводятся
+TEMPLATE_PAYMENT_TYPES = {PaymentType.TO_PERSON, PaymentType.CARD_TO_CARD, PaymentType.TO_ORGANIZATION} | UTILITY_PAYMENT_TYPES
+
 
 class PaymentService:
     """Сервис для управления платежами"""
     
+    @staticmethod
+    def _invalidate_account_data(keys: List[str]) -> None:
+        """Сбросить кеш транзакций счетов после платежа (заодно поднимает версии данных для групп)"""
+        try:
+            BankDataCache(get_redis()).invalidate(*keys)
+        except Exception as cache_error:
+            logger.warning(f"⚠️  Не удалось сбросить кеш счетов: {cache_error}")
+    
     @staticmethod
     def search_user_by_phone(db: Session, phone: str) -> Optional[User]:
         """Поиск пользователя по номеру телефона"""
         return db.query(User).filter(User.phone == phone, User.is_verified == True).first()
     
     @staticmethod
-    def create_internal_transfer(
+    async def create_internal_transfer(
         db: Session,
         user_id: int,
         from_account_id: int,
@@ -57,36 +86,13 @@ class PaymentService:
             logger.error(f"❌ Попытка перевода самому себе: user_id={user_id}")
             return None, "Нельзя переводить самому себе"
         
-        # ЗАЩИТА ОТ ДУБЛИКАТОВ: Проверяем, не был ли уже создан идентичный платеж в последние 5 секунд
-        from datetime import timedelta
-        recent_duplicate = db.query(Payment).filter(
-            Payment.user_id == user_id,
-            Payment.to_user_id == recipient.id,
-            Payment.to_phone == to_phone,
-            Payment.amount == amount,
-            Payment.payment_type == PaymentType.TO_PERSON,
-            Payment.status == PaymentStatus.COMPLETED,
-            Payment.created_at >= datetime.utcnow() - timedelta(seconds=5)
-        ).first()
-        
-        if recent_duplicate:
-            logger.warning(f"⚠️  Обнаружен дубликат платежа! ID дубликата: {recent_duplicate.id}, создан: {recent_duplicate.created_at}")
-            return None, f"Похожий платеж уже был создан недавно (ID: {recent_duplicate.id}). Пожалуйста, подождите несколько секунд."
-        
-        # Проверяем баланс перед переводом
+        # Баланс в банке; сама проверка средств - в журнале под блокировкой счетов
+        bank_balance = None
         try:
             from src.services.account_service import AccountService
-            import redis
             
-            redis_client = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                decode_responses=True
-            )
-            
-            account_service = AccountService(db, redis_client)
-            balance_data = account_service.get_account_balance(
+            account_service = AccountService(db, get_redis())
+            balance_data = await account_service.get_bank_balance(
                 user_id=user_id,
                 account_id=from_account.account_id,
                 bank_id=from_account.bank_id
@@ -95,14 +101,16 @@ class PaymentService:
             if not balance_data:
                 logger.warning(f"⚠️  Не удалось получить баланс, продолжаем без проверки")
             else:
-                current_balance = balance_data.get("amount", 0)
-                if current_balance < amount:
-                    logger.error(f"❌ Недостаточно средств: баланс={current_balance}₽, требуется={amount}₽")
-                    return None, f"Недостаточно средств на счете. Текущий баланс: {current_balance}₽, требуется: {amount}₽"
-                logger.info(f"✅ Баланс проверен: {current_balance}₽ >= {amount}₽")
+                bank_balance = balance_data.get("amount", 0)
         except Exception as e:
             logger.warning(f"⚠️  Ошибка проверки баланса: {e}, продолжаем без проверки")
         
+        # Зачисляем на счёт получателя с наивысшим приоритетом
+        recipient_account = db.query(BankAccount).filter(
+            BankAccount.user_id == recipient.id,
+            BankAccount.is_active == True
+        ).order_by(BankAccount.priority.asc()).first()
+        
         # Создаем платеж
         payment = Payment(
             user_id=user_id,
@@ -121,97 +129,22 @@ class PaymentService:
         
         db.add(payment)
         try:
+            # Проводки журнала и месячные агрегаты аналитики - в той же транзакции, что и платёж
+            ledger = LedgerService(db, get_redis())
+            error = ledger.post_payment(payment, from_account, bank_balance, recipient_account)
+            if error:
+                db.rollback()
+                return None, error
+            SpendingAggregateService(db).apply_payment(payment)
             db.commit()
+            ledger.publish()
             db.refresh(payment)
             logger.info(f"✅ Платеж {payment.id} успешно создан: {amount}₽ от пользователя {user_id} к {recipient.id}")
             
-            # Обновляем кеш балансов счетов
-            try:
-                import redis
-                import json
-                from src.config import settings
-                
-                redis_client = redis.Redis(
-                    host=settings.REDIS_HOST,
-                    port=settings.REDIS_PORT,
-                    db=settings.REDIS_DB,
-                    decode_responses=True
-                )
-                
-                # Обновляем баланс отправителя (уменьшаем)
-                balance_key_sender = f"balance:{user_id}:{from_account.account_id}"
-                cached_balance_sender = redis_client.get(balance_key_sender)
-                
-                if cached_balance_sender:
-                    balance_data_sender = json.loads(cached_balance_sender)
-                    current_balance_sender = balance_data_sender.get("amount", 0)
-                    
-                    # Проверяем, не был ли баланс уже обновлен (защита от двойного списания)
-                    # Если баланс уже меньше чем должен быть после списания, значит уже был списан
-                    expected_balance = current_balance_sender - amount
-                    if balance_data_sender.get("amount", current_balance_sender) <= expected_balance:
-                        logger.warning(f"⚠️  Баланс уже был обновлен ранее! Текущий: {balance_data_sender.get('amount')}₽, ожидаемый: {expected_balance}₽")
-                    else:
-                        new_balance_sender = current_balance_sender - amount
-                        balance_data_sender["amount"] = max(0, new_balance_sender)
-                        
-                        redis_client.setex(
-                            balance_key_sender,
-                            settings.BANK_DATA_CACHE_TTL,
-                            json.dumps(balance_data_sender)
-                        )
-                        logger.info(f"✅ Обновлен баланс отправителя в кеше: {current_balance_sender}₽ -> {balance_data_sender['amount']}₽ (списано {amount}₽)")
-                else:
-                    logger.warning(f"⚠️  Баланс отправителя не найден в кеше для {balance_key_sender}")
-                
-                # Обновляем баланс получателя (увеличиваем)
-                # Находим счет получателя с наивысшим приоритетом
-                recipient_account = db.query(BankAccount).filter(
-                    BankAccount.user_id == recipient.id,
-                    BankAccount.is_active == True
-                ).order_by(BankAccount.priority.asc()).first()
-                
-                if recipient_account:
-                    balance_key_recipient = f"balance:{recipient.id}:{recipient_account.account_id}"
-                    cached_balance_recipient = redis_client.get(balance_key_recipient)
-                    
-                    if cached_balance_recipient:
-                        balance_data_recipient = json.loads(cached_balance_recipient)
-                        current_balance_recipient = balance_data_recipient.get("amount", 0)
-                        
-                        # Проверяем, не был ли баланс уже обновлен (защита от двойного начисления)
-                        expected_balance = current_balance_recipient + amount
-                        if balance_data_recipient.get("amount", current_balance_recipient) >= expected_balance:
-                            logger.warning(f"⚠️  Баланс получателя уже был обновлен ранее! Текущий: {balance_data_recipient.get('amount')}₽, ожидаемый: {expected_balance}₽")
-                        else:
-                            new_balance_recipient = current_balance_recipient + amount
-                            balance_data_recipient["amount"] = new_balance_recipient
-                            
-                            redis_client.setex(
-                                balance_key_recipient,
-                                settings.BANK_DATA_CACHE_TTL,
-                                json.dumps(balance_data_recipient)
-                            )
-                            logger.info(f"✅ Обновлен баланс получателя в кеше: {current_balance_recipient}₽ -> {balance_data_recipient['amount']}₽ (начислено {amount}₽)")
-                else:
-                    logger.warning(f"⚠️  Баланс получателя не найден в кеше для {balance_key_recipient}")
-                
-                # Инвалидируем кеш транзакций для получателя
-                transactions_key_recipient = f"transactions:{recipient.id}:{recipient_account.account_id}"
-                redis_client.delete(transactions_key_recipient)
-                logger.info(f"✅ Инвалидирован кеш транзакций для получателя {recipient_account.account_id}")
-                
-            except Exception as cache_error:
-                logger.warning(f"⚠️  Не удалось обновить кеш баланса: {cache_error}")
-                # Не блокируем платеж из-за ошибки кеша
-            
-            # Инвалидируем кеш транзакций для отправителя
-            try:
-                transactions_key_sender = f"transactions:{user_id}:{from_account.account_id}"
-                redis_client.delete(transactions_key_sender)
-                logger.info(f"✅ Инвалидирован кеш транзакций для отправителя {from_account.account_id}")
-            except Exception as e:
-                logger.warning(f"⚠️  Не удалось инвалидировать кеш транзакций: {e}")
+            invalidate = [f"transactions:{user_id}:{from_account.account_id}"]
+            if recipient_account:
+                invalidate.append(f"transactions:{recipient.id}:{recipient_account.account_id}")
+            PaymentService._invalidate_account_data(invalidate)
             
         except Exception as e:
             db.rollback()
@@ -221,7 +154,7 @@ class PaymentService:
         return payment, None
     
     @staticmethod
-    def create_card_transfer(
+    async def create_card_transfer(
         db: Session,
         user_id: int,
         from_account_id: int,
@@ -239,20 +172,13 @@ class PaymentService:
         if not from_account:
             return None, "Счет отправителя не найден"
         
-        # Проверяем баланс перед переводом
+        # Проверяем баланс перед переводом (проверка средств - в журнале под блокировкой)
+        bank_balance = None
         try:
             from src.services.account_service import AccountService
-            import redis
             
-            redis_client = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                decode_responses=True
-            )
-            
-            account_service = AccountService(db, redis_client)
-            balance_data = account_service.get_account_balance(
+            account_service = AccountService(db, get_redis())
+            balance_data = await account_service.get_bank_balance(
                 user_id=user_id,
                 account_id=from_account.account_id,
                 bank_id=from_account.bank_id
@@ -261,12 +187,7 @@ class PaymentService:
             if not balance_data:
                 return None, "Не удалось получить баланс счета"
             
-            current_balance = balance_data.get("amount", 0)
-            
-            if current_balance < amount:
-                return None, f"Недостаточно средств на счете. Текущий баланс: {current_balance}₽, требуется: {amount}₽"
-            
-            logger.info(f"✅ Баланс проверен для перевода на карту: {current_balance}₽ >= {amount}₽")
+            bank_balance = balance_data.get("amount", 0)
             
         except Exception as e:
             logger.error(f"Ошибка проверки баланса: {e}")
@@ -290,46 +211,18 @@ class PaymentService:
         
         db.add(payment)
         try:
+            ledger = LedgerService(db, get_redis())
+            error = ledger.post_payment(payment, from_account, bank_balance)
+            if error:
+                db.rollback()
+                return None, error
+            SpendingAggregateService(db).apply_payment(payment)
             db.commit()
+            ledger.publish()
             db.refresh(payment)
             logger.info(f"✅ Платеж карта-карта {payment.id} успешно создан: {amount}₽ от пользователя {user_id}")
             
-            # Обновляем кеш баланса счета (уменьшаем баланс на сумму платежа)
-            try:
-                import redis
-                import json
-                from src.config import settings
-                
-                redis_client = redis.Redis(
-                    host=settings.REDIS_HOST,
-                    port=settings.REDIS_PORT,
-                    db=settings.REDIS_DB,
-                    decode_responses=True
-                )
-                
-                balance_key = f"balance:{user_id}:{from_account.account_id}"
-                cached_balance = redis_client.get(balance_key)
-                
-                if cached_balance:
-                    balance_data = json.loads(cached_balance)
-                    current_balance = balance_data.get("amount", 0)
-                    new_balance = current_balance - amount
-                    balance_data["amount"] = max(0, new_balance)
-                    
-                    redis_client.setex(
-                        balance_key,
-                        settings.BANK_DATA_CACHE_TTL,
-                        json.dumps(balance_data)
-                    )
-                    logger.info(f"✅ Обновлен баланс в кеше для перевода на карту: {current_balance}₽ -> {balance_data['amount']}₽ (списано {amount}₽)")
-                
-                # Инвалидируем кеш транзакций
-                transactions_key = f"transactions:{user_id}:{from_account.account_id}"
-                redis_client.delete(transactions_key)
-                logger.info(f"✅ Инвалидирован кеш транзакций для {from_account.account_id}")
-                
-            except Exception as cache_error:
-                logger.warning(f"⚠️  Не удалось обновить кеш баланса: {cache_error}")
+            PaymentService._invalidate_account_data([f"transactions:{user_id}:{from_account.account_id}"])
             
         except Exception as e:
             db.rollback()
@@ -339,7 +232,7 @@ class PaymentService:
         return payment, None
     
     @staticmethod
-    def create_utility_payment(
+    async def create_utility_payment(
         db: Session,
         user_id: int,
         from_account_id: int,
@@ -357,20 +250,13 @@ class PaymentService:
         if not from_account:
             return None, "Счет отправителя не найден"
         
-        # Проверяем баланс перед оплатой
+        # Проверяем баланс перед оплатой (проверка средств - в журнале под блокировкой)
+        bank_balance = None
         try:
             from src.services.account_service import AccountService
-            import redis
-            
-            redis_client = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                decode_responses=True
-            )
             
-            account_service = AccountService(db, redis_client)
-            balance_data = account_service.get_account_balance(
+            account_service = AccountService(db, get_redis())
+            balance_data = await account_service.get_bank_balance(
                 user_id=user_id,
                 account_id=from_account.account_id,
                 bank_id=from_account.bank_id
@@ -379,12 +265,7 @@ class PaymentService:
             if not balance_data:
                 return None, "Не удалось получить баланс счета"
             
-            current_balance = balance_data.get("amount", 0)
-            
-            if current_balance < amount:
-                return None, f"Недостаточно средств на счете. Текущий баланс: {current_balance}₽, требуется: {amount}₽"
-            
-            logger.info(f"✅ Баланс проверен для оплаты услуг: {current_balance}₽ >= {amount}₽")
+            bank_balance = balance_data.get("amount", 0)
             
         except Exception as e:
             logger.error(f"Ошибка проверки баланса: {e}")
@@ -420,46 +301,18 @@ class PaymentService:
         
         db.add(payment)
         try:
+            ledger = LedgerService(db, get_redis())
+            error = ledger.post_payment(payment, from_account, bank_balance)
+            if error:
+                db.rollback()
+                return None, error
+            SpendingAggregateService(db).apply_payment(payment)
             db.commit()
+            ledger.publish()
             db.refresh(payment)
             logger.info(f"✅ Платеж услуг {payment.id} успешно создан: {amount}₽ от пользователя {user_id}")
             
-            # Обновляем кеш баланса счета (уменьшаем баланс на сумму платежа)
-            try:
-                import redis
-                import json
-                from src.config import settings
-                
-                redis_client = redis.Redis(
-                    host=settings.REDIS_HOST,
-                    port=settings.REDIS_PORT,
-                    db=settings.REDIS_DB,
-                    decode_responses=True
-                )
-                
-                balance_key = f"balance:{user_id}:{from_account.account_id}"
-                cached_balance = redis_client.get(balance_key)
-                
-                if cached_balance:
-                    balance_data = json.loads(cached_balance)
-                    current_balance = balance_data.get("amount", 0)
-                    new_balance = current_balance - amount
-                    balance_data["amount"] = max(0, new_balance)
-                    
-                    redis_client.setex(
-                        balance_key,
-                        settings.BANK_DATA_CACHE_TTL,
-                        json.dumps(balance_data)
-                    )
-                    logger.info(f"✅ Обновлен баланс в кеше для оплаты услуг: {current_balance}₽ -> {balance_data['amount']}₽ (списано {amount}₽)")
-                
-                # Инвалидируем кеш транзакций
-                transactions_key = f"transactions:{user_id}:{from_account.account_id}"
-                redis_client.delete(transactions_key)
-                logger.info(f"✅ Инвалидирован кеш транзакций для {from_account.account_id}")
-                
-            except Exception as cache_error:
-                logger.warning(f"⚠️  Не удалось обновить кеш баланса: {cache_error}")
+            PaymentService._invalidate_account_data([f"transactions:{user_id}:{from_account.account_id}"])
             
         except Exception as e:
             db.rollback()
@@ -468,25 +321,337 @@ class PaymentService:
         
         return payment, None
     
+    @staticmethod
+    def create_template(
+        db: Session,
+        user_id: int,
+        data: PaymentTemplateCreate
+    ) -> Tuple[Optional[PaymentTemplate], Optional[str]]:
+        """Сохранить шаблон платежа"""
+        try:
+            payment_type = PaymentType(data.payment_type)
+        except ValueError:
+            payment_type = None
+        if payment_type not in TEMPLATE_PAYMENT_TYPES:
+            return None, f"Тип платежа не поддерживается в шаблонах: {data.payment_type}"
+        if payment_type == PaymentType.TO_PERSON and not data.to_phone:
+            return None, "Укажите телефон получателя"
+        if payment_type != PaymentType.TO_PERSON and not data.to_account:
+            return None, "Укажите номер счета получателя"
+        
+        template = PaymentTemplate(
+            user_id=user_id,
+            payment_type=payment_type,
+            name=data.name,
+            to_phone=data.to_phone,
+            to_account=data.to_account,
+            to_name=data.to_name,
+            amount=data.amount,
+            description=data.description
+        )
+        db.add(template)
+        db.commit()
+        db.refresh(template)
+        return template, None
+    
+    @staticmethod
+    def get_templates(db: Session, user_id: int) -> List[PaymentTemplate]:
+        return db.query(PaymentTemplate).filter(
+            PaymentTemplate.user_id == user_id
+        ).order_by(PaymentTemplate.created_at.desc()).all()
+    
+    @staticmethod
+    def _resolve_recipients(db: Session, phones: Set[str]) -> Dict[str, Tuple[User, Optional[BankAccount]]]:
+        """Получатели по телефонам и их счета с наивысшим приоритетом - одним запросом"""
+        if not phones:
+            return {}
+        rows = db.query(User, BankAccount).outerjoin(
+            BankAccount,
+            and_(BankAccount.user_id == User.id, BankAccount.is_active == True)
+        ).filter(
+            User.phone.in_(phones),
+            User.is_verified == True
+        ).order_by(User.id, BankAccount.priority.asc())
+        
+        recipients: Dict[str, Tuple[User, Optional[BankAccount]]] = {}
+        for user, account in rows:
+            recipients.setdefault(user.phone, (user, account))
+        return recipients
+    
+    @staticmethod
+    def _template_payment(
+        user_id: int,
+        template: PaymentTemplate,
+        from_account: BankAccount,
+        amount: float,
+        recipients: Dict[str, Tuple[User, Optional[BankAccount]]]
+    ) -> Tuple[Optional[Payment], Optional[BankAccount], Optional[str]]:
+        """Платёж по шаблону: (платёж, счёт зачисления внутри приложения, ошибка)"""
+        payment = Payment(
+            user_id=user_id,
+            payment_type=template.payment_type,
+            amount=amount,
+            currency="RUB",
+            from_account_id=from_account.id,
+            from_account_name=from_account.account_name,
+            description=template.description,
+            purpose=template.name,
+            status=PaymentStatus.COMPLETED,
+            completed_at=datetime.utcnow()
+        )
+        
+        if template.payment_type != PaymentType.TO_PERSON:
+            payment.to_account = template.to_account
+            payment.to_name = template.to_name or template.to_account
+            if template.payment_type in UTILITY_PAYMENT_TYPES and not payment.description:
+                payment.description = f"Оплата {payment.to_name} - {template.to_account}"
+            return payment, None, None
+        
+        recipient, recipient_account = recipients.get(template.to_phone, (None, None))
+        if not recipient:
+            return None, None, f"Пользователь с номером {template.to_phone} не найден в системе"
+        if recipient.id == user_id:
+            return None, None, "Нельзя переводить самому себе"
+        
+        payment.to_user_id = recipient.id
+        payment.to_phone = template.to_phone
+        payment.to_name = recipient.name
+        return payment, recipient_account, None
+    
+    @staticmethod
+    async def execute_templates(
+        db: Session,
+        user_id: int,
+        items: List[TemplateExecutionItem]
+    ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        """
+        Пакетное исполнение шаблонов.
+        Шаблоны, счета списания и получатели загружаются по одному запросу на вид,
+        баланс в банке запрашивается один раз на счёт списания (параллельно),
+        средства проверяются в журнале нарастающим итогом, все платежи сохраняются
+        одним коммитом. Возвращает результат по каждой позиции.
+        """
+        templates = {
+            template.id: template
+            for template in db.query(PaymentTemplate).filter(
+                PaymentTemplate.user_id == user_id,
+                PaymentTemplate.id.in_({item.template_id for item in items})
+            )
+        }
+        from_accounts = {
+            account.id: account
+            for account in db.query(BankAccount).filter(
+                BankAccount.user_id == user_id,
+                BankAccount.id.in_({item.from_account_id for item in items})
+            )
+        }
+        recipients = PaymentService._resolve_recipients(db, {
+            template.to_phone
+            for template in templates.values()
+            if template.payment_type == PaymentType.TO_PERSON and template.to_phone
+        })
+        
+        errors: Dict[int, str] = {}
+        postings: Dict[int, Tuple[Payment, BankAccount, Optional[BankAccount]]] = {}
+        for index, item in enumerate(items):
+            template = templates.get(item.template_id)
+            from_account = from_accounts.get(item.from_account_id)
+            amount = item.amount or (template.amount if template else None)
+            if not template:
+                errors[index] = "Шаблон не найден"
+            elif template.payment_type not in TEMPLATE_PAYMENT_TYPES:
+                errors[index] = f"Тип платежа не поддерживается в шаблонах: {template.payment_type.value}"
+            elif not from_account:
+                errors[index] = "Счет отправителя не найден"
+            elif not amount:
+                errors[index] = "Укажите сумму: в шаблоне она не задана"
+            else:
+                payment, to_account, error = PaymentService._template_payment(
+                    user_id, template, from_account, amount, recipients
+                )
+                if error:
+                    errors[index] = error
+                else:
+                    postings[index] = (payment, from_account, to_account)
+        
+        # Баланс в банке - один запрос на счёт списания
+        from src.services.account_service import AccountService
+        
+        account_service = AccountService(db, get_redis())
+        sources = [
+            {"id": account.id, "accountId": account.account_id, "clientId": account.bank_id}
+            for account in {from_account.id: from_account for _, from_account, _ in postings.values()}.values()
+        ]
+        fetched, fetch_errors = await fan_out(
+            sources,
+            lambda source: account_service.get_bank_balance(user_id, source["accountId"], source["clientId"])
+        )
+        bank_balances: Dict[int, Optional[float]] = {
+            source["id"]: balance_data.get("amount", 0)
+            for source, balance_data in fetched
+            if balance_data
+        }
+        if len(bank_balances) < len(sources):
+            if settings.DEBUG:
+                logger.warning(f"⚠️  Продолжаем без проверки баланса (DEBUG режим): {fetch_errors}")
+            else:
+                for index, (_, from_account, _) in list(postings.items()):
+                    if from_account.id not in bank_balances:
+                        errors[index] = "Не удалось получить баланс счета"
+                        del postings[index]
+        
+        posted: List[int] = []
+        summaries: Dict[int, Dict[str, Any]] = {}
+        if postings:
+            try:
+                ledger = LedgerService(db, get_redis())
+                indexes = list(postings.keys())
+                ledger_errors = ledger.post_payments([postings[index] for index in indexes], bank_balances)
+                for index, error in zip(indexes, ledger_errors):
+                    if error:
+                        errors[index] = error
+                    else:
+                        posted.append(index)
+                
+                aggregates = SpendingAggregateService(db)
+                invalidate = set()
+                for index in posted:
+                    payment, from_account, to_account = postings[index]
+                    aggregates.apply_payment(payment)
+                    invalidate.add(f"transactions:{user_id}:{from_account.account_id}")
+                    if to_account:
+                        invalidate.add(f"transactions:{to_account.user_id}:{to_account.account_id}")
+                    # Пока объекты не сброшены коммитом - без повторного чтения каждого платежа
+                    summaries[index] = {
+                        "id": payment.id,
+                        "paymentType": payment.payment_type.value,
+                        "amount": payment.amount,
+                        "status": payment.status.value,
+                        "toName": payment.to_name,
+                        "createdAt": payment.created_at.isoformat()
+                    }
+                db.commit()
+                ledger.publish()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Ошибка сохранения платежей по шаблонам: {e}")
+                return None, f"Ошибка сохранения платежей: {str(e)}"
+            
+            PaymentService._invalidate_account_data(list(invalidate))
+            logger.info(f"✅ Шаблоны исполнены: {len(posted)} из {len(items)} платежей для пользователя {user_id}")
+        
+        results = []
+        for index, item in enumerate(items):
+            if index in errors:
+                results.append({"templateId": item.template_id, "success": False, "error": errors[index]})
+                continue
+            results.append({"templateId": item.template_id, "success": True, "payment": summaries[index]})
+        return results, None
+    
+    @staticmethod
+    def _history_queries(
+        user_id: int,
+        limit: int,
+        cursor: Optional[str],
+        payment_types: Optional[List[PaymentType]],
+        direction: Optional[str]
+    ) -> list:
+        """
+        Исходящие (user_id) и входящие (to_user_id) платежи - отдельными запросами:
+        каждый идёт по своему составному индексу (..., created_at DESC, id DESC)
+        и читает не больше limit + 1 строк, вместо OR по всей истории.
+        """
+        after = None
+        if cursor:
+            position = decode_cursor(cursor)
+            try:
+                after = (datetime.fromisoformat(position["date"]), int(position["id"]))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Неверный курсор пагинации")
+
+        queries = []
+        for column, column_direction in ((Payment.user_id, "outgoing"), (Payment.to_user_id, "incoming")):
+            if direction and direction != column_direction:
+                continue
+            query = select(Payment).where(column == user_id)
+            if payment_types:
+                query = query.where(Payment.payment_type.in_(payment_types))
+            if after:
+                query = query.where(tuple_(Payment.created_at, Payment.id) < after)
+            queries.append(query.order_by(Payment.created_at.desc(), Payment.id.desc()).limit(limit + 1))
+        return queries
+
+    @staticmethod
+    def _merge_history(branches: List[List[Payment]], limit: int) -> Tuple[List[Payment], Optional[str]]:
+        """Слияние веток истории в одну страницу и курсор следующей"""
+        payments = sorted(
+            {payment.id: payment for branch in branches for payment in branch}.values(),
+            key=lambda payment: (payment.created_at, payment.id),
+            reverse=True
+        )
+        next_cursor = None
+        if len(payments) > limit:
+            payments = payments[:limit]
+            next_cursor = encode_cursor({"date": payments[-1].created_at.isoformat(), "id": payments[-1].id})
+        return payments, next_cursor
+
+    @staticmethod
+    def _type_counts_queries(user_id: int, direction: Optional[str]) -> list:
+        return [
+            select(Payment.payment_type, func.count()).where(column == user_id).group_by(Payment.payment_type)
+            for column, column_direction in ((Payment.user_id, "outgoing"), (Payment.to_user_id, "incoming"))
+            if not direction or direction == column_direction
+        ]
+
+    @staticmethod
+    def _merge_type_counts(branches: List[list]) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for rows in branches:
+            for payment_type, count in rows:
+                counts[payment_type.value] = counts.get(payment_type.value, 0) + count
+        return counts
+    
     @staticmethod
     def get_user_payments(
         db: Session,
         user_id: int,
         limit: int = 50,
-        offset: int = 0
-    ) -> List[Payment]:
-        """Получить историю платежей пользователя (исходящие и входящие)"""
-        from sqlalchemy import or_
-        # Получаем как исходящие (user_id), так и входящие (to_user_id) платежи
-        return db.query(Payment).filter(
-            or_(
-                Payment.user_id == user_id,  # Исходящие платежи
-                Payment.to_user_id == user_id  # Входящие платежи
-            )
-        ).order_by(Payment.created_at.desc()).offset(offset).limit(limit).all()
+        cursor: Optional[str] = None,
+        payment_types: Optional[List[PaymentType]] = None,
+        direction: Optional[str] = None
+    ) -> Tuple[List[Payment], Optional[str]]:
+        """
+        Страница истории платежей пользователя (исходящие и входящие), новые сверху.
+        direction - "outgoing" / "incoming" / None (все). Возвращает платежи и курсор следующей страницы.
+        """
+        queries = PaymentService._history_queries(user_id, limit, cursor, payment_types, direction)
+        return PaymentService._merge_history([list(db.scalars(query)) for query in queries], limit)
+    
+    @staticmethod
+    async def get_user_payments_async(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        payment_types: Optional[List[PaymentType]] = None,
+        direction: Optional[str] = None
+    ) -> Tuple[List[Payment], Optional[str]]:
+        """История платежей через асинхронную сессию - для горячего пути /payments/history"""
+        queries = PaymentService._history_queries(user_id, limit, cursor, payment_types, direction)
+        return PaymentService._merge_history([list(await db.scalars(query)) for query in queries], limit)
     
     @staticmethod
-    def create_premium_payment(
+    async def get_payment_type_counts_async(
+        db: AsyncSession,
+        user_id: int,
+        direction: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Количество платежей пользователя по типам (группировка по тем же индексам)"""
+        queries = PaymentService._type_counts_queries(user_id, direction)
+        return PaymentService._merge_type_counts([(await db.execute(query)).all() for query in queries])
+    
+    @staticmethod
+    async def create_premium_payment(
         db: Session,
         user_id: int,
         from_account_id: int,
@@ -534,20 +699,13 @@ class PaymentService:
         
         logger.info(f"✅ Счет найден: id={from_account.id}, account_id={from_account.account_id}, bank_id={from_account.bank_id}")
         
-        # ШАГ 2: Проверяем баланс счета
+        # ШАГ 2: Проверяем баланс счета (проверка средств - в журнале под блокировкой)
+        bank_balance = None
         try:
             from src.services.account_service import AccountService
-            import redis
-            
-            redis_client = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                decode_responses=True
-            )
             
-            account_service = AccountService(db, redis_client)
-            balance_data = account_service.get_account_balance(
+            account_service = AccountService(db, get_redis())
+            balance_data = await account_service.get_bank_balance(
                 user_id=user_id,
                 account_id=from_account.account_id,
                 bank_id=from_account.bank_id
@@ -556,12 +714,7 @@ class PaymentService:
             if not balance_data:
                 return None, "Не удалось получить баланс счета"
             
-            current_balance = balance_data.get("amount", 0)
-            
-            if current_balance < amount:
-                return None, f"Недостаточно средств на счете. Текущий баланс: {current_balance}₽, требуется: {amount}₽"
-            
-            logger.info(f"✅ Баланс проверен: {current_balance}₽ >= {amount}₽")
+            bank_balance = balance_data.get("amount", 0)
             
         except Exception as e:
             logger.error(f"Ошибка проверки баланса: {e}")
@@ -603,59 +756,18 @@ class PaymentService:
         
         db.add(payment)
         try:
+            ledger = LedgerService(db, get_redis())
+            error = ledger.post_payment(payment, from_account, bank_balance)
+            if error:
+                db.rollback()
+                return None, error
+            SpendingAggregateService(db).apply_payment(payment)
             db.commit()
+            ledger.publish()
             db.refresh(payment)
             logger.info(f"✅ Платеж Premium {payment.id} успешно создан: {amount}₽ от пользователя {user_id}")
             
-            # Обновляем кеш баланса счета (уменьшаем баланс на сумму платежа)
-            try:
-                import redis
-                import json
-                from src.config import settings
-                
-                redis_client = redis.Redis(
-                    host=settings.REDIS_HOST,
-                    port=settings.REDIS_PORT,
-                    db=settings.REDIS_DB,
-                    decode_responses=True
-                )
-                
-                balance_key = f"balance:{user_id}:{from_account.account_id}"
-                cached_balance = redis_client.get(balance_key)
-                
-                if cached_balance:
-                    balance_data = json.loads(cached_balance)
-                    current_balance = balance_data.get("amount", 0)
-                    new_balance = current_balance - amount
-                    balance_data["amount"] = max(0, new_balance)  # Не даем балансу уйти в минус
-                    
-                    redis_client.setex(
-                        balance_key,
-                        settings.BANK_DATA_CACHE_TTL,
-                        json.dumps(balance_data)
-                    )
-                    logger.info(f"✅ Обновлен баланс в кеше для Premium: {current_balance}₽ -> {balance_data['amount']}₽ (списано {amount}₽)")
-                else:
-                    logger.warning(f"⚠️  Баланс не найден в кеше для {balance_key}, создаем новый")
-                    # Создаем новый баланс в кеше
-                    balance_data = {
-                        "amount": max(0, -amount),  # Если баланс был 0, то после списания будет отрицательным, но мы ограничиваем до 0
-                        "currency": "RUB"
-                    }
-                    redis_client.setex(
-                        balance_key,
-                        settings.BANK_DATA_CACHE_TTL,
-                        json.dumps(balance_data)
-                    )
-                
-                # Инвалидируем кеш транзакций
-                transactions_key = f"transactions:{user_id}:{from_account.account_id}"
-                redis_client.delete(transactions_key)
-                logger.info(f"✅ Инвалидирован кеш транзакций для {from_account.account_id}")
-                
-            except Exception as cache_error:
-                logger.warning(f"⚠️  Не удалось обновить кеш баланса: {cache_error}")
-                # Не блокируем платеж из-за ошибки кеша
+            PaymentService._invalidate_account_data([f"transactions:{user_id}:{from_account.account_id}"])
             
         except Exception as e:
             db.rollback()
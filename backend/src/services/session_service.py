@@ -1,38 +1,198 @@
+import json
 import secrets
 import logging
-from typing import Optional
-import redis
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Tuple
+import redis.asyncio as aioredis
+from sqlalchemy import select
 
 from src.config import settings
+from src.constants.constants import AccountType
+from src.database import AsyncSessionLocal
+from src.models.user import User
+from src.redis_client import USERS_LAST_SEEN_KEY
 
 logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True)
+class SessionUser:
+    """
+    Снимок пользователя, которым авторизуются запросы без обращения к БД.
+    Поля совпадают с одноимёнными полями User; роуты, которые меняют пользователя,
+    получают полную строку через get_current_user_record.
+    """
+    id: int
+    name: str
+    email: str
+    birth_date: date
+    phone: Optional[str]
+    avatar_url: Optional[str]
+    account_type: AccountType
+    is_verified: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "SessionUser":
+        return cls(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            birth_date=user.birth_date,
+            phone=user.phone,
+            avatar_url=user.avatar_url,
+            account_type=user.account_type,
+            is_verified=user.is_verified
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "id": self.id,
+            "name": self.name,
+            "email": self.email,
+            "birthDate": self.birth_date.isoformat(),
+            "phone": self.phone,
+            "avatarUrl": self.avatar_url,
+            "accountType": self.account_type.value,
+            "isVerified": self.is_verified
+        })
+
+    @classmethod
+    def from_json(cls, raw: str) -> Optional["SessionUser"]:
+        try:
+            data = json.loads(raw)
+            return cls(
+                id=data["id"],
+                name=data["name"],
+                email=data["email"],
+                birth_date=date.fromisoformat(data["birthDate"]),
+                phone=data["phone"],
+                avatar_url=data["avatarUrl"],
+                account_type=AccountType(data["accountType"]),
+                is_verified=data["isVerified"]
+            )
+        except (ValueError, KeyError, TypeError):
+            return None
+
+# Локальный кеш процесса: session_id -> (момент истечения, снимок). Другие воркеры
+# узнают о выходе или изменении профиля не позже чем через SESSION_CACHE_TTL секунд
+_session_cache: "OrderedDict[str, Tuple[float, SessionUser]]" = OrderedDict()
+
+def _session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+def _session_user_key(user_id: int) -> str:
+    return f"session_user:{user_id}"
+
+def _session_user_gen_key(user_id: int) -> str:
+    return f"session_user_gen:{user_id}"
+
+# KEYS: снимок, поколение; ARGV: поколение на момент чтения из БД, ttl, снимок.
+# Снимок не записывается, если пользователя успели изменить (invalidate_user) после чтения
+SAVE_SNAPSHOT_SCRIPT = """
+if (redis.call("get", KEYS[2]) or "0") ~= ARGV[1] then
+    return 0
+end
+redis.call("setex", KEYS[1], ARGV[2], ARGV[3])
+return 1
+"""
+
 class SessionService:
 
     @staticmethod
-    def create_session(redis_client: redis.Redis, user_id: int) -> str:
+    async def create_session(redis_client: aioredis.Redis, user: User) -> str:
         session_id = secrets.token_urlsafe(32)
-        session_key = f"session:{session_id}"
 
         ttl = settings.SESSION_EXPIRE_HOURS * 3600
-        redis_client.setex(session_key, ttl, str(user_id))
+        pipe = redis_client.pipeline()
+        pipe.setex(_session_key(session_id), ttl, str(user.id))
+        pipe.setex(_session_user_key(user.id), ttl, SessionUser.from_user(user).to_json())
+        await pipe.execute()
 
-        logger.info(f"Создана сессия для пользователя {user_id}")
+        logger.info(f"Создана сессия для пользователя {user.id}")
         return session_id
 
     @staticmethod
-    def get_user_id(redis_client: redis.Redis, session_id: str) -> Optional[int]:
-        session_key = f"session:{session_id}"
-        user_id_str = redis_client.get(session_key)
+    async def get_user_id(redis_client: aioredis.Redis, session_id: str) -> Optional[int]:
+        user_id_str = await redis_client.get(_session_key(session_id))
 
         if user_id_str:
             return int(user_id_str)
         return None
 
     @staticmethod
-    def delete_session(redis_client: redis.Redis, session_id: str) -> bool:
-        session_key = f"session:{session_id}"
-        result = redis_client.delete(session_key)
+    async def get_session_user(redis_client: aioredis.Redis, session_id: str) -> Optional[SessionUser]:
+        """
+        Пользователь сессии: из локального кеша (без сети), иначе сессия и снимок
+        из Redis. БД читается, только если снимка нет (например, после изменения профиля).
+        """
+        cached = _session_cache.get(session_id)
+        if cached and cached[0] > time.monotonic():
+            _session_cache.move_to_end(session_id)
+            return cached[1]
+
+        user_id = await SessionService.get_user_id(redis_client, session_id)
+        if user_id is None:
+            _session_cache.pop(session_id, None)
+            return None
+
+        # Для фоновой синхронизации: кого прогревать в первую очередь (раз в SESSION_CACHE_TTL)
+        pipe = redis_client.pipeline()
+        pipe.get(_session_user_key(user_id))
+        pipe.get(_session_user_gen_key(user_id))
+        pipe.zadd(USERS_LAST_SEEN_KEY, {str(user_id): time.time()})
+        raw, generation, _ = await pipe.execute()
+
+        user = SessionUser.from_json(raw) if raw else None
+        if user is None:
+            record = await SessionService.load_user(user_id)
+            if record is None:
+                return None
+            user = SessionUser.from_user(record)
+            saved = await redis_client.eval(
+                SAVE_SNAPSHOT_SCRIPT,
+                2,
+                _session_user_key(user_id),
+                _session_user_gen_key(user_id),
+                generation or "0",
+                settings.SESSION_EXPIRE_HOURS * 3600,
+                user.to_json()
+            )
+            if not saved:
+                # Прочитанная строка могла устареть: отдаём её этому запросу, но не кешируем
+                return user
+
+        _session_cache[session_id] = (time.monotonic() + settings.SESSION_CACHE_TTL, user)
+        _session_cache.move_to_end(session_id)
+        while len(_session_cache) > settings.SESSION_CACHE_SIZE:
+            _session_cache.popitem(last=False)
+        return user
+
+    @staticmethod
+    async def load_user(user_id: int) -> Optional[User]:
+        """Строка пользователя из БД (короткая асинхронная сессия, объект отсоединён)"""
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+
+    @staticmethod
+    async def invalidate_user(redis_client: aioredis.Redis, user_id: int) -> None:
+        """
+        Сбросить снимок пользователя после изменения профиля или тарифа.
+        Поколение растёт, чтобы параллельная перезагрузка из БД не записала старый снимок.
+        """
+        for session_id in [key for key, (_, user) in _session_cache.items() if user.id == user_id]:
+            del _session_cache[session_id]
+        pipe = redis_client.pipeline()
+        pipe.incr(_session_user_gen_key(user_id))
+        pipe.expire(_session_user_gen_key(user_id), settings.SESSION_EXPIRE_HOURS * 3600)
+        pipe.delete(_session_user_key(user_id))
+        await pipe.execute()
+
+    @staticmethod
+    async def delete_session(redis_client: aioredis.Redis, session_id: str) -> bool:
+        _session_cache.pop(session_id, None)
+        result = await redis_client.delete(_session_key(session_id))
 
         if result:
             logger.info(f"Сессия удалена: {session_id[:10]}...")
@@ -0,0 +1,351 @@
+import logging
+import numpy as np
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.constants.constants import TransactionCategory
+from src.models.payment import Payment, PaymentType, PaymentStatus
+from src.models.spending_aggregate import MonthlySpendingAggregate
+from src.models.transaction import Transaction
+from src.utils.analytics_kernel import OTHER_CODE, TransactionColumns, category_codes
+
+logger = logging.getLogger(__name__)
+
+# bank_id агрегатов по внутренним платежам (Payment)
+INTERNAL_BANK_ID = 0
+
+PAYMENT_CATEGORIES = {
+    PaymentType.UTILITIES: TransactionCategory.UTILITIES,
+    PaymentType.ELECTRICITY: TransactionCategory.UTILITIES,
+    # Отдельной категории связи нет, связь относим к коммунальным услугам
+    PaymentType.MOBILE: TransactionCategory.UTILITIES,
+    PaymentType.PHONE: TransactionCategory.UTILITIES,
+    PaymentType.INTERNET: TransactionCategory.UTILITIES,
+    PaymentType.TV: TransactionCategory.ENTERTAINMENT,
+    PaymentType.TO_PERSON: TransactionCategory.TRANSFERS,
+    PaymentType.CARD_TO_CARD: TransactionCategory.TRANSFERS,
+}
+
+CategoryTotals = Dict[str, Dict[str, Any]]
+
+def payment_category(payment_type: PaymentType) -> TransactionCategory:
+    """Категория внутреннего платежа по его типу"""
+    return PAYMENT_CATEGORIES.get(payment_type, TransactionCategory.OTHER)
+
+def to_utc(value: datetime) -> datetime:
+    """Даты без часового пояса считаются UTC (как Payment.completed_at)"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def month_start(value: datetime) -> date:
+    return to_utc(value).date().replace(day=1)
+
+def next_month(month: date) -> date:
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+def _month_bounds(month: date) -> Tuple[datetime, datetime]:
+    return (
+        datetime.combine(month, time.min, tzinfo=timezone.utc),
+        datetime.combine(next_month(month), time.min, tzinfo=timezone.utc)
+    )
+
+def _add(totals: CategoryTotals, category: str, income=0, expenses=0, income_count=0, expense_count=0) -> None:
+    bucket = totals.setdefault(category, {"income": 0.0, "expenses": 0.0, "incomeCount": 0, "expenseCount": 0})
+    bucket["income"] += float(income or 0)
+    bucket["expenses"] += float(expenses or 0)
+    bucket["incomeCount"] += int(income_count or 0)
+    bucket["expenseCount"] += int(expense_count or 0)
+
+class SpendingAggregateService:
+    """
+    Месячные агрегаты доходов и расходов (user, month, category, bank).
+    Месяцы банка пересчитываются из таблицы transactions при каждой загрузке страницы транзакций
+    (в той же транзакции БД, что и upsert), внутренние платежи добавляются инкрементом при проведении.
+    Аналитика читает готовые суммы, поэтому её время не зависит от длины истории.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def rebuild_bank_months(self, user_id: int, bank_id: int, months: Iterable[date]) -> None:
+        """Пересчитать агрегаты банка за месяцы из transactions. Коммит - на вызывающем"""
+        for month in sorted(set(months)):
+            start, end = _month_bounds(month)
+            rows = self.db.query(
+                Transaction.category,
+                Transaction.direction,
+                func.sum(func.abs(Transaction.amount)),
+                func.count(Transaction.id)
+            ).filter(
+                Transaction.user_id == user_id,
+                Transaction.bank_id == bank_id,
+                Transaction.booking_date >= start,
+                Transaction.booking_date < end
+            ).group_by(Transaction.category, Transaction.direction).all()
+
+            totals: CategoryTotals = {}
+            for category, direction, amount, count in rows:
+                category = category or TransactionCategory.OTHER.value
+                if direction == "debit":
+                    _add(totals, category, expenses=amount, expense_count=count)
+                else:
+                    _add(totals, category, income=amount, income_count=count)
+
+            self.db.query(MonthlySpendingAggregate).filter(
+                MonthlySpendingAggregate.user_id == user_id,
+                MonthlySpendingAggregate.bank_id == bank_id,
+                MonthlySpendingAggregate.month == month
+            ).delete(synchronize_session=False)
+
+            self.db.add_all([
+                MonthlySpendingAggregate(
+                    user_id=user_id,
+                    month=month,
+                    category=category,
+                    bank_id=bank_id,
+                    income=Decimal(str(bucket["income"])),
+                    expenses=Decimal(str(bucket["expenses"])),
+                    income_count=bucket["incomeCount"],
+                    expense_count=bucket["expenseCount"]
+                )
+                for category, bucket in totals.items()
+            ])
+
+    def apply_payment(self, payment: Payment) -> None:
+        """Учесть проведённый платёж: расход отправителя и доход получателя. Коммит - на вызывающем"""
+        if payment.status != PaymentStatus.COMPLETED:
+            return
+
+        month = month_start(payment.completed_at or payment.created_at or datetime.utcnow())
+        category = payment_category(payment.payment_type).value
+        amount = Decimal(str(payment.amount))
+
+        self._increment(payment.user_id, month, category, expenses=amount, expense_count=1)
+        if payment.to_user_id and payment.to_user_id != payment.user_id:
+            self._increment(payment.to_user_id, month, category, income=amount, income_count=1)
+
+    def _increment(
+        self,
+        user_id: int,
+        month: date,
+        category: str,
+        income: Decimal = Decimal(0),
+        expenses: Decimal = Decimal(0),
+        income_count: int = 0,
+        expense_count: int = 0
+    ) -> None:
+        table = MonthlySpendingAggregate.__table__
+        stmt = insert(MonthlySpendingAggregate).values(
+            user_id=user_id,
+            month=month,
+            category=category,
+            bank_id=INTERNAL_BANK_ID,
+            income=income,
+            expenses=expenses,
+            income_count=income_count,
+            expense_count=expense_count
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_monthly_spending_bucket",
+            set_={
+                "income": table.c.income + stmt.excluded.income,
+                "expenses": table.c.expenses + stmt.excluded.expenses,
+                "income_count": table.c.income_count + stmt.excluded.income_count,
+                "expense_count": table.c.expense_count + stmt.excluded.expense_count,
+                "updated_at": func.now()
+            }
+        )
+        self.db.execute(stmt)
+
+    def rebuild_user(self, user_id: int) -> None:
+        """Полный пересчёт агрегатов пользователя (для данных, загруженных до появления агрегатов)"""
+        self.db.query(MonthlySpendingAggregate).filter(
+            MonthlySpendingAggregate.user_id == user_id
+        ).delete(synchronize_session=False)
+
+        ranges = self.db.query(
+            Transaction.bank_id,
+            func.min(Transaction.booking_date),
+            func.max(Transaction.booking_date)
+        ).filter(Transaction.user_id == user_id).group_by(Transaction.bank_id).all()
+
+        for bank_id, first, last in ranges:
+            months = []
+            month, last_month = month_start(first), month_start(last)
+            while month <= last_month:
+                months.append(month)
+                month = next_month(month)
+            self.rebuild_bank_months(user_id, bank_id, months)
+
+        payments = self.db.query(Payment).filter(
+            (Payment.user_id == user_id) | (Payment.to_user_id == user_id),
+            Payment.status == PaymentStatus.COMPLETED
+        ).all()
+        for payment in payments:
+            month = month_start(payment.completed_at or payment.created_at)
+            category = payment_category(payment.payment_type).value
+            amount = Decimal(str(payment.amount))
+            if payment.user_id == user_id:
+                self._increment(user_id, month, category, expenses=amount, expense_count=1)
+            else:
+                self._increment(user_id, month, category, income=amount, income_count=1)
+
+        self.db.commit()
+        logger.info(f"✅ Агрегаты расходов пользователя {user_id} пересчитаны")
+
+    def load_columns(
+        self,
+        user_id: int,
+        months: List[date],
+        bank_ids: Optional[List[int]] = None
+    ) -> TransactionColumns:
+        """
+        Агрегаты за месяцы как колоночный пакет: строка агрегата даёт запись расхода и запись дохода
+        с количеством операций в counts. Внутренние платежи учитываются при любом фильтре банков.
+        """
+        query = self.db.query(
+            MonthlySpendingAggregate.month,
+            MonthlySpendingAggregate.category,
+            MonthlySpendingAggregate.bank_id,
+            MonthlySpendingAggregate.income,
+            MonthlySpendingAggregate.expenses,
+            MonthlySpendingAggregate.income_count,
+            MonthlySpendingAggregate.expense_count
+        ).filter(
+            MonthlySpendingAggregate.user_id == user_id,
+            MonthlySpendingAggregate.month.in_(months)
+        )
+
+        if bank_ids:
+            query = query.filter(MonthlySpendingAggregate.bank_id.in_(list(bank_ids) + [INTERNAL_BANK_ID]))
+
+        rows = query.all()
+        if not rows:
+            return TransactionColumns.empty()
+
+        month_values, categories, banks, income, expenses, income_count, expense_count = zip(*rows)
+        days = np.array(month_values, dtype="datetime64[D]").astype(np.int32)
+        codes = category_codes(categories)
+        codes[codes < 0] = OTHER_CODE
+
+        return TransactionColumns(
+            amounts=np.concatenate([np.asarray(expenses, dtype=np.float64), np.asarray(income, dtype=np.float64)]),
+            days=np.tile(days, 2),
+            categories=np.tile(codes, 2),
+            banks=np.tile(np.asarray(banks, dtype=np.int16), 2),
+            debit=np.repeat([True, False], len(rows)),
+            counts=np.concatenate([np.asarray(expense_count, dtype=np.int64), np.asarray(income_count, dtype=np.int64)])
+        )
+
+    def get_category_totals(
+        self,
+        user_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> CategoryTotals:
+        """
+        Суммы по категориям за период. Целые месяцы берутся из агрегатов,
+        неполные месяцы на границах периода досчитываются по исходным строкам.
+        """
+        start = to_utc(start) if start else None
+        end = to_utc(end) if end else None
+
+        first_full = None
+        if start:
+            first_full = month_start(start)
+            if _month_bounds(first_full)[0] < start:
+                first_full = next_month(first_full)
+        end_full = month_start(end) if end else None
+
+        totals: CategoryTotals = {}
+
+        if first_full and end_full and first_full >= end_full:
+            self._add_raw_totals(totals, user_id, start, end)
+            return totals
+
+        query = self.db.query(
+            MonthlySpendingAggregate.category,
+            func.sum(MonthlySpendingAggregate.income),
+            func.sum(MonthlySpendingAggregate.expenses),
+            func.sum(MonthlySpendingAggregate.income_count),
+            func.sum(MonthlySpendingAggregate.expense_count)
+        ).filter(MonthlySpendingAggregate.user_id == user_id)
+
+        if first_full:
+            query = query.filter(MonthlySpendingAggregate.month >= first_full)
+        if end_full:
+            query = query.filter(MonthlySpendingAggregate.month < end_full)
+
+        for category, income, expenses, income_count, expense_count in query.group_by(MonthlySpendingAggregate.category):
+            _add(totals, category, income, expenses, income_count, expense_count)
+
+        if start and first_full:
+            self._add_raw_totals(totals, user_id, start, _month_bounds(first_full)[0], end_inclusive=False)
+        if end_full:
+            self._add_raw_totals(totals, user_id, _month_bounds(end_full)[0], end)
+
+        return totals
+
+    def _add_raw_totals(
+        self,
+        totals: CategoryTotals,
+        user_id: int,
+        start: datetime,
+        end: datetime,
+        end_inclusive: bool = True
+    ) -> None:
+        """Суммы по исходным транзакциям и платежам за период внутри одного-двух месяцев"""
+        if start > end or (start == end and not end_inclusive):
+            return
+
+        txn_end = Transaction.booking_date <= end if end_inclusive else Transaction.booking_date < end
+        rows = self.db.query(
+            Transaction.category,
+            Transaction.direction,
+            func.sum(func.abs(Transaction.amount)),
+            func.count(Transaction.id)
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.booking_date >= start,
+            txn_end
+        ).group_by(Transaction.category, Transaction.direction).all()
+
+        for category, direction, amount, count in rows:
+            category = category or TransactionCategory.OTHER.value
+            if direction == "debit":
+                _add(totals, category, expenses=amount, expense_count=count)
+            else:
+                _add(totals, category, income=amount, income_count=count)
+
+        # Payment.completed_at хранится в UTC без часового пояса
+        naive_start = start.replace(tzinfo=None)
+        naive_end = end.replace(tzinfo=None)
+        payment_end = Payment.completed_at <= naive_end if end_inclusive else Payment.completed_at < naive_end
+
+        for is_outgoing, owner_column in ((True, Payment.user_id), (False, Payment.to_user_id)):
+            query = self.db.query(
+                Payment.payment_type,
+                func.sum(Payment.amount),
+                func.count(Payment.id)
+            ).filter(
+                owner_column == user_id,
+                Payment.status == PaymentStatus.COMPLETED,
+                Payment.completed_at >= naive_start,
+                payment_end
+            )
+            if not is_outgoing:
+                query = query.filter(Payment.user_id != user_id)
+
+            for payment_type, amount, count in query.group_by(Payment.payment_type):
+                category = payment_category(payment_type).value
+                if is_outgoing:
+                    _add(totals, category, expenses=amount, expense_count=count)
+                else:
+                    _add(totals, category, income=amount, income_count=count)
@@ -8,7 +8,8 @@ import redis
 from src.models.bank_subscription import BankSubscription, SubscriptionStatus, ServiceType
 from src.models.account import BankAccount
 from src.models.user import User
-from src.services.bank_client import BankClient
+from src.redis_client import get_async_redis
+from src.services.bank_client import AsyncBankClient
 from src.services.account_service import AccountService
 
 logger = logging.getLogger(__name__)
@@ -17,10 +18,10 @@ class SubscriptionService:
     def __init__(self, db: Session, redis_client: redis.Redis):
         self.db = db
         self.redis_client = redis_client
-        self.bank_client = BankClient(redis_client)
+        self.bank_client = AsyncBankClient(get_async_redis())
         self.account_service = AccountService(db, redis_client)
 
-    def get_available_products(
+    async def get_available_products(
         self,
         user_id: int,
         bank_id: int,
@@ -28,13 +29,13 @@ class SubscriptionService:
     ) -> List[Dict]:
         """Получить каталог доступных продуктов банка"""
         try:
-            products = self.bank_client.get_products(user_id, bank_id, product_type)
+            products = await self.bank_client.get_products(user_id, bank_id, product_type)
             return products
         except Exception as e:
             logger.error(f"Ошибка получения продуктов: {e}")
             return []
 
-    def create_subscription(
+    async def create_subscription(
         self,
         user_id: int,
         bank_id: int,
@@ -87,22 +88,22 @@ class SubscriptionService:
             # В зависимости от типа услуги создаем соответствующие согласия и договоры
             if service_type == ServiceType.CARD_ISSUE:
                 # Выпуск карты
-                result = self._create_card_subscription(
+                result = await self._create_card_subscription(
                     user_id, bank_id, client_id, account_number, product_id, subscription
                 )
             elif service_type == ServiceType.ACCOUNT_OPEN:
                 # Открытие счета
-                result = self._create_account_subscription(
+                result = await self._create_account_subscription(
                     user_id, bank_id, client_id, product_id, subscription
                 )
             elif service_type == ServiceType.DEPOSIT:
                 # Открытие депозита
-                result = self._create_deposit_subscription(
+                result = await self._create_deposit_subscription(
                     user_id, bank_id, client_id, account_number, product_id, amount, term_months, subscription
                 )
             elif service_type == ServiceType.PREMIUM_SERVICE:
                 # Премиум услуга (например, ВТБ+)
-                result = self._create_premium_service_subscription(
+                result = await self._create_premium_service_subscription(
                     user_id, bank_id, client_id, account_number, product_id, subscription
                 )
             else:
@@ -125,7 +126,7 @@ class SubscriptionService:
             self.db.rollback()
             return None, f"Ошибка создания подписки: {str(e)}"
 
-    def _create_card_subscription(
+    async def _create_card_subscription(
         self,
         user_id: int,
         bank_id: int,
@@ -137,7 +138,7 @@ class SubscriptionService:
         """Создать подписку на выпуск карты"""
         try:
             # Создаем согласие на управление договорами
-            consent_result = self.bank_client.create_product_agreement_consent(
+            consent_result = await self.bank_client.create_product_agreement_consent(
                 user_id, bank_id, client_id,
                 read_product_agreements=True,
                 open_product_agreements=True,
@@ -146,7 +147,7 @@ class SubscriptionService:
             subscription.product_agreement_consent_id = consent_result["consent_id"]
 
             # Выпускаем карту
-            card_result = self.bank_client.create_card(
+            card_result = await self.bank_client.create_card(
                 user_id, bank_id, client_id,
                 account_number,
                 card_name="Visa Classic",
@@ -162,7 +163,7 @@ class SubscriptionService:
             logger.error(f"Ошибка создания подписки на карту: {e}")
             return None, str(e)
 
-    def _create_account_subscription(
+    async def _create_account_subscription(
         self,
         user_id: int,
         bank_id: int,
@@ -173,7 +174,7 @@ class SubscriptionService:
         """Создать подписку на открытие счета"""
         try:
             # Создаем согласие на управление договорами
-            consent_result = self.bank_client.create_product_agreement_consent(
+            consent_result = await self.bank_client.create_product_agreement_consent(
                 user_id, bank_id, client_id,
                 read_product_agreements=True,
                 open_product_agreements=True,
@@ -193,7 +194,7 @@ class SubscriptionService:
             logger.error(f"Ошибка создания подписки на счет: {e}")
             return None, str(e)
 
-    def _create_deposit_subscription(
+    async def _create_deposit_subscription(
         self,
         user_id: int,
         bank_id: int,
@@ -207,7 +208,7 @@ class SubscriptionService:
         """Создать подписку на открытие депозита"""
         try:
             # Создаем согласие на управление договорами
-            consent_result = self.bank_client.create_product_agreement_consent(
+            consent_result = await self.bank_client.create_product_agreement_consent(
                 user_id, bank_id, client_id,
                 read_product_agreements=True,
                 open_product_agreements=True,
@@ -217,7 +218,7 @@ class SubscriptionService:
             subscription.product_agreement_consent_id = consent_result["consent_id"]
 
             # Открываем депозит
-            agreement_result = self.bank_client.create_product_agreement(
+            agreement_result = await self.bank_client.create_product_agreement(
                 user_id, bank_id, client_id,
                 product_id, amount, term_months, account_number,
                 consent_result["consent_id"]
@@ -231,7 +232,7 @@ class SubscriptionService:
             logger.error(f"Ошибка создания подписки на депозит: {e}")
             return None, str(e)
 
-    def _create_premium_service_subscription(
+    async def _create_premium_service_subscription(
         self,
         user_id: int,
         bank_id: int,
@@ -244,7 +245,7 @@ class SubscriptionService:
         try:
             # Создаем VRP согласие для автоматических платежей
             valid_until = (datetime.utcnow() + timedelta(days=365)).isoformat()
-            vrp_result = self.bank_client.create_payment_consent_vrp(
+            vrp_result = await self.bank_client.create_payment_consent_vrp(
                 user_id, bank_id, client_id,
                 account_number,
                 vrp_max_individual_amount=1000.0,  # Макс сумма одного платежа
@@ -256,7 +257,7 @@ class SubscriptionService:
             subscription.payment_consent_id = vrp_result["consent_id"]
 
             # Создаем согласие на управление договорами
-            consent_result = self.bank_client.create_product_agreement_consent(
+            consent_result = await self.bank_client.create_product_agreement_consent(
                 user_id, bank_id, client_id,
                 read_product_agreements=True,
                 open_product_agreements=True,
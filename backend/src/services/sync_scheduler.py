@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import random
+import time
+import redis
+import redis.asyncio as aioredis
+from typing import List, Optional, Tuple
+
+from src.config import settings
+from src.database import SessionLocal
+from src.models.account import BankAccount
+from src.redis_client import USERS_LAST_SEEN_KEY, acquire_lock_async
+from src.services.account_service import AccountService
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LEADER_KEY = "sync_scheduler_leader"
+
+# Запросов в банк на одну синхронизацию счёта: баланс, транзакции, страница для БД
+REQUESTS_PER_ACCOUNT = 3
+
+AccountJob = Tuple[int, str, int]  # (user_id, account_id, bank_id)
+
+class SyncScheduler:
+    """
+    Фоновая синхронизация данных счетов, чтобы запросы пользователей попадали в тёплый кеш.
+    Каждые SYNC_SCHEDULER_INTERVAL секунд (с джиттером) берёт недавно активных пользователей,
+    начиная с последних заходивших, и обновляет их счета с учётом лимита запросов в банк.
+    Тик выполняет только один воркер: лидер определяется Redis-локом на время интервала.
+    Лок лидера, список активных пользователей и лимит запросов в банк - через async_redis;
+    redis_client (синхронный) передаётся в AccountService для кеша данных счетов.
+    """
+
+    def __init__(self, redis_client: redis.Redis, async_redis: aioredis.Redis):
+        self.redis_client = redis_client
+        self.async_redis = async_redis
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._task = asyncio.create_task(self.run())
+        logger.info("✅ Фоновая синхронизация счетов запущена")
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("👋 Фоновая синхронизация счетов остановлена")
+
+    async def run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Ошибка фоновой синхронизации: {e}")
+
+            jitter = settings.SYNC_SCHEDULER_JITTER
+            delay = settings.SYNC_SCHEDULER_INTERVAL * random.uniform(1 - jitter, 1 + jitter)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Один проход синхронизации. Возвращает количество обработанных счетов"""
+        # Лок не отпускаем: он истекает сам, так тик выполняется раз в интервал на все воркеры
+        leader = await acquire_lock_async(
+            self.async_redis,
+            SCHEDULER_LEADER_KEY,
+            settings.SYNC_SCHEDULER_INTERVAL * 1000
+        )
+        if not leader:
+            return 0
+
+        jobs = await self._collect_jobs()
+        if not jobs:
+            return 0
+
+        logger.info(f"🔄 Фоновая синхронизация {len(jobs)} счетов")
+
+        semaphore = asyncio.Semaphore(settings.SYNC_SCHEDULER_CONCURRENCY)
+        window = settings.SYNC_SCHEDULER_INTERVAL * settings.SYNC_SCHEDULER_JITTER
+        slot = window / len(jobs)
+
+        # Старт размазан по окну, но в порядке приоритета: чем раньше в списке, тем раньше старт
+        await asyncio.gather(*[
+            self._run_job(job, semaphore, rank * slot + random.uniform(0, slot))
+            for rank, job in enumerate(jobs)
+        ])
+        return len(jobs)
+
+    async def _active_user_ids(self) -> List[int]:
+        since = time.time() - settings.SYNC_SCHEDULER_ACTIVE_WINDOW
+        user_ids = await self.async_redis.zrevrangebyscore(
+            USERS_LAST_SEEN_KEY,
+            "+inf",
+            since,
+            start=0,
+            num=settings.SYNC_SCHEDULER_MAX_USERS
+        )
+        # Давно неактивных выкидываем, чтобы множество не росло бесконечно
+        await self.async_redis.zremrangebyscore(USERS_LAST_SEEN_KEY, "-inf", since)
+        return [int(user_id) for user_id in user_ids]
+
+    async def _collect_jobs(self) -> List[AccountJob]:
+        user_ids = await self._active_user_ids()
+        if not user_ids:
+            return []
+
+        db = SessionLocal()
+        try:
+            accounts = db.query(BankAccount).filter(
+                BankAccount.user_id.in_(user_ids),
+                BankAccount.is_active == True,
+                ~BankAccount.account_id.like("virtual-%")
+            ).all()
+        finally:
+            db.close()
+
+        priority = {user_id: rank for rank, user_id in enumerate(user_ids)}
+        accounts.sort(key=lambda acc: priority[acc.user_id])
+        return [(acc.user_id, acc.account_id, acc.bank_id) for acc in accounts]
+
+    async def _acquire_bank_slot(self, bank_id: int, weight: int) -> None:
+        """Лимит запросов в банк в секунду, общий для всех воркеров"""
+        while True:
+            second = int(time.time())
+            key = f"bank_rate:{bank_id}:{second}"
+
+            pipe = self.async_redis.pipeline()
+            pipe.incrby(key, weight)
+            pipe.expire(key, 2)
+            used, _ = await pipe.execute()
+
+            if used <= settings.SYNC_BANK_RATE_LIMIT:
+                return
+
+            await asyncio.sleep(second + 1 - time.time() + random.uniform(0, 0.2))
+
+    async def _run_job(self, job: AccountJob, semaphore: asyncio.Semaphore, delay: float) -> None:
+        user_id, account_id, bank_id = job
+        await asyncio.sleep(delay)
+
+        async with semaphore:
+            await self._acquire_bank_slot(bank_id, REQUESTS_PER_ACCOUNT)
+
+            db = SessionLocal()
+            try:
+                await AccountService(db, self.redis_client).refresh_account_data(
+                    user_id,
+                    account_id,
+                    bank_id,
+                    ahead=settings.SYNC_SCHEDULER_INTERVAL
+                )
+            except Exception as e:
+                logger.warning(f"⚠️  Фоновая синхронизация счёта {account_id} не удалась: {e}")
+            finally:
+                db.close()
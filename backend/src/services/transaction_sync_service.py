@@ -0,0 +1,275 @@
+import logging
+import redis
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+from typing import Any, Dict, List, Optional
+
+from src.config import settings
+from src.database import SessionLocal
+from src.models.transaction import Transaction, TransactionSyncState
+from src.redis_client import get_async_redis
+from src.services.bank_client import AsyncBankClient
+from src.services.categorization_service import CategorizationService
+from src.services.spending_aggregate_service import SpendingAggregateService, month_start
+from src.utils.analytics_kernel import CATEGORIES, categorize_columns
+from src.utils.fanout import FanOutErrors, fan_out
+from src.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Одна синхронизация счёта за раз внутри процесса
+_sync_flight = SingleFlight()
+
+def parse_booking_date(value: str) -> datetime:
+    booking_date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if booking_date.tzinfo is None:
+        booking_date = booking_date.replace(tzinfo=timezone.utc)
+    return booking_date
+
+class TransactionSyncService:
+    """
+    Инкрементальная загрузка транзакций из банков в таблицу transactions.
+    Для каждого счёта хранится водяной знак (booking_date самой новой транзакции),
+    из банка запрашиваются только более новые транзакции, постранично,
+    и сохраняются upsert'ом по transactionId. Если за запуск не удалось дойти
+    до водяного знака (лимит страниц), следующий запуск продолжает с той же страницы.
+    Вместе со страницей транзакций пересчитываются месячные агрегаты затронутых месяцев.
+    Каждый счёт синхронизируется в своей сессии БД: счета идут параллельно,
+    и ошибка одного счёта откатывает только его страницу.
+    """
+
+    def __init__(self, db: Session, redis_client: redis.Redis):
+        self.db = db
+        self.redis_client = redis_client
+        self.bank_client = AsyncBankClient(get_async_redis())
+
+    def _get_state(self, db: Session, user_id: int, bank_id: int, account_id: str) -> TransactionSyncState:
+        state = db.query(TransactionSyncState).filter(
+            TransactionSyncState.user_id == user_id,
+            TransactionSyncState.account_id == account_id
+        ).first()
+
+        if not state:
+            state = TransactionSyncState(user_id=user_id, bank_id=bank_id, account_id=account_id)
+            db.add(state)
+            db.commit()
+
+        return state
+
+    def _to_row(self, user_id: int, bank_id: int, account_id: str, txn: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not txn.get("id"):
+            return None
+
+        try:
+            booking_date = parse_booking_date(txn["date"])
+        except (KeyError, ValueError):
+            logger.warning(f"Ошибка парсинга даты транзакции {txn.get('id')}: {txn.get('date')}")
+            return None
+
+        description = txn.get("description") or ""
+        mcc_code = txn.get("mccCode") or None
+
+        return {
+            "user_id": user_id,
+            "bank_id": bank_id,
+            "account_id": account_id,
+            "transaction_id": txn["id"],
+            "booking_date": booking_date,
+            "description": description[:500],
+            "amount": Decimal(str(txn.get("amount", 0))),
+            "currency": txn.get("currency", "RUB"),
+            "direction": txn.get("type", "debit"),
+            "mcc_code": mcc_code
+        }
+
+    def _categorize(self, db: Session, user_id: int, rows: List[Dict[str, Any]]) -> None:
+        """Категории всей страницы транзакций с учётом правил пользователя"""
+        codes = categorize_columns(
+            [row["mcc_code"] for row in rows],
+            [row["description"] for row in rows],
+            CategorizationService(db).get_categorizer(user_id)
+        )
+        for row, code in zip(rows, codes):
+            row["category"] = CATEGORIES[code].value
+
+    def _upsert(self, db: Session, user_id: int, bank_id: int, rows: List[Dict[str, Any]]) -> None:
+        stmt = insert(Transaction).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_transactions_account_txn",
+            set_={
+                "booking_date": stmt.excluded.booking_date,
+                "description": stmt.excluded.description,
+                "amount": stmt.excluded.amount,
+                "currency": stmt.excluded.currency,
+                "direction": stmt.excluded.direction,
+                "mcc_code": stmt.excluded.mcc_code,
+                "category": stmt.excluded.category,
+                "updated_at": func.now()
+            }
+        )
+        db.execute(stmt)
+
+        SpendingAggregateService(db).rebuild_bank_months(
+            user_id,
+            bank_id,
+            {month_start(row["booking_date"]) for row in rows}
+        )
+        db.commit()
+
+    async def sync_account(self, user_id: int, bank_id: int, account_id: str) -> int:
+        """Догрузить новые транзакции счёта. Возвращает количество сохранённых транзакций"""
+        return await _sync_flight.do(
+            (user_id, account_id),
+            lambda: self._sync_account(user_id, bank_id, account_id)
+        )
+
+    async def _sync_account(self, user_id: int, bank_id: int, account_id: str) -> int:
+        db = SessionLocal()
+        try:
+            return await self._sync_account_in(db, user_id, bank_id, account_id)
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _sync_account_in(self, db: Session, user_id: int, bank_id: int, account_id: str) -> int:
+        state = self._get_state(db, user_id, bank_id, account_id)
+        now = datetime.now(timezone.utc)
+
+        if state.watermark:
+            # Небольшое перекрытие: банк может задним числом провести транзакции
+            from_date = state.watermark - timedelta(hours=settings.TRANSACTION_SYNC_OVERLAP_HOURS)
+        else:
+            from_date = now - timedelta(days=settings.TRANSACTION_SYNC_INITIAL_DAYS)
+
+        client_id = f"{settings.TEAM_CLIENT_ID}-{user_id}"
+        first_page = state.resume_page or 1
+        watermark = state.resume_watermark or state.watermark
+        saved = 0
+        complete = False
+
+        # Новые транзакции сдвигают страницы вниз: продолжение догрузки может
+        # повторно получить уже сохранённые строки (upsert), но не пропустит старые
+        for page in range(first_page, first_page + settings.TRANSACTION_SYNC_MAX_PAGES):
+            transactions, has_more = await self.bank_client.get_account_transactions_page(
+                user_id,
+                bank_id,
+                account_id,
+                client_id,
+                page=page,
+                limit=settings.TRANSACTION_SYNC_PAGE_SIZE,
+                from_date=from_date
+            )
+
+            # Банк может повторить транзакцию на странице; ON CONFLICT не примет
+            # две строки с одним ключом в одной вставке, поэтому остаётся последняя
+            rows = list({
+                row["transaction_id"]: row
+                for row in (self._to_row(user_id, bank_id, account_id, txn) for txn in transactions)
+                if row
+            }.values())
+            self._categorize(db, user_id, rows)
+            new_rows = [row for row in rows if row["booking_date"] >= from_date]
+
+            if new_rows:
+                self._upsert(db, user_id, bank_id, new_rows)
+                saved += len(new_rows)
+                newest = max(row["booking_date"] for row in new_rows)
+                if watermark is None or newest > watermark:
+                    watermark = newest
+
+            # Банк отдаёт от новых к старым: дошли до водяного знака - дальше уже загружено
+            if not has_more or len(new_rows) < len(rows):
+                complete = True
+                break
+
+        if complete:
+            state.watermark = watermark
+            state.resume_page = None
+            state.resume_watermark = None
+        else:
+            # Старые транзакции окна ещё не загружены: водяной знак не двигаем,
+            # следующий запуск продолжит со следующей страницы
+            state.resume_page = page + 1
+            state.resume_watermark = watermark
+            logger.warning(f"⚠️ Догрузка {account_id} упёрлась в лимит страниц, продолжится со страницы {page + 1}")
+        state.last_synced_at = now
+        db.commit()
+
+        logger.info(f"✅ Синхронизировано {saved} транзакций для {account_id}")
+        return saved
+
+    async def sync_accounts(
+        self,
+        user_id: int,
+        accounts: List[Dict[str, Any]],
+        max_age: Optional[int] = None
+    ) -> FanOutErrors:
+        """
+        Синхронизировать счета пользователя параллельно.
+        С max_age пропускаются счета, синхронизированные не раньше max_age секунд назад.
+        """
+        if max_age is not None:
+            accounts = self.stale_accounts(user_id, accounts, max_age)
+
+        _, errors = await fan_out(
+            accounts,
+            lambda account: self.sync_account(user_id, account["clientId"], account["accountId"])
+        )
+        return errors
+
+    def stale_accounts(
+        self,
+        user_id: int,
+        accounts: List[Dict[str, Any]],
+        max_age: int
+    ) -> List[Dict[str, Any]]:
+        """Счета, которые не синхронизировались последние max_age секунд"""
+        if not accounts:
+            return []
+
+        fresh_after = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+        fresh = {
+            state.account_id
+            for state in self.db.query(TransactionSyncState.account_id).filter(
+                TransactionSyncState.user_id == user_id,
+                TransactionSyncState.account_id.in_([acc["accountId"] for acc in accounts]),
+                TransactionSyncState.last_synced_at >= fresh_after
+            )
+        }
+        return [acc for acc in accounts if acc["accountId"] not in fresh]
+
+def spawn_sync_accounts(
+    redis_client: redis.Redis,
+    user_id: int,
+    accounts: List[Dict[str, Any]],
+    max_age: int
+) -> None:
+    """
+    Догрузить транзакции давно не синхронизированных счетов в фоне, не задерживая запрос.
+    Запрос отдаёт то, что уже есть в БД; новые транзакции появятся на следующем чтении.
+    """
+    if accounts:
+        _sync_flight.spawn(
+            ("stale", user_id),
+            lambda: _sync_stale_accounts(redis_client, user_id, accounts, max_age)
+        )
+
+async def _sync_stale_accounts(
+    redis_client: redis.Redis,
+    user_id: int,
+    accounts: List[Dict[str, Any]],
+    max_age: int
+) -> None:
+    with SessionLocal() as db:
+        service = TransactionSyncService(db, redis_client)
+        accounts = service.stale_accounts(user_id, accounts, max_age)
+
+    # Дальше БД нужна только сессиям отдельных счетов
+    errors = await service.sync_accounts(user_id, accounts)
+    for error in errors:
+        logger.warning(f"⚠️  Фоновая синхронизация счёта {error['accountId']} не удалась: {error['error']}")
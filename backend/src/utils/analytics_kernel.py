@@ -0,0 +1,181 @@
+"""
+Колоночное ядро аналитики.
+Транзакции загружаются в массивы NumPy (суммы, дни, категории, банки, направление),
+а разбивка по месяцам, суммы по категориям и top-N считаются векторно,
+без обхода словарей по одной транзакции.
+"""
+from datetime import date, datetime, timezone
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.constants.constants import TransactionCategory
+from src.utils.categorizer import Categorizer, default_categorizer
+
+CATEGORIES: List[TransactionCategory] = list(TransactionCategory)
+CATEGORY_CODES = {category.value: code for code, category in enumerate(CATEGORIES)}
+CATEGORY_COUNT = len(CATEGORIES)
+OTHER_CODE = CATEGORY_CODES[TransactionCategory.OTHER.value]
+
+def month_index(value: date) -> int:
+    """Номер месяца от 1970-01 (как datetime64[M])"""
+    return (value.year - 1970) * 12 + value.month - 1
+
+def _epoch_day(value: date) -> int:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        value = value.date()
+    return value.toordinal() - 719163  # date(1970, 1, 1).toordinal()
+
+def category_codes(categories: Sequence[Optional[str]]) -> np.ndarray:
+    """Коды категорий по их строковым значениям, -1 для пустых и неизвестных"""
+    if not len(categories):
+        return np.empty(0, dtype=np.int16)
+    values = np.asarray([category or "" for category in categories], dtype=str)
+    unique, inverse = np.unique(values, return_inverse=True)
+    lookup = np.array([CATEGORY_CODES.get(value, -1) for value in unique], dtype=np.int16)
+    return lookup[inverse.reshape(-1)]
+
+def categorize_columns(
+    mcc_codes: Sequence[Optional[str]],
+    descriptions: Sequence[Optional[str]],
+    categorizer: Optional[Categorizer] = None
+) -> np.ndarray:
+    """Коды категорий пакета транзакций. Повторяющиеся мерчанты отвечаются из LRU категоризатора"""
+    categorizer = categorizer or default_categorizer
+    codes = {}
+    for pair in zip(mcc_codes, descriptions):
+        if pair not in codes:
+            codes[pair] = CATEGORY_CODES[categorizer.categorize(*pair).value]
+    return np.fromiter(
+        (codes[pair] for pair in zip(mcc_codes, descriptions)),
+        dtype=np.int16,
+        count=len(mcc_codes)
+    )
+
+class TransactionColumns:
+    """
+    Пакет транзакций в колоночном виде. amounts - абсолютные суммы, counts - сколько
+    исходных операций за строкой (1 для транзакции, N для предпосчитанного агрегата).
+    """
+
+    def __init__(
+        self,
+        amounts: np.ndarray,
+        days: np.ndarray,
+        categories: np.ndarray,
+        banks: np.ndarray,
+        debit: np.ndarray,
+        counts: Optional[np.ndarray] = None,
+        ids: Optional[np.ndarray] = None,
+        descriptions: Optional[np.ndarray] = None
+    ):
+        self.amounts = amounts.astype(np.float64, copy=False)
+        self.days = days.astype(np.int32, copy=False)
+        self.categories = categories.astype(np.int16, copy=False)
+        self.banks = banks.astype(np.int16, copy=False)
+        self.debit = debit.astype(bool, copy=False)
+        self.counts = counts.astype(np.int64, copy=False) if counts is not None else np.ones(len(amounts), dtype=np.int64)
+        self.ids = ids
+        self.descriptions = descriptions
+        self.months = self.days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Tuple[Any, ...]]) -> "TransactionColumns":
+        """
+        Строки (id, booking_date, amount, direction, bank_id, category, mcc_code, description).
+        Строки без категории категоризируются векторно по MCC и описанию.
+        """
+        if not rows:
+            return cls.empty()
+
+        ids, dates, amounts, directions, banks, categories, mcc_codes, descriptions = zip(*rows)
+
+        codes = category_codes(categories)
+        uncategorized = np.flatnonzero(codes < 0)
+        if uncategorized.size:
+            codes[uncategorized] = categorize_columns(
+                [mcc_codes[i] for i in uncategorized],
+                [descriptions[i] for i in uncategorized]
+            )
+
+        return cls(
+            amounts=np.abs(np.asarray(amounts, dtype=np.float64)),
+            days=np.fromiter((_epoch_day(value) for value in dates), dtype=np.int32, count=len(dates)),
+            categories=codes,
+            banks=np.asarray(banks, dtype=np.int16),
+            debit=np.asarray(directions, dtype=str) == "debit",
+            ids=np.asarray(ids, dtype=object),
+            descriptions=np.asarray(descriptions, dtype=object)
+        )
+
+    @classmethod
+    def empty(cls) -> "TransactionColumns":
+        return cls(
+            amounts=np.empty(0),
+            days=np.empty(0, dtype=np.int32),
+            categories=np.empty(0, dtype=np.int16),
+            banks=np.empty(0, dtype=np.int16),
+            debit=np.empty(0, dtype=bool),
+            ids=np.empty(0, dtype=object),
+            descriptions=np.empty(0, dtype=object)
+        )
+
+    def in_months(self, first: int, last: int) -> np.ndarray:
+        """Маска строк в месяцах [first, last] (номера month_index)"""
+        return (self.months >= first) & (self.months <= last)
+
+def sum_by_category(columns: TransactionColumns, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Суммы и количества по кодам категорий (массивы длины CATEGORY_COUNT)"""
+    categories = columns.categories if mask is None else columns.categories[mask]
+    amounts = columns.amounts if mask is None else columns.amounts[mask]
+    counts = columns.counts if mask is None else columns.counts[mask]
+    return (
+        np.bincount(categories, weights=amounts, minlength=CATEGORY_COUNT),
+        np.bincount(categories, weights=counts, minlength=CATEGORY_COUNT).astype(np.int64)
+    )
+
+def sum_by_month_category(
+    columns: TransactionColumns,
+    months: Sequence[int],
+    mask: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Суммы и количества в разрезе (месяц, категория): матрицы len(months) x CATEGORY_COUNT"""
+    months = np.asarray(sorted(months), dtype=np.int32)
+    selected = columns.in_months(int(months[0]), int(months[-1])) if len(months) else np.zeros(len(columns), dtype=bool)
+    if mask is not None:
+        selected &= mask
+
+    row_months = columns.months[selected]
+    position = np.searchsorted(months, row_months)
+    known = months[np.minimum(position, len(months) - 1)] == row_months
+
+    flat = position[known] * CATEGORY_COUNT + columns.categories[selected][known]
+    size = len(months) * CATEGORY_COUNT
+    sums = np.bincount(flat, weights=columns.amounts[selected][known], minlength=size)
+    counts = np.bincount(flat, weights=columns.counts[selected][known], minlength=size)
+    return sums.reshape(len(months), CATEGORY_COUNT), counts.astype(np.int64).reshape(len(months), CATEGORY_COUNT)
+
+def top_n(values: np.ndarray, n: int) -> np.ndarray:
+    """Индексы n наибольших положительных значений по убыванию"""
+    candidates = np.flatnonzero(values > 0)
+    order = np.argsort(-values[candidates], kind="stable")
+    return candidates[order[:n]]
+
+def percent_change(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Изменение в процентах с округлением до 0.1, 0 при нулевой базе"""
+    current = np.asarray(current, dtype=np.float64)
+    previous = np.asarray(previous, dtype=np.float64)
+    safe = np.where(previous > 0, previous, 1.0)
+    return np.where(previous > 0, np.round((current - previous) / safe * 100, 1), 0.0)
+
+def shares(values: np.ndarray) -> np.ndarray:
+    """Доли в процентах от суммы с округлением до 0.1"""
+    total = values.sum()
+    if total <= 0:
+        return np.zeros_like(values, dtype=np.float64)
+    return np.round(values / total * 100, 1)
@@ -0,0 +1,106 @@
+"""
+Скомпилированный категоризатор транзакций.
+MCC (точные коды и диапазоны) компилируются в таблицу на все четырёхзначные коды,
+ключевые слова всех категорий - в одно регулярное выражение. Результат кешируется
+в LRU по нормализованной паре (MCC, описание), поэтому повторяющиеся мерчанты
+категоризируются без поиска по описанию.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.config import settings
+from src.constants.constants import TransactionCategory
+from src.constants.mcc_mapping import DESCRIPTION_KEYWORDS, MCC_RANGES, MCC_TO_CATEGORY
+
+_DIGIT_RUNS = re.compile(r"\d{3,}")
+_SPACES = re.compile(r"\s+")
+
+KeywordRules = Sequence[Tuple[TransactionCategory, Iterable[str]]]
+
+def normalize_mcc(mcc_code: Optional[str]) -> str:
+    mcc_code = (mcc_code or "").strip()
+    return mcc_code if len(mcc_code) == 4 and mcc_code.isdigit() else ""
+
+def normalize_description(description: Optional[str]) -> str:
+    """Нижний регистр, без номеров заказов/карт и лишних пробелов - ключ мерчанта для кеша"""
+    description = _DIGIT_RUNS.sub("#", (description or "").lower())
+    return _SPACES.sub(" ", description).strip()
+
+class Categorizer:
+    """
+    Категоризатор с опциональным базовым уровнем: сначала проверяются собственные правила
+    (MCC, затем ключевые слова), потом правила base. Так пользовательские правила
+    переопределяют общие.
+    """
+
+    def __init__(
+        self,
+        mcc_codes: Dict[str, TransactionCategory],
+        keyword_rules: KeywordRules,
+        mcc_ranges: Sequence[Tuple[int, int, TransactionCategory]] = (),
+        base: Optional["Categorizer"] = None,
+        cache_size: int = settings.CATEGORIZER_CACHE_SIZE
+    ):
+        self.base = base
+
+        self._mcc: List[Optional[TransactionCategory]] = [None] * 10000
+        for first, last, category in mcc_ranges:
+            for code in range(first, last + 1):
+                self._mcc[code] = category
+        for code, category in mcc_codes.items():
+            code = normalize_mcc(code)
+            if code:
+                self._mcc[int(code)] = category
+
+        # Одна группа на категорию в порядке приоритета. Совпадение ищется в lookahead на каждой
+        # позиции, поэтому находятся и пересекающиеся ключевые слова ("газ" внутри "магазин")
+        self._keyword_categories: List[TransactionCategory] = []
+        groups = []
+        for category, keywords in keyword_rules:
+            keywords = sorted({keyword.lower() for keyword in keywords if keyword}, key=len, reverse=True)
+            if keywords:
+                self._keyword_categories.append(category)
+                groups.append("(" + "|".join(re.escape(keyword) for keyword in keywords) + ")")
+        self._keywords = re.compile("(?=" + "|".join(groups) + ")") if groups else None
+
+        # Два уровня: по исходной паре (без нормализации на повторе) и по нормализованному мерчанту
+        self._cached = lru_cache(maxsize=cache_size)(self._resolve)
+        self.categorize = lru_cache(maxsize=cache_size)(self._categorize)
+
+    def _categorize(self, mcc_code: Optional[str], description: Optional[str] = "") -> TransactionCategory:
+        return self._cached(normalize_mcc(mcc_code), normalize_description(description))
+
+    def _match(self, mcc_code: str, description: str) -> Optional[TransactionCategory]:
+        if mcc_code:
+            category = self._mcc[int(mcc_code)]
+            if category is not None:
+                return category
+
+        if self._keywords is None or not description:
+            return None
+
+        best = None
+        for match in self._keywords.finditer(description):
+            if best is None or match.lastindex < best:
+                best = match.lastindex
+                if best == 1:
+                    break
+        return self._keyword_categories[best - 1] if best is not None else None
+
+    def _resolve(self, mcc_code: str, description: str) -> TransactionCategory:
+        category = self._match(mcc_code, description)
+        if category is not None:
+            return category
+        if self.base is not None:
+            return self.base._cached(mcc_code, description)
+        return TransactionCategory.OTHER
+
+    def cache_info(self):
+        return self.categorize.cache_info(), self._cached.cache_info()
+
+default_categorizer = Categorizer(
+    MCC_TO_CATEGORY,
+    list(DESCRIPTION_KEYWORDS.items()),
+    mcc_ranges=MCC_RANGES
+)
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+FanOutResults = List[Tuple[Dict[str, Any], Any]]
+FanOutErrors = List[Dict[str, Any]]
+
+def _account_error(account: Dict[str, Any], message: str) -> Dict[str, Any]:
+    return {
+        "accountId": account.get("accountId"),
+        "clientId": account.get("clientId"),
+        "error": message
+    }
+
+async def fan_out(
+    accounts: List[Dict[str, Any]],
+    fetch: Callable[[Dict[str, Any]], Awaitable[Any]],
+    per_bank_limit: Optional[int] = None,
+    deadline: Optional[float] = None
+) -> Tuple[FanOutResults, FanOutErrors]:
+    """
+    Параллельно выполнить fetch(account) для всех счетов.
+    Не больше per_bank_limit одновременных запросов в один банк,
+    всё, что не успело до deadline, отменяется и попадает в ошибки.
+    Порядок результатов совпадает с порядком accounts.
+    """
+    if not accounts:
+        return [], []
+
+    per_bank_limit = per_bank_limit or settings.BANK_FANOUT_PER_BANK_CONCURRENCY
+    deadline = deadline or settings.BANK_FANOUT_DEADLINE
+
+    semaphores: Dict[Any, asyncio.Semaphore] = {}
+
+    async def run(account: Dict[str, Any]) -> Any:
+        semaphore = semaphores.setdefault(account.get("clientId"), asyncio.Semaphore(per_bank_limit))
+        async with semaphore:
+            return await fetch(account)
+
+    tasks = [asyncio.create_task(run(account)) for account in accounts]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in pending:
+        task.cancel()
+
+    results: FanOutResults = []
+    errors: FanOutErrors = []
+
+    for account, task in zip(accounts, tasks):
+        if task in pending:
+            logger.warning(f"⏱️  Превышено время ожидания банка для {account.get('accountId')}")
+            errors.append(_account_error(account, "Превышено время ожидания ответа банка"))
+            continue
+
+        exc = task.exception()
+        if exc:
+            logger.warning(f"⚠️  Ошибка запроса для {account.get('accountId')}: {exc}")
+            errors.append(_account_error(account, str(exc)))
+            continue
+
+        results.append((account, task.result()))
+
+    return results, errors
@@ -0,0 +1,19 @@
+import base64
+import json
+from typing import Any, Dict
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Непрозрачный курсор keyset-пагинации"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Неверный курсор пагинации")
+
+    if not isinstance(values, dict):
+        raise ValueError("Неверный курсор пагинации")
+    return values
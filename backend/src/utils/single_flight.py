@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Дедупликация одновременных вызовов внутри процесса:
+    пока выполняется вызов с ключом key, остальные ждут его результат.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def _get_task(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return task
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception():
+            logger.debug(f"Single-flight {key} завершился ошибкой: {task.exception()}")
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(self._get_task(key, factory))
+
+    def spawn(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> None:
+        """Запустить вызов в фоне, если он ещё не выполняется"""
+        self._get_task(key, factory)
+
+    def is_running(self, key: Hashable) -> bool:
+        task = self._inflight.get(key)
+        return task is not None and not task.done()
@@ -0,0 +1,23 @@
+"""
+Отдельный процесс фоновой синхронизации счетов.
+Запуск: python sync_worker.py (в API при этом можно выставить SYNC_SCHEDULER_ENABLED=False)
+"""
+import asyncio
+import logging
+
+from src.http_client import bank_http_pool
+from src.redis_client import redis_client
+from src.services.sync_scheduler import SyncScheduler
+
+async def main():
+    print("🚀 Starting Bank Aggregator sync worker...")
+
+    await bank_http_pool.startup()
+    try:
+        await SyncScheduler(redis_client).run()
+    finally:
+        await bank_http_pool.shutdown()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())